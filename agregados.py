@@ -0,0 +1,421 @@
+import itertools
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import motor_consultas
+
+###########################################################
+# AGREGADOS DEL TABLERO (SIN STREAMLIT)
+###########################################################
+#
+# Cálculos de los indicadores que muestran las pestañas PTAR, PTCI y REPORTES, separados del HTML y de Streamlit para que
+# los use tanto la app (que los envuelve en st.cache_data y en el caché de vistas) como la API JSON (api_datos.py):
+#   - limpieza de cada hoja, normalización de nombres y emparejamiento difuso contra el catálogo del PEF,
+#   - acumulados del PTAR y resúmenes del PTCI/AMTRI para una selección (Institución o Sector, y Año),
+#   - conciliaciones PTAR vs ACTRI y PTCI vs AMTRI, con los casi duplicados detectados por descripción.
+
+RIESGOS = ['Sustantivo','Administrativo','Financiero','Presupuestal','Servicios', 'Seguridad','Obra_Pública','Recursos_Humanos','Imagen','TICs','Salud', 'Otro','Corrupción','Legal']
+CUADRANTES = ['I','II','III','IV']
+ESTRATEGIAS = ['Evitar','Reducir','Asumir','Transferir','Compartir']
+ESTADOS = ['Sin_Avances', 'En_Proceso', 'Concluidas', 'Cumplimiento']
+TRIMESTRES = ['1', '2', '3', '4']
+COLUMNAS_DETALLE_AMTRI = ["Registradas", "Localizadas", "No_localizadas", "Suficientes", "Parcielmente_Suficientes", "Insuficientes"]
+
+
+#============================================ LIMPIEZA DE CADA HOJA ============================================================
+def limpiar_hoja(df):
+    # No modifica la hoja recibida y solo reemplaza las columnas que cambian: una hoja ya limpia (el snapshot compartido que
+    # publica el refrescador) sale con las mismas columnas, sin copiarlas fuera del archivo mapeado
+    df = df.rename(columns=str.strip)                                              # Normaliza nombres de las columnas (copia superficial)
+    if 'Año' in df.columns:
+        encabezados = df['Año'] == 'Año'
+        if encabezados.any():
+            df = df[~encabezados]                                                  # Elimina filas duplicadas con encabezados
+        if not pd.api.types.is_numeric_dtype(df['Año']):
+            df['Año'] = pd.to_numeric(df['Año'], errors='coerce')                  # Normaliza 'Año' y lo convierte a número
+    for col in ['Institución', 'Sector']:                                          # Normaliza 'Institución' y 'Sector'
+        if col in df.columns:
+            limpia = df[col].astype(str).str.strip()
+            if not limpia.equals(df[col]):
+                df[col] = limpia
+    return df
+
+
+#============================================ FUNCIONES DE NORMALIZACIÓN DE TEXTO ============================================================
+# Se usan en las conciliaciones, el comparativo sectorial y las reglas de calidad de la app, y en la API
+def normalize_name(name):
+    return str(name).strip().lower()
+
+def normalize_text(text):
+    return unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('utf-8').strip().lower()
+
+def normalize_text_serie(serie):
+    # Misma normalización que normalize_text pero vectorizada sobre una columna completa
+    return serie.astype(str).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('utf-8').str.strip().str.lower()
+
+#================================== EMPAREJAMIENTO DIFUSO DE NOMBRES INSTITUCIONALES (SICOIN vs PEF) ==============================================
+# La columna COINCIDE de NOMBRES viene precalculada y las conciliaciones de REPORTES unían por igualdad exacta de normalize_text,
+# por lo que "Secretaría de Salud" y "Secretaria de Salud de Tamaulipas" no se conciliaban. Aquí cada nombre del SICOIN se compara
+# contra el catálogo del PEF con similitud de tokens ponderada por IDF (Dice); para no comparar todos contra todos, solo se
+# evalúan los nombres del PEF que comparten alguno de los tokens más raros del nombre (índice invertido de bloqueo).
+# La asignación es uno a uno (voraz, de la mayor similitud a la menor): si dos instituciones del SICOIN superan el umbral con
+# el mismo nombre del PEF, solo la más parecida lo usa como clave y la otra queda marcada como colisión para revisarla.
+PALABRAS_VACIAS = {"a", "de", "del", "e", "el", "en", "la", "las", "los", "para", "y"}
+TOKENS_BLOQUEO = 2              # Tokens más raros del nombre que se usan para buscar candidatos
+UMBRAL_COINCIDENCIA = 0.75      # Confianza mínima para usar el nombre del PEF como clave de conciliación
+
+def tokens_nombre(nombre):
+    return {t for t in re.findall(r"[a-z0-9]+", normalize_text(nombre)) if t not in PALABRAS_VACIAS}
+
+def emparejar_nombres_pef(nombres_sicoin, nombres_pef):
+    # Catálogo del PEF sin repetidos (llave: nombre normalizado)
+    catalogo = {}
+    for nombre in nombres_pef:
+        if str(nombre).strip():
+            catalogo.setdefault(normalize_text(nombre), str(nombre).strip())
+    pef_norm = list(catalogo)
+    pef_tokens = [tokens_nombre(n) for n in pef_norm]
+
+    # Índice invertido token -> posiciones en el catálogo y peso IDF de cada token
+    indice = {}
+    for pos, tokens in enumerate(pef_tokens):
+        for token in tokens:
+            indice.setdefault(token, []).append(pos)
+    idf = {token: np.log(1 + len(pef_tokens) / len(posiciones)) for token, posiciones in indice.items()}
+    idf_desconocido = np.log(1 + max(len(pef_tokens), 1))
+
+    def peso(tokens):
+        return sum(idf.get(t, idf_desconocido) for t in tokens)
+
+    # Candidatos de cada nombre del SICOIN (misma normalización = misma institución): posición en el catálogo -> similitud
+    candidatos, originales = {}, {}
+    for nombre in nombres_sicoin:
+        nombre_n = normalize_text(nombre)
+        if nombre_n in candidatos:
+            continue
+        originales[nombre_n] = nombre
+        if nombre_n in catalogo:
+            candidatos[nombre_n] = {pef_norm.index(nombre_n): 1.0}
+            continue
+        tokens = tokens_nombre(nombre)
+        bloqueo = sorted((t for t in tokens if t in indice), key=lambda t: -idf[t])[:TOKENS_BLOQUEO]
+        candidatos[nombre_n] = {pos: 2 * peso(tokens & pef_tokens[pos]) / (peso(tokens) + peso(pef_tokens[pos]))
+                                for pos in {pos for t in bloqueo for pos in indice[t]}}
+
+    # Asignación uno a uno: de la pareja más parecida a la menos, cada nombre del PEF se usa como clave de una sola
+    # institución del SICOIN; si no, dos instituciones distintas se fundirían en la misma fila de las conciliaciones
+    parejas = sorted(((similitud, nombre_n, pos) for nombre_n, opciones in candidatos.items() for pos, similitud in opciones.items()
+                      if similitud >= UMBRAL_COINCIDENCIA), key=lambda p: (-p[0], p[1], p[2]))
+    asignados, ocupados = {}, {}
+    for similitud, nombre_n, pos in parejas:
+        if nombre_n not in asignados and pos not in ocupados:
+            asignados[nombre_n], ocupados[pos] = (pos, similitud), nombre_n
+
+    filas = []
+    for nombre in nombres_sicoin:
+        nombre_n = normalize_text(nombre)
+        opciones = candidatos[nombre_n]
+        # Con empates gana la primera posición del catálogo (resultado estable entre ejecuciones)
+        mejor = max(sorted(opciones), key=opciones.get) if opciones else None
+        mejor, confianza = asignados.get(nombre_n, (mejor, opciones.get(mejor, 0.0)))
+        observacion = ""
+        if nombre_n not in asignados and confianza >= UMBRAL_COINCIDENCIA:
+            # Colisión: el nombre sugerido ya es la clave de otra institución más parecida; esta se concilia con su propio nombre
+            observacion = f"Colisión: el nombre del PEF ya se asignó a {originales[ocupados[mejor]]}"
+        filas.append({
+            "Nombre en SICOIN": nombre,
+            "Nombre Sugerido Según el PEF": catalogo[pef_norm[mejor]] if mejor is not None else "",
+            "Confianza": round(confianza, 2),
+            "Observación": observacion,
+            "Clave_Institución": pef_norm[mejor] if nombre_n in asignados else nombre_n
+        })
+    return pd.DataFrame(filas, columns=["Nombre en SICOIN", "Nombre Sugerido Según el PEF", "Confianza", "Observación", "Clave_Institución"])
+
+def clave_institucion(serie, emparejamiento):
+    # Clave de conciliación: nombre del PEF sugerido (si es confiable) o el nombre normalizado del SICOIN
+    mapa = dict(zip(emparejamiento["Nombre en SICOIN"], emparejamiento["Clave_Institución"]))
+    return serie.map(lambda nombre: mapa.get(nombre) or normalize_text(nombre))
+
+
+def nombres_para_emparejar(datos):
+    # Nombres de las cinco bases (ordenados, sin vacíos) y catálogo del PEF: los argumentos de emparejar_nombres_pef
+    nombres_sicoin = set()
+    for hoja in ("PTAR", "ACTRI", "PTCI", "AMTRI"):
+        nombres_sicoin.update(datos[hoja]["Institución"].unique())
+    nombres = datos["NOMBRES"]
+    if "NOMBRE_SICOIN" in nombres.columns:
+        nombres_sicoin.update(nombres["NOMBRE_SICOIN"].astype(str).str.strip())
+    nombres_pef = tuple(nombres["NOMBRE_PEF"]) if "NOMBRE_PEF" in nombres.columns else ()
+    return tuple(sorted(nombres_sicoin - {""})), nombres_pef
+
+def crear_motor(datos, emparejamiento, config=None):
+    # Motor de consultas del snapshot con la clave de conciliación (Institución_N) en cada hoja
+    hojas = {nombre: df.assign(Institución_N=clave_institucion(df["Institución"], emparejamiento)) if "Institución" in df.columns else df
+             for nombre, df in datos.items()}
+    return motor_consultas.crear_motor(hojas, config)
+
+#================================== DETECCIÓN DE ACCIONES CASI DUPLICADAS (SHINGLES + MINHASH + LSH) ==============================================
+# Las instituciones vuelven a registrar la misma acción con una Descripción ligeramente distinta y otra clave (AC/AM).
+# Comparar todas contra todas es O(n²); en su lugar cada descripción se resume en una firma MinHash y solo se comparan
+# las parejas que caen en la misma cubeta LSH dentro de la misma Institución/Año.
+MINHASH_PERMUTACIONES = 64      # Longitud de la firma MinHash
+LSH_BANDAS = 16                 # 16 bandas x 4 filas -> umbral efectivo cercano a 0.5 de similitud
+SHINGLE_K = 5                   # Tamaño de los shingles de caracteres
+UMBRAL_SIMILITUD = 0.8          # Similitud de Jaccard mínima para reportar la pareja
+_PRIMO_MINHASH = np.uint64(4294967311)
+
+def shingles_texto(texto, k=SHINGLE_K):
+    texto = " ".join(normalize_text(texto).split())
+    if len(texto) <= k:
+        return {texto} if texto else set()
+    return {texto[i:i + k] for i in range(len(texto) - k + 1)}
+
+def detectar_casi_duplicados(df, grupo_cols, clave_col, texto_col="Descripcion"):
+    columnas_salida = grupo_cols + ["Clave A", "Clave B", "Descripción A", "Descripción B", "Similitud"]
+    if df.empty or clave_col not in df.columns or texto_col not in df.columns:
+        return pd.DataFrame(columns=columnas_salida)
+
+    base = df[grupo_cols + [clave_col, texto_col]].reset_index(drop=True)
+    grupo_n = base[grupo_cols].copy()
+    grupo_n["Institución"] = grupo_n["Institución"].map(normalize_text)
+    grupo_id = grupo_n.groupby(grupo_cols, sort=False).ngroup().to_numpy()
+
+    # Paso 1: Shingles por descripción y firma MinHash (hash crc32 para que sea estable entre procesos)
+    conjuntos = [shingles_texto(t) for t in base[texto_col]]
+    rng = np.random.default_rng(2025)
+    a = rng.integers(1, 2**31, size=MINHASH_PERMUTACIONES, dtype=np.uint64)
+    b = rng.integers(0, 2**32, size=MINHASH_PERMUTACIONES, dtype=np.uint64)
+    firmas = np.full((len(base), MINHASH_PERMUTACIONES), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, conjunto in enumerate(conjuntos):
+        if conjunto:
+            h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in conjunto), dtype=np.uint64, count=len(conjunto))
+            firmas[i] = ((a[:, None] * h[None, :] + b[:, None]) % _PRIMO_MINHASH).min(axis=1)
+
+    # Paso 2: LSH - cada banda de la firma se resume en un hash; filas con la misma banda son candidatas
+    #         (las descripciones vacías no participan)
+    filas_por_banda = MINHASH_PERMUTACIONES // LSH_BANDAS
+    filas_con_texto = np.flatnonzero([bool(c) for c in conjuntos])
+    cubetas = []
+    for banda in range(LSH_BANDAS):
+        bloque = pd.DataFrame(firmas[filas_con_texto, banda * filas_por_banda:(banda + 1) * filas_por_banda])
+        cubetas.append(pd.DataFrame({"grupo": grupo_id[filas_con_texto], "banda": banda, "fila": filas_con_texto,
+                                     "cubeta": pd.util.hash_pandas_object(bloque, index=False).to_numpy()}))
+    cubetas = pd.concat(cubetas, ignore_index=True)
+    cubetas = cubetas[cubetas.duplicated(["grupo", "banda", "cubeta"], keep=False)]
+
+    candidatas = set()
+    for filas in cubetas.groupby(["grupo", "banda", "cubeta"])["fila"]:
+        candidatas.update(itertools.combinations(sorted(filas[1]), 2))
+
+    # Paso 3: Se verifica cada candidata con la similitud de Jaccard exacta; se omiten las de la misma clave (ya son duplicados exactos)
+    claves = base[clave_col].tolist()
+    candidatas = [(i, j) for i, j in sorted(candidatas) if claves[i] != claves[j]]
+    similitudes = [len(conjuntos[i] & conjuntos[j]) / len(conjuntos[i] | conjuntos[j]) for i, j in candidatas]
+    parejas = np.array([p for p, sim in zip(candidatas, similitudes) if sim >= UMBRAL_SIMILITUD], dtype=int).reshape(-1, 2)
+
+    resultado = base.loc[parejas[:, 0], grupo_cols].reset_index(drop=True)
+    resultado["Clave A"] = base[clave_col].to_numpy()[parejas[:, 0]]
+    resultado["Clave B"] = base[clave_col].to_numpy()[parejas[:, 1]]
+    resultado["Descripción A"] = base[texto_col].to_numpy()[parejas[:, 0]]
+    resultado["Descripción B"] = base[texto_col].to_numpy()[parejas[:, 1]]
+    resultado["Similitud"] = np.round([sim for sim in similitudes if sim >= UMBRAL_SIMILITUD], 2)
+    return resultado[columnas_salida]
+
+
+
+
+#============================================ PTAR: ACUMULADOS DE LA SELECCIÓN ============================================================
+def acumulados_ptar(filtered, sector):
+    # filtered: filas del PTAR de la selección (Sector y Año, o Institución y Año)
+    if sector != "Todas":                                                               # Caso 1: Sector != "Todas"
+        data = filtered.sum(numeric_only=True).to_dict()                                # Obtiene los acumulados de filtered (acumulados por que es un sector)
+        for t in TRIMESTRES:                                                            # En el Caso 1, el Cumplimiento por Sector se obtendrá en promedio
+            key = f"{t}Cumplimiento"
+            if key in filtered.columns:
+                avg_value = pd.to_numeric(filtered[key], errors='coerce').fillna(0).mean()  # Convierte a número, cambia NaN por 0 y obtiene el promedio
+                data[key] = round(avg_value, 2)                                             # Guarda los promedios de Cumplimiento con dos decimales
+    else:                                                                               # Caso 2: sector = "Todas" (un solo registro: Institución y Año)
+        data = filtered.iloc[0].to_dict()
+
+    # Se limpia el data obtenido - se cambian NaN por 0 y los conteos se redondean a enteros
+    for key in data:
+        if pd.isna(data[key]):
+            data[key] = 0
+        elif isinstance(data[key], (int, float)) and not str(key).endswith("Cumplimiento"):
+            data[key] = int(round(data[key]))
+    return data
+
+
+#============================================ PTCI Y AMTRI: RESÚMENES DE LA SELECCIÓN ============================================================
+def indicadores_ptci(df_ptci, sector):
+    # Total de Acciones de Mejora del programa actualizado y Cumplimiento General de las NGCI (promedio si es un sector)
+    if sector != "Todas":
+        cum_ngci = df_ptci['Cumplimiento_General_de_las_NGCI'].mean().round(2)
+        acciones_mejora_actualizadas = df_ptci['TotalAcciones_de_Mejora_Programa_Actualizado'].sum()
+    else:
+        cum_ngci = round(df_ptci['Cumplimiento_General_de_las_NGCI'].iloc[0], 2)
+        acciones_mejora_actualizadas = df_ptci['TotalAcciones_de_Mejora_Programa_Actualizado'].iloc[0]
+    return acciones_mejora_actualizadas, cum_ngci
+
+def programa_ptci(df_ptci, sector):
+    # Valores de la tabla del Programa de Trabajo (columna -> valor); con un sector solo el programa original y el actualizado
+    if sector == "Todas":
+        ptci_cols = [
+            "Acciones_de_Mejora_Programa_Original",
+            "Se_Actualizó_el_Programa",
+            "No_Se_Actualizó_el_Programa",
+            "TotalAcciones_de_Mejora_Programa_Actualizado"
+        ]
+    else:
+        ptci_cols = [
+            "Acciones_de_Mejora_Programa_Original",
+            "TotalAcciones_de_Mejora_Programa_Actualizado"
+        ]
+
+    programa = {}
+    for col in ptci_cols:
+        if sector == "Todas" and col in ["Se_Actualizó_el_Programa", "No_Se_Actualizó_el_Programa"]:
+            programa[col] = df_ptci[col].iloc[0] if not df_ptci.empty and col in df_ptci.columns else "N/A"
+        else:
+            numeric_value = pd.to_numeric(df_ptci[col], errors='coerce').fillna(0).sum() if col in df_ptci.columns else 0
+            programa[col] = int(round(numeric_value))
+    return programa
+
+def detalle_amtri(df_amtri):
+    # Sumas de las evidencias registradas, localizadas y su suficiencia (columna -> total)
+    detalle = {}
+    for col in COLUMNAS_DETALLE_AMTRI:
+        value = pd.to_numeric(df_amtri[col], errors='coerce').fillna(0).sum() if col in df_amtri.columns else 0
+        detalle[col] = int(round(value))
+    return detalle
+
+def seguimiento_mejora(df_ptci_filtrado, sector, selected_institucion_am):
+    # Acciones de mejora por Trimestre y Estado (el Cumplimiento de un sector completo es el promedio de sus instituciones)
+    data_ptci_dict = {}
+    for t in TRIMESTRES:
+        for estado in ESTADOS:
+            key = f"{t}{estado}"
+            if key in df_ptci_filtrado.columns:
+                # Manejar porcentaje de cumplimiento
+                if estado == "Cumplimiento":
+                    if sector != "Todas" and selected_institucion_am == "Todas":
+                        value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').mean()
+                    else:
+                        value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').sum()
+                else:
+                    value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').sum()
+            else:
+                value = 0
+            data_ptci_dict[key] = int(round(value))
+    return data_ptci_dict
+
+
+#============================================ REPORTES: CONCILIACIONES (PTAR vs ACTRI y PTCI vs AMTRI) ============================================================
+# Reciben el motor de consultas del snapshot, los casi duplicados de detectar_casi_duplicados y el emparejamiento contra el PEF
+def conciliacion_control(motor, casi_dup_actri, emparejamiento):
+    # Agrupaciones y cruce PTAR vs ACTRI con la consulta preparada del motor SQL (clave: nombre del PEF sugerido por el emparejamiento difuso)
+    # (AC_Total del PTAR, total de acciones, acciones únicas según clave AC y cantidad de duplicados por institución y año)
+    control_merge = motor_consultas.consultar(motor, "conciliacion_control")
+
+    # Casi duplicados en ACTRI (misma acción registrada con otra clave AC y descripción ligeramente distinta) por institución y año
+    casi_dup_summary = casi_dup_actri.assign(Institución_N=clave_institucion(casi_dup_actri["Institución"], emparejamiento)).groupby(
+        ["Institución_N", "Año"], as_index=False).size().rename(columns={"size": "Casi_Duplicados"})
+
+    # Merge de los casi duplicados con los datos de control
+    control_merge = pd.merge(control_merge, casi_dup_summary, on=["Institución_N", "Año"], how="left")
+
+    # Rellenar NaN y convertir a entero
+    control_merge["AC_Total"] = control_merge["AC_Total"].fillna(0).astype(int)
+    control_merge["Acciones_ACTRI"] = control_merge["Acciones_ACTRI"].fillna(0).astype(int)
+    control_merge["Acciones_ACTRI_Unique"] = control_merge["Acciones_ACTRI_Unique"].fillna(0).astype(int)
+    control_merge["Cantidad_Duplicados"] = control_merge["Cantidad_Duplicados"].fillna(0).astype(int)
+    control_merge["Casi_Duplicados"] = control_merge["Casi_Duplicados"].fillna(0).astype(int)
+
+    # Calcular la diferencia (usando el total vs. el conteo sin duplicados)
+    control_merge["Diferencia"] = control_merge["AC_Total"] - control_merge["Acciones_ACTRI"]
+    control_merge["Duplicado"] = control_merge["Cantidad_Duplicados"].apply(lambda x: "Sí" if x > 0 else "No")
+    control_merge["¿Coincide Eliminando Duplicados?"] = control_merge.apply(
+        lambda row: "✅" if row["AC_Total"] == row["Acciones_ACTRI_Unique"] else "❌",
+        axis=1
+    )
+
+    # El nombre original de la institución (primer valor por grupo en el PTAR) ya viene en la consulta
+
+    # Omitir la columna 'Institución_N'
+    if "Institución_N" in control_merge.columns:
+        control_merge.drop(columns=["Institución_N"], inplace=True)
+
+    # Renombrar columnas a etiquetas amigables
+    control_merge.rename(columns={
+        "AC_Total": "Acciones de Control en PTAR",
+        "Acciones_ACTRI": "Acciones de Control en SISTEMA",
+        "Duplicado": "¿El Sistema Contiene Duplicados?",
+        "Cantidad_Duplicados": "Cantidad de AC Duplicadas",
+        "Acciones_ACTRI_Unique": "Cantidad de AC Eliminando Duplicidad",
+        "Casi_Duplicados": "Posibles Duplicados por Descripción Similar"
+    }, inplace=True)
+
+    # Reordenar columnas según lo solicitado:
+    # (Año, Institución, Acciones de Control en PTAR, Acciones de Control en SISTEMA, Diferencia,
+    #  ¿El Sistema Contiene Duplicados?, Cantidad de AC Duplicadas, Cantidad de AC Eliminando Duplicidad,
+    #  ¿Coincide Eliminando Duplicados?)
+    control_merge = control_merge[[
+        "Año",
+        "Institución",
+        "Acciones de Control en PTAR",
+        "Acciones de Control en SISTEMA",
+        "Diferencia",
+        "¿El Sistema Contiene Duplicados?",
+        "Cantidad de AC Duplicadas",
+        "Cantidad de AC Eliminando Duplicidad",
+        "¿Coincide Eliminando Duplicados?",
+        "Posibles Duplicados por Descripción Similar"
+    ]]
+
+    # Ordenar para visualizar
+    control_merge.sort_values(["Año", "Institución"], inplace=True)
+    return control_merge
+
+def conciliacion_mejora(motor, casi_dup_amtri, emparejamiento):
+    # Cruce PTCI (primer valor de TotalAcciones_de_Mejora_Programa_Actualizado) vs AMTRI (conteo de registros del trimestre 4)
+    # con la consulta preparada del motor SQL (clave: emparejamiento difuso contra el PEF)
+    mejora_merge = motor_consultas.consultar(motor, "conciliacion_mejora")
+
+    # Casi duplicados en AMTRI del trimestre 4 por institución y año
+    casi_dup_amtri_t4 = casi_dup_amtri[casi_dup_amtri["Trimestre"] == 4]
+    casi_dup_amtri_summary = casi_dup_amtri_t4.assign(Institución_N=clave_institucion(casi_dup_amtri_t4["Institución"], emparejamiento)).groupby(
+        ["Institución_N", "Año"], as_index=False).size().rename(columns={"size": "Casi_Duplicados"})
+
+    # Rellenar NaN, calcular la diferencia y agregar los casi duplicados
+    mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"] = mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"].fillna(0).astype(int)
+    mejora_merge["Acciones_AMTRI"] = mejora_merge["Acciones_AMTRI"].fillna(0).astype(int)
+    mejora_merge["Diferencia"] = mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"] - mejora_merge["Acciones_AMTRI"]
+    mejora_merge = pd.merge(mejora_merge, casi_dup_amtri_summary, on=["Institución_N", "Año"], how="left")
+    mejora_merge["Casi_Duplicados"] = mejora_merge["Casi_Duplicados"].fillna(0).astype(int)
+
+    # El nombre original de la institución (desde el PTCI) ya viene en la consulta; se elimina la columna normalizada
+    if "Institución_N" in mejora_merge.columns:
+        mejora_merge.drop(columns=["Institución_N"], inplace=True)
+
+    # Renombrar columnas a etiquetas amigables
+    mejora_merge.rename(columns={
+        "TotalAcciones_de_Mejora_Programa_Actualizado": "Acciones de Mejora en PTCI",
+        "Acciones_AMTRI": "Acciones de Mejora en SISTEMA",
+        "Casi_Duplicados": "Posibles Duplicados por Descripción Similar"
+    }, inplace=True)
+
+    # Reordenar columnas: (Año, Institución, Acciones de Mejora en PTCI, Acciones de Mejora en SISTEMA, Diferencia)
+    mejora_merge = mejora_merge[[
+        "Año",
+        "Institución",
+        "Acciones de Mejora en PTCI",
+        "Acciones de Mejora en SISTEMA",
+        "Diferencia",
+        "Posibles Duplicados por Descripción Similar"
+    ]]
+    mejora_merge.sort_values(["Año", "Institución"], inplace=True)
+    return mejora_merge
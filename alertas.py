@@ -0,0 +1,223 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import pandas as pd
+
+import agregados
+import fuentes_datos
+import historial_datos
+import metricas
+
+###########################################################
+# ALERTAS INCREMENTALES DE DISCREPANCIAS EN CADA ACTUALIZACIÓN
+###########################################################
+#
+# Los avisos en rojo de las pestañas PTAR y PTCI ("... no coinciden ...") solo aparecen si alguien abre esa institución.
+# Después de cada recarga (la del refrescador o, sin snapshot compartido, la de la app) este módulo revisa todas las
+# instituciones y años y publica solo lo que cambió respecto a la recarga anterior:
+#
+#   Nueva      -> la institución y año no tenían discrepancia y ahora la tienen
+#   Resuelta   -> la discrepancia que se había publicado ya no existe
+#
+# Revisiones (las mismas que los avisos de las pestañas y las conciliaciones de REPORTES):
+#   PTAR vs ACTRI   AC_Total del PTAR contra las acciones de control registradas en ACTRI
+#   PTCI vs AMTRI   TotalAcciones_de_Mejora_Programa_Actualizado del PTCI contra las acciones de mejora de AMTRI al 4to trimestre
+#
+# Con el historial activo solo se recalculan las instituciones y años con filas agregadas, eliminadas o modificadas entre el
+# corte anterior y el nuevo (historial_datos.comparar_cortes, que cruza las firmas sin cargar las hojas completas); las demás
+# conservan el resultado anterior. Sin historial, o si el corte anterior ya se depuró, se revisa todo.
+#
+#   [alertas]
+#   ruta = "/srv/sicoin/alertas"  # o SICOIN_ALERTAS; por defecto la carpeta alertas/ junto a este archivo
+#   activo = true
+#   bandeja = 200                 # eventos más recientes que muestra la bandeja de REPORTES
+#
+#   alertas/
+#     estado.json                 -> discrepancias abiertas y corte con el que se calcularon
+#     alertas.jsonl               -> cola de eventos (una línea JSON por evento; otros sistemas la pueden seguir con tail -f)
+#
+#   python alertas.py revisar     -> descarga la fuente de [fuente_datos] y publica los cambios (p. ej. desde cron)
+#   python alertas.py abiertas    -> discrepancias abiertas
+
+ALERTAS_PREDETERMINADO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alertas")
+BANDEJA_PREDETERMINADA = 200
+CLAVES = ["Institución", "Año"]
+
+# Revisión -> (hoja del programa, columna con el total programado, hoja de registros, trimestre de los registros o None)
+REVISIONES = {
+    "PTAR vs ACTRI": ("PTAR", "AC_Total", "ACTRI", None),
+    "PTCI vs AMTRI": ("PTCI", "TotalAcciones_de_Mejora_Programa_Actualizado", "AMTRI", 4),
+}
+HOJAS_REVISADAS = ["PTAR", "ACTRI", "PTCI", "AMTRI"]
+COLUMNAS_EVENTO = ["Fecha", "Corte", "Evento", "Revisión", "Institución", "Año", "Programadas", "Registradas"]
+
+
+#============================================ CONFIGURACIÓN Y ARCHIVOS ============================================================
+def configuracion_alertas(secretos):
+    config = dict(secretos.get("alertas", {}))
+    if os.environ.get("SICOIN_ALERTAS"):
+        config["ruta"] = os.environ["SICOIN_ALERTAS"]
+    config.setdefault("ruta", ALERTAS_PREDETERMINADO)
+    config.setdefault("activo", True)
+    config.setdefault("bandeja", BANDEJA_PREDETERMINADA)
+    return config
+
+def ruta_archivo(config, nombre):
+    return os.path.join(config["ruta"], nombre)
+
+def candado(config):
+    # La app (uno o varios procesos) y el refrescador pueden revisar a la vez: el estado se lee y se escribe bajo el candado
+    return historial_datos.candado_archivo(ruta_archivo(config, "alertas.lock"))
+
+def leer_estado(config):
+    ruta = ruta_archivo(config, "estado.json")
+    if not os.path.exists(ruta):
+        return {"corte": None, "discrepancias": {}}
+    with open(ruta, encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+def escribir_estado(config, estado):
+    def escribir(temporal):
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(estado, archivo, ensure_ascii=False, indent=1)
+    historial_datos.escribir_atomico(ruta_archivo(config, "estado.json"), escribir)
+
+def publicar_eventos(config, eventos):
+    # Una sola escritura en modo "append" por revisión: los lectores nunca ven una línea a medias
+    if eventos:
+        with open(ruta_archivo(config, "alertas.jsonl"), "a", encoding="utf-8") as archivo:
+            archivo.write("".join(json.dumps(evento, ensure_ascii=False) + "\n" for evento in eventos))
+
+
+#============================================ DISCREPANCIAS POR INSTITUCIÓN Y AÑO ============================================================
+def claves_normalizadas(df):
+    # Institución y Año con la misma limpieza que la app (sin modificar la hoja recibida)
+    claves = df.rename(columns=str.strip).reindex(columns=CLAVES)
+    claves["Institución"] = claves["Institución"].astype(str).str.strip()
+    claves["Año"] = pd.to_numeric(claves["Año"], errors="coerce")
+    return claves
+
+def hojas_revisadas(datos):
+    return {hoja: agregados.limpiar_hoja(datos[hoja].copy(deep=False)) for hoja in HOJAS_REVISADAS}
+
+def identificador(revision, institucion, año):
+    return f"{revision}|{institucion}|{int(año)}"
+
+def discrepancias(limpios, claves=None):
+    # Discrepancias abiertas {identificador: detalle}; con claves (conjunto de (Institución, Año)) solo se revisan esas
+    encontradas = {}
+    for revision, (hoja_programa, columna, hoja_registros, trimestre) in REVISIONES.items():
+        programa, registros = limpios[hoja_programa], limpios[hoja_registros]
+        if columna not in programa.columns:
+            continue
+        if trimestre is not None:
+            registros = registros[pd.to_numeric(registros["Trimestre"], errors="coerce") == trimestre]
+        if claves is not None:
+            indice = pd.MultiIndex.from_tuples(list(claves), names=CLAVES) if claves else pd.MultiIndex.from_arrays([[], []], names=CLAVES)
+            programa = programa[pd.MultiIndex.from_frame(programa[CLAVES]).isin(indice)]
+            registros = registros[pd.MultiIndex.from_frame(registros[CLAVES]).isin(indice)]
+        # Como en las pestañas: el total del programa es el de la primera fila de la institución y año
+        programadas = pd.to_numeric(programa.groupby(CLAVES)[columna].first(), errors="coerce").fillna(0).astype(int)
+        registradas = registros.groupby(CLAVES).size().reindex(programadas.index, fill_value=0)
+        for (institucion, año), total in programadas[programadas != registradas].items():
+            encontradas[identificador(revision, institucion, año)] = {
+                "Revisión": revision, "Institución": institucion, "Año": int(año),
+                "Programadas": int(total), "Registradas": int(registradas[(institucion, año)])}
+    return encontradas
+
+def claves_cambiadas(config_historial, id_anterior, id_posterior, datos):
+    # Instituciones y años con alguna fila agregada, eliminada o modificada en las hojas revisadas entre los dos cortes.
+    # Las filas nuevas se toman de los datos recién descargados y las anteriores se leen del historial (solo esas filas)
+    cambios = historial_datos.comparar_cortes(config_historial, id_anterior, id_posterior)
+    anterior = historial_datos.buscar_corte(config_historial, id_anterior)
+    claves = set()
+    for hoja in HOJAS_REVISADAS:
+        tabla = cambios.get(hoja)
+        if tabla is None or tabla.empty:
+            continue
+        posteriores = tabla["fila_posterior"].dropna().astype("int64").to_numpy()
+        anteriores = tabla["fila_anterior"].dropna().astype("int64").to_numpy()
+        filas = [claves_normalizadas(datos[hoja].iloc[posteriores])]
+        if len(anteriores):
+            filas.append(claves_normalizadas(historial_datos.filas_version(config_historial, hoja, anterior["hojas"][hoja]["version"], anteriores)))
+        claves.update(pd.concat(filas).dropna().itertuples(index=False, name=None))
+    return claves
+
+def diferencias(abiertas_antes, abiertas, fecha, id_corte):
+    eventos = []
+    for evento, origen, otras in [("Nueva", abiertas, abiertas_antes), ("Resuelta", abiertas_antes, abiertas)]:
+        for clave in sorted(set(origen) - set(otras)):
+            eventos.append({"Fecha": fecha, "Corte": id_corte, "Evento": evento, **origen[clave]})
+    return eventos
+
+
+#============================================ REVISIÓN DESPUÉS DE CADA RECARGA ============================================================
+def revisar(datos, config, config_historial=None, id_corte=None):
+    # Devuelve los eventos publicados (nuevas y resueltas). id_corte es el corte del historial de estos datos (si lo hay)
+    with candado(config):
+        estado = leer_estado(config)
+        if id_corte is not None and estado["corte"] == id_corte:
+            return []                                   # Recarga sin cambios: el corte es el mismo que el ya revisado
+        limpios = hojas_revisadas(datos)
+        incremental = (id_corte is not None and estado["corte"] is not None and config_historial is not None
+                       and any(corte["id"] == estado["corte"] for corte in historial_datos.leer_manifiesto(config_historial)))
+        if incremental:
+            claves = claves_cambiadas(config_historial, estado["corte"], id_corte, datos)
+            abiertas = {clave: detalle for clave, detalle in estado["discrepancias"].items()
+                        if (detalle["Institución"], detalle["Año"]) not in claves}
+            abiertas.update(discrepancias(limpios, claves))
+        else:
+            abiertas = discrepancias(limpios)
+
+        fecha = datetime.datetime.now().isoformat(timespec="seconds")
+        eventos = diferencias(estado["discrepancias"], abiertas, fecha, id_corte)
+        publicar_eventos(config, eventos)
+        for evento in ("Nueva", "Resuelta"):
+            metricas.contar("sicoin_alertas_total", sum(e["Evento"] == evento for e in eventos), evento=evento.lower())
+        metricas.fijar("sicoin_alertas_abiertas", len(abiertas))
+        escribir_estado(config, {"corte": id_corte, "fecha": fecha, "revision": "incremental" if incremental else "completa",
+                                 "discrepancias": abiertas})
+    return eventos
+
+def leer_bandeja(config, limite=None):
+    # Eventos más recientes primero (la bandeja de REPORTES)
+    ruta = ruta_archivo(config, "alertas.jsonl")
+    if not os.path.exists(ruta):
+        return pd.DataFrame(columns=COLUMNAS_EVENTO)
+    with open(ruta, encoding="utf-8") as archivo:
+        lineas = archivo.readlines()
+    eventos = [json.loads(linea) for linea in lineas[-int(limite or config["bandeja"]):] if linea.strip()]
+    return pd.DataFrame(eventos[::-1], columns=COLUMNAS_EVENTO)
+
+def abiertas(config):
+    discrepancias_abiertas = leer_estado(config)["discrepancias"]
+    tabla = pd.DataFrame(list(discrepancias_abiertas.values()), columns=["Revisión", "Institución", "Año", "Programadas", "Registradas"])
+    return tabla.sort_values(["Revisión", "Año", "Institución"], ignore_index=True)
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Alertas de discrepancias PTAR vs ACTRI y PTCI vs AMTRI entre actualizaciones")
+    parser.add_argument("accion", choices=["revisar", "abiertas"])
+    args = parser.parse_args(argumentos)
+
+    secretos = fuentes_datos.leer_secretos()
+    config = configuracion_alertas(secretos)
+    if args.accion == "revisar":
+        config_fuente, credenciales = fuentes_datos.configuracion_fuente(secretos)
+        datos = fuentes_datos.cargar_datos(config_fuente, credenciales)
+        historial = historial_datos.configuracion_historial(secretos)
+        id_corte = historial_datos.registrar_corte(datos, historial, config_fuente["tipo"]) if historial["activo"] else None
+        for evento in revisar(datos, config, historial if historial["activo"] else None, id_corte):
+            print(f"{evento['Evento']:8} {evento['Revisión']}  {evento['Institución']} ({evento['Año']}): "
+                  f"{evento['Programadas']} programadas, {evento['Registradas']} registradas")
+    else:
+        print(abiertas(config).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import agregados
+import cache_vistas
+import fuentes_datos
+import motor_consultas
+
+###########################################################
+# API JSON DE SOLO LECTURA CON LOS AGREGADOS DEL TABLERO
+###########################################################
+#
+# Otros sistemas obtenían los indicadores raspando la interfaz de Streamlit. Esta API entrega los mismos agregados en JSON
+# (los de agregados.py, que también usa la app): los acumulados del PTAR, los resúmenes del PTCI/AMTRI y las conciliaciones
+# de REPORTES, por Institución o Sector y Año, sin construir HTML ni mantener una sesión de websocket.
+#
+#   [api]
+#   puerto = 8503                 # dentro de la app: 0 (predeterminado) la desactiva; SICOIN_API_PUERTO tiene prioridad
+#   host = "127.0.0.1"
+#   cada = 3600                   # solo en modo independiente: segundos entre recargas de la fuente
+#   limite_mb = 32                # respuestas guardadas (LRU por bytes, ver cache_vistas.py)
+#
+# Dentro de la app la API usa el snapshot que la app ya cargó y limpió (se publica en cada ejecución con publicar()).
+# En modo independiente carga la fuente de [fuente_datos] por su cuenta; con tipo = "compartido" mapea el mismo snapshot que
+# los procesos de la app y cambia de versión en cuanto refrescador.py publica una nueva:
+#
+#   python api_datos.py --puerto 8503
+#
+# Rutas (GET; la selección es sector=... o institucion=..., y año=... o anio=...):
+#   /api/v1/estado                          versión del snapshot y filas por hoja
+#   /api/v1/selecciones                     instituciones, sectores y años disponibles
+#   /api/v1/ptar?institucion=X&año=2025     acumulados del PTAR (riesgos, cuadrante, estrategia y estado por trimestre)
+#   /api/v1/ptci?sector=S&año=2025          indicadores, programa, detalle AMTRI y seguimiento (institucion_am=... opcional)
+#   /api/v1/conciliacion/control?año=2025   PTAR vs ACTRI (institucion=... opcional)
+#   /api/v1/conciliacion/mejora?año=2025    PTCI vs AMTRI al trimestre 4 (institucion=... opcional)
+#
+# Cada respuesta lleva un ETag formado por la versión del snapshot y la consulta: con If-None-Match igual se responde 304 sin
+# calcular nada. Los cuerpos se guardan ya serializados (y comprimidos con gzip para los clientes que lo aceptan).
+
+PUERTO_PREDETERMINADO = 8503
+HOST_PREDETERMINADO = "127.0.0.1"
+RECARGA_PREDETERMINADA = 3600
+REVISION_COMPARTIDO = 30          # Segundos entre revisiones del puntero ACTUAL del snapshot compartido
+LIMITE_CACHE_MB = 32
+MINIMO_GZIP = 512                 # Bytes: las respuestas más pequeñas no se comprimen
+PREFIJO = "/api/v1"
+
+
+class ErrorConsulta(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+#============================================ SNAPSHOT QUE SIRVE LA API ============================================================
+def crear_api(limite_mb=LIMITE_CACHE_MB):
+    return {"snapshot": None, "cache": cache_vistas.crear_cache(limite_mb), "candado": threading.Lock(), "servidor": None}
+
+def publicar(api, datos, motor, emparejamiento):
+    # La app lo llama en cada ejecución: solo cambia el snapshot cuando cambia la versión del motor (un motor por snapshot)
+    with api["candado"]:
+        if api["snapshot"] is not None and api["snapshot"]["version"] == motor["version"]:
+            return False
+        api["snapshot"] = {"version": motor["version"], "momento": time.time(), "datos": datos, "motor": motor,
+                           "emparejamiento": emparejamiento, "calculados": {}, "candado": threading.Lock()}
+    cache_vistas.vaciar(api["cache"])             # Las respuestas de la versión anterior ya no se pueden pedir
+    return True
+
+def cargar_snapshot(api, config, credenciales):
+    # Modo independiente: mismos pasos que la app (limpieza, emparejamiento contra el PEF y motor de consultas)
+    datos = {hoja: agregados.limpiar_hoja(df) for hoja, df in fuentes_datos.cargar_datos(config, credenciales).items()}
+    emparejamiento = agregados.emparejar_nombres_pef(*agregados.nombres_para_emparejar(datos))
+    publicar(api, datos, agregados.crear_motor(datos, emparejamiento, fuentes_datos.leer_secretos().get("motor_consultas")),
+             emparejamiento)
+
+def calculado(snapshot, nombre, calcular):
+    # Resultados por snapshot que comparten varias rutas (p. ej. los casi duplicados de las conciliaciones)
+    with snapshot["candado"]:
+        if nombre in snapshot["calculados"]:
+            return snapshot["calculados"][nombre]
+    valor = calcular()
+    with snapshot["candado"]:
+        return snapshot["calculados"].setdefault(nombre, valor)
+
+
+#============================================ CONVERSIÓN A JSON ============================================================
+def valor_json(valor):
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not np.isfinite(valor):
+        return None
+    if valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    return valor
+
+def registros(df):
+    return [{col: valor_json(valor) for col, valor in fila.items()} for fila in df.to_dict("records")]
+
+def serializar(objeto):
+    return json.dumps(objeto, ensure_ascii=False, default=valor_json, separators=(",", ":")).encode("utf-8")
+
+
+#============================================ RUTAS ============================================================
+def parametro(parametros, *nombres, obligatorio=False):
+    for nombre in nombres:
+        if parametros.get(nombre):
+            return parametros[nombre][0].strip()
+    if obligatorio:
+        raise ErrorConsulta(400, f"Falta el parámetro {nombres[0]}")
+    return None
+
+def año_consulta(parametros, obligatorio=True):
+    valor = parametro(parametros, "año", "anio", obligatorio=obligatorio)
+    if valor is None:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ErrorConsulta(400, f"Año inválido: {valor}")
+
+def seleccion_consulta(parametros):
+    # Igual que la cabecera de la app: con sector se consulta el sector completo; si no, una institución
+    sector = parametro(parametros, "sector") or "Todas"
+    institucion = parametro(parametros, "institucion", "institución")
+    if sector == "Todas" and not institucion:
+        raise ErrorConsulta(400, "Indique institucion=... o sector=...")
+    return institucion, sector, año_consulta(parametros)
+
+def descripcion_seleccion(institucion, sector, año):
+    return {"institucion": institucion if sector == "Todas" else None, "sector": None if sector == "Todas" else sector, "año": año}
+
+def ruta_estado(snapshot, parametros):
+    return {"version": snapshot["version"], "cargado": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(snapshot["momento"])),
+            "filas": {hoja: len(df) for hoja, df in snapshot["datos"].items()}}
+
+def ruta_selecciones(snapshot, parametros):
+    ptar = snapshot["datos"]["PTAR"]
+    años = lambda df: sorted(int(a) for a in df["Año"].dropna().unique())
+    return {"instituciones": {inst: años(df) for inst, df in ptar.groupby("Institución", sort=True)},
+            "sectores": {sec: años(df) for sec, df in ptar.groupby("Sector", sort=True)}}
+
+def ruta_ptar(snapshot, parametros):
+    institucion, sector, año = seleccion_consulta(parametros)
+    filtrado = snapshot["datos"]["PTAR"].iloc[motor_consultas.filas(snapshot["motor"], "PTAR", sector, institucion, año)]
+    if filtrado.empty:
+        raise ErrorConsulta(404, "No hay registros del PTAR para la selección")
+    data = agregados.acumulados_ptar(filtrado, sector)
+    return {
+        "seleccion": descripcion_seleccion(institucion, sector, año),
+        "instituciones": filtrado["Institución"].unique().tolist(),
+        "acciones_de_control": data.get("AC_Total", 0),
+        "riesgos": data.get("Riesgos_Totales", 0),
+        "clasificacion_riesgos": {col: data.get(col, 0) for col in agregados.RIESGOS},
+        "cuadrante": {col: data.get(col, 0) for col in agregados.CUADRANTES},
+        "estrategia": {col: data.get(col, 0) for col in agregados.ESTRATEGIAS},
+        "acciones_por_trimestre": {t: {estado: data.get(f"{t}{estado}", 0) for estado in agregados.ESTADOS} for t in agregados.TRIMESTRES},
+    }
+
+def ruta_ptci(snapshot, parametros):
+    institucion, sector, año = seleccion_consulta(parametros)
+    motor = snapshot["motor"]
+    df_ptci = snapshot["datos"]["PTCI"].iloc[motor_consultas.filas(motor, "PTCI", sector, institucion, año)]
+    df_amtri = snapshot["datos"]["AMTRI"].iloc[motor_consultas.filas(motor, "AMTRI", sector, institucion, año)]
+    if df_ptci.empty:
+        raise ErrorConsulta(404, "No hay registros del PTCI para la selección")
+    acciones_mejora, cumplimiento_ngci = agregados.indicadores_ptci(df_ptci, sector)
+
+    # Detalle y seguimiento: el sector completo o una de sus instituciones (filtro "Institución para Acciones de Mejora")
+    institucion_am = parametro(parametros, "institucion_am") if sector != "Todas" else None
+    if institucion_am:
+        df_ptci, df_amtri = df_ptci[df_ptci["Institución"] == institucion_am], df_amtri[df_amtri["Institución"] == institucion_am]
+    seguimiento = agregados.seguimiento_mejora(df_ptci, sector, institucion_am or "Todas")
+    return {
+        "seleccion": {**descripcion_seleccion(institucion, sector, año), "institucion_am": institucion_am},
+        "acciones_de_mejora": acciones_mejora,
+        "cumplimiento_ngci": cumplimiento_ngci,
+        "programa": agregados.programa_ptci(snapshot["datos"]["PTCI"].iloc[motor_consultas.filas(motor, "PTCI", sector, institucion, año)], sector),
+        "detalle_amtri": agregados.detalle_amtri(df_amtri),
+        "seguimiento": {t: {estado: seguimiento[f"{t}{estado}"] for estado in agregados.ESTADOS} for t in agregados.TRIMESTRES},
+    }
+
+def tabla_conciliacion(nombre, snapshot):
+    datos, emparejamiento, motor = snapshot["datos"], snapshot["emparejamiento"], snapshot["motor"]
+    if nombre == "control":
+        casi = calculado(snapshot, "casi_dup_actri", lambda: agregados.detectar_casi_duplicados(datos["ACTRI"], ["Institución", "Año"], "AC"))
+        return agregados.conciliacion_control(motor, casi, emparejamiento)
+    casi = calculado(snapshot, "casi_dup_amtri",
+                     lambda: agregados.detectar_casi_duplicados(datos["AMTRI"], ["Institución", "Año", "Trimestre"], "AM"))
+    return agregados.conciliacion_mejora(motor, casi, emparejamiento)
+
+def ruta_conciliacion(nombre):
+    def ruta(snapshot, parametros):
+        tabla = calculado(snapshot, f"conciliacion_{nombre}", lambda: tabla_conciliacion(nombre, snapshot))
+        año, institucion = año_consulta(parametros, obligatorio=False), parametro(parametros, "institucion", "institución")
+        if año is not None:
+            tabla = tabla[(tabla["Año"] == año).fillna(False)]
+        if institucion:
+            tabla = tabla[tabla["Institución"] == institucion]
+        return {"seleccion": {"institucion": institucion, "año": año}, "filas": registros(tabla)}
+    return ruta
+
+RUTAS = {
+    "/estado": ruta_estado,
+    "/selecciones": ruta_selecciones,
+    "/ptar": ruta_ptar,
+    "/ptci": ruta_ptci,
+    "/conciliacion/control": ruta_conciliacion("control"),
+    "/conciliacion/mejora": ruta_conciliacion("mejora"),
+}
+
+
+#============================================ RESPUESTAS (ETAG, CACHÉ Y GZIP) ============================================================
+def etiqueta(version, ruta, parametros):
+    consulta = "&".join(f"{nombre}={','.join(valores)}" for nombre, valores in sorted(parametros.items()))
+    return f'"{version}-{hashlib.sha1(f"{ruta}?{consulta}".encode("utf-8")).hexdigest()[:16]}"'
+
+def responder(api, ruta, parametros):
+    # Devuelve (estado HTTP, ETag o None, cuerpo, cuerpo comprimido o None); el cuerpo es el mismo para la misma versión y consulta
+    snapshot = api["snapshot"]
+    if snapshot is None:
+        return 503, None, serializar({"error": "Los datos aún no se han cargado"}), None
+    if ruta not in RUTAS:
+        return 404, None, serializar({"error": f"Ruta desconocida: {PREFIJO}{ruta}", "rutas": [PREFIJO + r for r in RUTAS]}), None
+    clave = (ruta, snapshot["version"], tuple(sorted((n, tuple(v)) for n, v in parametros.items())))
+
+    def construir():
+        try:
+            estado, cuerpo = 200, serializar(RUTAS[ruta](snapshot, parametros))
+        except ErrorConsulta as e:
+            estado, cuerpo = e.estado, serializar({"error": str(e)})
+        return estado, cuerpo, gzip.compress(cuerpo, 6) if len(cuerpo) >= MINIMO_GZIP else None
+
+    estado, cuerpo, comprimido = cache_vistas.obtener(api["cache"], clave, construir)
+    return estado, etiqueta(snapshot["version"], ruta, parametros) if estado == 200 else None, cuerpo, comprimido
+
+def crear_manejador(api):
+    class ManejadorAPI(BaseHTTPRequestHandler):
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            if not partes.path.startswith(PREFIJO):
+                self.enviar(404, serializar({"error": f"Las rutas empiezan con {PREFIJO}"}))
+                return
+            ruta = partes.path[len(PREFIJO):].rstrip("/") or "/estado"
+            parametros = parse_qs(partes.query)
+            snapshot = api["snapshot"]
+            # Revalidación sin calcular la respuesta: el ETag depende solo de la versión y la consulta
+            if snapshot is not None and ruta in RUTAS:
+                actual = etiqueta(snapshot["version"], ruta, parametros)
+                if actual in [e.strip() for e in self.headers.get("If-None-Match", "").split(",")]:
+                    self.enviar(304, b"", actual)
+                    return
+            try:
+                estado, etag, cuerpo, comprimido = responder(api, ruta, parametros)
+            except Exception as e:           # Un error inesperado no detiene el servidor
+                print(f"Error en {self.path}: {e}", file=sys.stderr, flush=True)
+                estado, etag, cuerpo, comprimido = 500, None, serializar({"error": "Error interno"}), None
+            if comprimido is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+                self.enviar(estado, comprimido, etag, gzip_=True)
+            else:
+                self.enviar(estado, cuerpo, etag)
+
+        def enviar(self, estado, cuerpo, etag=None, gzip_=False):
+            self.send_response(estado)
+            if estado != 304:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(cuerpo)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")          # Los clientes revalidan siempre con If-None-Match
+            if gzip_:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            if estado != 304:
+                self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *argumentos):
+            pass
+
+    return ManejadorAPI
+
+def iniciar_servidor(api, puerto=PUERTO_PREDETERMINADO, host=HOST_PREDETERMINADO):
+    # Devuelve la API con su servidor o None si el puerto está ocupado (p. ej. otro proceso de la app en la misma máquina)
+    try:
+        servidor = ThreadingHTTPServer((host, puerto), crear_manejador(api))
+    except OSError as e:
+        print(f"No se pudo exponer la API en {host}:{puerto}: {e}", file=sys.stderr, flush=True)
+        return None
+    servidor.daemon_threads = True
+    api["servidor"] = servidor
+    threading.Thread(target=servidor.serve_forever, name="servidor_api", daemon=True).start()
+    return api
+
+
+#============================================ MODO INDEPENDIENTE ============================================================
+def recargar_siempre(api, config, credenciales, cada):
+    # Con el snapshot compartido se revisa el puntero ACTUAL; con las demás fuentes se descarga cada "cada" segundos.
+    # Si una recarga falla se sigue sirviendo el snapshot anterior
+    compartido = config["tipo"] == "compartido"
+    version, ultima = None, time.time()
+    if compartido:
+        version = fuentes_datos.version_compartida(config)
+    while True:
+        time.sleep(REVISION_COMPARTIDO if compartido else cada)
+        try:
+            if compartido:
+                nueva = fuentes_datos.version_compartida(config)
+                if nueva == version and time.time() - ultima < cada:
+                    continue
+                version = nueva
+            cargar_snapshot(api, config, credenciales)
+            ultima = time.time()
+        except Exception as e:
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - error al recargar los datos de la API: {e}", file=sys.stderr, flush=True)
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="API JSON de solo lectura con los agregados del tablero del SICOIN")
+    parser.add_argument("--puerto", type=int, help=f"Puerto (por defecto [api].puerto o {PUERTO_PREDETERMINADO})")
+    parser.add_argument("--host", help=f"Dirección (por defecto [api].host o {HOST_PREDETERMINADO})")
+    args = parser.parse_args(argumentos)
+
+    secretos = fuentes_datos.leer_secretos()
+    config_api = secretos.get("api", {})
+    config, credenciales = fuentes_datos.configuracion_fuente(secretos)
+    api = crear_api(float(config_api.get("limite_mb", LIMITE_CACHE_MB)))
+    inicio = time.perf_counter()
+    cargar_snapshot(api, config, credenciales)
+    print(f"Datos cargados ({config['tipo']}) en {time.perf_counter() - inicio:.1f} s; versión {api['snapshot']['version']}", flush=True)
+
+    puerto = args.puerto or int(config_api.get("puerto", PUERTO_PREDETERMINADO))
+    host = args.host or config_api.get("host", HOST_PREDETERMINADO)
+    if iniciar_servidor(api, puerto, host) is None:
+        return 1
+    print(f"API en http://{host}:{puerto}{PREFIJO}/estado", flush=True)
+    recargar_siempre(api, config, credenciales, int(config_api.get("cada", RECARGA_PREDETERMINADA)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
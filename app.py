@@ -2,11 +2,25 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
-import unicodedata
-import gspread
+import bisect
+import os
+import re
+import sys
+import time
+import tomllib
+import agregados
+import alertas
+import api_datos
+import cache_vistas
+import fuentes_datos
+import historial_datos
+import memoria
+import metricas
+import motor_consultas
 
 #================================================== CONFIGURACIÓN INICIAL DE LA PÁGINA ======================================================================================
 st.set_page_config(page_title="Sistema Control Interno", layout="wide", page_icon="📊")
+inicio_ejecucion = time.perf_counter()          # Latencia de cada ejecución del script (metricas.py, al final del archivo)
 
 
 ###########################################################
@@ -19,51 +33,239 @@ st.set_page_config(page_title="Sistema Control Interno", layout="wide", page_ico
 
 
 
-#==================================== CARGA DE DATOS DESDE GOOGLE SHEETS CON CACHEO ============================================
-@st.cache_resource(ttl="1h", show_spinner="Descargando datos actualizados desde Sheets...")
-def descargar_y_cargar_datos():
-    # Conecta usando las credenciales de la sección correspondiente se cambia ttl de 1h a 5m
-    gc = gspread.service_account_from_dict(st.secrets['gcp_service_account'])
-
-    # Abre el libro de Sheets llamado "SICOIN_BASE"
-    sh = gc.open("SICOIN_BASE")
-
-    # Selecciona las hojas correspondientes
-    worksheet1 = sh.worksheet("PTAR")    # Hoja para PTAR
-    worksheet2 = sh.worksheet("ACTRI")   # Hoja para ACTRI
-    worksheet3 = sh.worksheet("PTCI")    # Hoja para PTCI
-    worksheet4 = sh.worksheet("AMTRI")   # Hoja para AMTRI
-    worksheet5 = sh.worksheet("NOMBRES")   # Hoja para AMTRI
-
-    # Obtén todos los registros y conviértelos a DataFrames
-    return {
-        "PTAR": pd.DataFrame(worksheet1.get_all_records()),
-        "ACTRI": pd.DataFrame(worksheet2.get_all_records()),
-        "PTCI": pd.DataFrame(worksheet3.get_all_records()),
-        "AMTRI": pd.DataFrame(worksheet4.get_all_records()),
-        "NOMBRES": pd.DataFrame(worksheet5.get_all_records())
-    }
+#==================================== CARGA DE DATOS DESDE LA FUENTE CONFIGURADA CON CACHEO ============================================
+# La fuente (Google Sheets, carpeta local de CSV/XLSX/Parquet o SQLite) se elige en la sección [fuente_datos] de los secrets
+# o con las variables SICOIN_FUENTE / SICOIN_RUTA (ver fuentes_datos.py); todas devuelven las mismas cinco hojas
+def leer_secretos_app():
+    try:
+        return st.secrets.to_dict()
+    except FileNotFoundError:       # Sin secrets.toml (ejecuciones locales con SICOIN_FUENTE)
+        return {}
+
+# Con tipo = "compartido" todos los procesos mapean el snapshot que publica refrescador.py: el argumento version_compartida
+# (leído del puntero ACTUAL en cada ejecución) hace que el proceso cambie a la nueva versión en cuanto se publica
+@st.cache_resource(ttl="1h", max_entries=2, show_spinner="Descargando datos actualizados desde la fuente de datos...")
+def descargar_y_cargar_datos(version_compartida=None):
+    # Conecta con la fuente configurada (por defecto el libro "SICOIN_BASE" de Sheets) se cambia ttl de 1h a 5m
+    config, credenciales = fuentes_datos.configuracion_fuente(leer_secretos_app())
+
+    # Obtén las hojas PTAR, ACTRI, PTCI, AMTRI y NOMBRES como DataFrames
+    metricas.contar("sicoin_cache_fallos_total", cache="carga")
+    inicio = time.perf_counter()
+    datos = fuentes_datos.cargar_datos(config, credenciales)
+    metricas.registrar_descarga(datos, time.perf_counter() - inicio)
+
+    # Cada recarga se guarda como un corte del historial (las hojas sin cambios reutilizan la partición anterior);
+    # con el snapshot compartido los cortes los guarda el refrescador
+    historial = configuracion_historial_app()
+    id_corte = None
+    if historial["activo"] and config["tipo"] != "compartido":
+        try:
+            id_corte = historial_datos.registrar_corte(datos, historial, config["tipo"])
+            listar_cortes.clear()
+        except OSError:
+            pass        # Sin permisos de escritura o sin espacio: la app sigue funcionando sin historial
+
+    # Discrepancias nuevas y resueltas respecto a la recarga anterior (bandeja de REPORTES); con el snapshot compartido las
+    # publica el refrescador
+    config_alertas = configuracion_alertas_app()
+    if config_alertas["activo"] and config["tipo"] != "compartido":
+        try:
+            alertas.revisar(datos, config_alertas, historial if id_corte else None, id_corte)
+        except OSError:
+            pass
+    estado = estado_descarga()
+    estado.update(datos=datos, momento=time.time(), fallo=None, error=None)
+    return datos
+
+#==================================== RESPALDO: ÚLTIMOS DATOS BUENOS SI LA DESCARGA FALLA ============================================
+# Si la descarga falla aun después de los reintentos (p. ej. cuota de Sheets agotada) la página no se detiene: se muestran los
+# últimos datos descargados por el proceso o, si el proceso acaba de iniciar, el corte más reciente del historial. Durante
+# ESPERA_TRAS_FALLO segundos no se vuelve a intentar la descarga, para no seguir consumiendo la cuota
+ESPERA_TRAS_FALLO = 300
+
+@st.cache_resource(show_spinner=False)
+def estado_descarga():
+    return {"datos": None, "momento": None, "fallo": None, "error": None}
+
+def datos_con_respaldo(version_compartida=None):
+    # Devuelve (datos, descripción del respaldo o None si son los datos recién descargados)
+    estado = estado_descarga()
+    if estado["fallo"] is None or time.time() - estado["fallo"] > ESPERA_TRAS_FALLO:
+        metricas.contar("sicoin_cache_consultas_total", cache="carga")
+        try:
+            return descargar_y_cargar_datos(version_compartida), None
+        except Exception as e:
+            metricas.contar("sicoin_descarga_fallos_total")
+            estado.update(fallo=time.time(), error=str(e))
+    if estado["datos"] is not None:
+        return estado["datos"], f"la última descarga correcta ({time.strftime('%d/%m/%Y %H:%M', time.localtime(estado['momento']))})"
+    cortes = listar_cortes()
+    if cortes:
+        id_corte = next(iter(cortes))
+        return cargar_corte_historial(id_corte), f"el corte del historial del {cortes[id_corte]}"
+    raise RuntimeError(estado["error"])
+
+#============================================ HISTORIAL DE CORTES (VER LOS DATOS A UNA FECHA ANTERIOR) ============================================================
+# Los cortes se guardan en la carpeta [historial] de los secrets o SICOIN_HISTORIAL (ver historial_datos.py)
+CORTE_ACTUAL = "Actual"
+
+def configuracion_historial_app():
+    return historial_datos.configuracion_historial(leer_secretos_app())
+
+@st.cache_data(ttl="5m", show_spinner=False)
+def listar_cortes():
+    # Identificador -> etiqueta con la fecha de cada corte, del más reciente al más antiguo
+    config = configuracion_historial_app()
+    if not config["activo"]:
+        return {}
+    return {corte["id"]: historial_datos.etiqueta_corte(corte) for corte in reversed(historial_datos.leer_manifiesto(config))}
+
+@st.cache_resource(max_entries=4, show_spinner="Cargando el corte seleccionado del historial...")
+def cargar_corte_historial(id_corte):
+    return historial_datos.cargar_corte(configuracion_historial_app(), id_corte)
+
+#============================================ ALERTAS DE DISCREPANCIAS (BANDEJA DE REPORTES) ============================================================
+# [alertas] en los secrets o SICOIN_ALERTAS; ver alertas.py
+def configuracion_alertas_app():
+    return alertas.configuracion_alertas(leer_secretos_app())
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def bandeja_alertas(marca):
+    # marca: fecha de modificación de la cola de eventos, para releerla solo cuando se publica algo nuevo
+    config = configuracion_alertas_app()
+    return alertas.leer_bandeja(config), alertas.abiertas(config)
+
+def marca_bandeja():
+    ruta = alertas.ruta_archivo(configuracion_alertas_app(), "estado.json")
+    return os.path.getmtime(ruta) if os.path.exists(ruta) else None
 
 #============================================ FUNCIÓN PARA LIMPIEZA DE DATOS ============================================================
 @st.cache_data(show_spinner=False)
-def limpiar_datos(df):
-    df.columns = df.columns.str.strip()                                          # Normaliza nombres de las columnas
-    if 'Año' in df.columns:
-        df = df[df['Año'] != 'Año']                                                # Elimina filas duplicadas con encabezados
-        df['Año'] = pd.to_numeric(df['Año'], errors='coerce')                      # Normaliza 'Año' y lo convierte a número
-    if 'Institución' in df.columns:
-        df['Institución'] = df['Institución'].astype(str).str.strip()              # Normaliza 'Institución'
-    if 'Sector' in df.columns:
-        df['Sector'] = df['Sector'].astype(str).str.strip()                        # Normaliza 'Sector'
+def limpiar_datos(df, deduplicar=False):
+    metricas.contar("sicoin_cache_fallos_total", cache="limpieza")
+    df = agregados.limpiar_hoja(df)                                              # Columnas, encabezados repetidos, Año, Institución y Sector
+    if deduplicar:
+        df = memoria.deduplicar_textos(df)                                         # Textos repetidos como categóricas (memoria.py)
     return df
 
+# Snapshot compartido: el refrescador ya publica las hojas limpias, así que limpiar_hoja no copia ninguna columna. Con
+# st.cache_resource (una entrada por versión y hoja, sin pickle) todas las sesiones del proceso usan el mismo DataFrame,
+# respaldado por el archivo mapeado; st.cache_data entregaría a cada ejecución su propia copia. No se deduplican los textos:
+# las categóricas serían una copia privada de cada proceso
+@st.cache_resource(max_entries=2 * len(fuentes_datos.HOJAS), show_spinner=False)
+def limpiar_compartido(version, nombre, _df):
+    metricas.contar("sicoin_cache_fallos_total", cache="limpieza")
+    return agregados.limpiar_hoja(_df)
+
+#============================================ NORMALIZACIÓN DE TEXTO Y EMPAREJAMIENTO DIFUSO CONTRA EL PEF (agregados.py) ============================================================
+# Las funciones están en agregados.py porque también las usa la API JSON (api_datos.py); aquí se cachea el emparejamiento.
+# La normalización se usa en las conciliaciones, el comparativo sectorial y las reglas de calidad
+normalize_name = agregados.normalize_name
+normalize_text = agregados.normalize_text
+normalize_text_serie = agregados.normalize_text_serie
+clave_institucion = agregados.clave_institucion
+UMBRAL_COINCIDENCIA = agregados.UMBRAL_COINCIDENCIA
+
+@st.cache_data(show_spinner=False)
+def emparejar_nombres_pef(nombres_sicoin, nombres_pef):
+    return agregados.emparejar_nombres_pef(nombres_sicoin, nombres_pef)
+
+#==================================== MOTOR DE CONSULTAS SQL EMBEBIDO (UNA VEZ POR SNAPSHOT) ============================================
+# DuckDB si está instalado (o SQLite de la biblioteca estándar); se elige con [motor_consultas] en los secrets o SICOIN_MOTOR
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cargar_motor_consultas(datos, emparejamiento):
+    return agregados.crear_motor(datos, emparejamiento, leer_secretos_app().get("motor_consultas"))
+
+#==================================== CACHÉ DE VISTAS RENDERIZADAS (COMPARTIDO ENTRE SESIONES) ============================================
+# Tablas HTML, indicadores y figuras por (vista, versión de los datos, selección) con desalojo LRU limitado en MB
+# ([cache_vistas] limite_mb en los secrets o SICOIN_CACHE_VISTAS_MB); ver cache_vistas.py
+@st.cache_resource(show_spinner=False)
+def cache_vistas_app():
+    limite_mb = os.environ.get("SICOIN_CACHE_VISTAS_MB") or leer_secretos_app().get("cache_vistas", {}).get("limite_mb", cache_vistas.LIMITE_PREDETERMINADO_MB)
+    return cache_vistas.crear_cache(float(limite_mb))
+
+def vista_en_cache(vista, *seleccion, construir):
+    # La versión del motor cambia con cada snapshot cargado, así que una recarga nunca reutiliza vistas de los datos anteriores
+    return cache_vistas.obtener(cache_vistas_app(), (vista, motor["version"]) + seleccion, construir)
+
+#==================================== CONTABILIDAD DE MEMORIA (DATAFRAMES, CACHÉS, SESIONES Y RSS) ============================================
+# Configuración en [memoria] de los secrets: deduplicar = true convierte los textos repetidos en categóricas (o SICOIN_DEDUPLICAR=1);
+# el panel "Ver Uso de Memoria del Proceso" de REPORTES muestra los tamaños; ver memoria.py
+def configuracion_memoria():
+    config = leer_secretos_app().get("memoria", {})
+    deduplicar = os.environ.get("SICOIN_DEDUPLICAR", str(config.get("deduplicar", False))).lower() in ("1", "true", "si", "sí")
+    return deduplicar, int(config.get("muestreo_segundos", memoria.MUESTREO_SEGUNDOS))
+
+@st.cache_resource(show_spinner=False)
+def monitor_memoria():
+    return memoria.crear_monitor(configuracion_memoria()[1])
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def ahorro_deduplicacion_app(version):
+    # Una vez por snapshot (la versión del motor identifica los datos cargados)
+    metricas.contar("sicoin_cache_consultas_total", len(datos_crudos), cache="limpieza")
+    return memoria.ahorro_deduplicacion({nombre: limpiar_datos(df, False) for nombre, df in datos_crudos.items()})
+
+#==================================== MÉTRICAS DE PROMETHEUS EN UN PUERTO LATERAL ============================================
+# [metricas] puerto = 9464 y host = "127.0.0.1" en los secrets (SICOIN_METRICAS_PUERTO; 0 lo desactiva); ver metricas.py
+@st.cache_resource(show_spinner=False)
+def servidor_metricas():
+    config = leer_secretos_app().get("metricas", {})
+    puerto = int(os.environ.get("SICOIN_METRICAS_PUERTO", config.get("puerto", metricas.PUERTO_PREDETERMINADO)))
+    if puerto == 0:
+        return None
+    # Los medidores corren en el hilo del servidor, por eso reciben los recursos ya creados y no llaman a st.cache_resource
+    estado, cache = estado_descarga(), cache_vistas_app()
+
+    def medir_app():
+        if estado["momento"] is not None:
+            metricas.fijar("sicoin_datos_edad_segundos", round(time.time() - estado["momento"], 1))
+        sesiones = memoria.sesiones_activas()
+        if sesiones is not None:                # Sin dato no se publica la serie (en lugar de un 0 falso)
+            metricas.fijar("sicoin_sesiones_activas", sesiones)
+        metricas.fijar("sicoin_cache_consultas_total", cache["aciertos"] + cache["fallos"], cache="vistas")
+        metricas.fijar("sicoin_cache_fallos_total", cache["fallos"], cache="vistas")
+        metricas.medir_limitador_sheets()
+
+    metricas.registrar_medidor(medir_app)
+    return metricas.iniciar_servidor(puerto, config.get("host", metricas.HOST_PREDETERMINADO))
+
+#==================================== API JSON DE SOLO LECTURA EN UN PUERTO LATERAL ============================================
+# [api] puerto = 8503 y host = "127.0.0.1" en los secrets (SICOIN_API_PUERTO; 0, el valor predeterminado, la desactiva).
+# Sirve los agregados del snapshot actual que publica cada ejecución (ver api_datos.py)
+@st.cache_resource(show_spinner=False)
+def servidor_api():
+    config = leer_secretos_app().get("api", {})
+    puerto = int(os.environ.get("SICOIN_API_PUERTO", config.get("puerto", 0)))
+    if puerto == 0:
+        return None
+    api = api_datos.crear_api(float(config.get("limite_mb", api_datos.LIMITE_CACHE_MB)))
+    return api_datos.iniciar_servidor(api, puerto, config.get("host", api_datos.HOST_PREDETERMINADO))
+
 #================================================== CARGA PRINCIPAL DE LOS DATOS EN LA APP ============================================================
 try:
+    servidor_metricas()                                        # Inicia (una sola vez por proceso) el servidor de métricas
     # Paso 1: Descarga y carga de datos (solo en primer uso)
-    datos_crudos = descargar_y_cargar_datos()  # Se leen los registros desde Sheets
+    config_fuente, _ = fuentes_datos.configuracion_fuente(leer_secretos_app())
+    version_compartida = fuentes_datos.version_compartida(config_fuente) if config_fuente["tipo"] == "compartido" else None
+    datos_crudos, respaldo = datos_con_respaldo(version_compartida)  # Se leen los registros desde Sheets (o del snapshot compartido)
+
+    # Si en la cabecera se eligió un corte del historial, la app completa se calcula con ese corte
+    corte_historial = st.session_state.get("corte_historial", CORTE_ACTUAL)
+    if corte_historial != CORTE_ACTUAL and corte_historial not in listar_cortes():
+        corte_historial = st.session_state["corte_historial"] = CORTE_ACTUAL      # El corte ya se depuró del historial
+    if corte_historial != CORTE_ACTUAL:
+        datos_crudos = cargar_corte_historial(corte_historial)
 
     # Paso 2: Limpieza de datos
-    datos_limpios = {nombre: limpiar_datos(df) for nombre, df in datos_crudos.items()}
+    deduplicar_textos, _ = configuracion_memoria()
+    metricas.contar("sicoin_cache_consultas_total", len(datos_crudos), cache="limpieza")
+    if version_compartida is not None and respaldo is None and corte_historial == CORTE_ACTUAL:
+        datos_limpios = {nombre: limpiar_compartido(version_compartida, nombre, df) for nombre, df in datos_crudos.items()}
+    else:
+        datos_limpios = {nombre: limpiar_datos(df, deduplicar_textos) for nombre, df in datos_crudos.items()}
+    monitor_memoria()                                          # Inicia (una sola vez por proceso) el muestreo del RSS
 
     # Asignación a variables
     df1 = datos_limpios["PTAR"]
@@ -72,6 +274,17 @@ try:
     df4 = datos_limpios["AMTRI"]
     df5 = datos_limpios["NOMBRES"]
 
+    # Paso 3: Emparejamiento difuso de los nombres de las cinco bases contra el catálogo del PEF (clave de conciliación)
+    emparejamiento = emparejar_nombres_pef(*agregados.nombres_para_emparejar(datos_limpios))
+
+    # Paso 4: Motor de consultas SQL embebido (una vez por snapshot) para recortes por selección y conciliaciones
+    motor = cargar_motor_consultas(datos_limpios, emparejamiento)
+
+    # Paso 5: La API JSON (si está activa) sirve el snapshot actual; los cortes del historial solo se ven en la app
+    api = servidor_api()
+    if api is not None and corte_historial == CORTE_ACTUAL:
+        api_datos.publicar(api, datos_limpios, motor, emparejamiento)
+
 except Exception as e:
     st.error(f"Error crítico: {str(e)}")
     st.stop()
@@ -88,18 +301,88 @@ except Exception as e:
 ###########################################################
 
 
+#============================================ HOJA DE ESTILOS COMPARTIDA DE LAS TABLAS Y TARJETAS ======================================================================================
+# Las tablas HTML repetían en cada celda el mismo style='padding:12px; text-align:center; border:1px solid #ddd;', lo que
+# multiplicaba los bytes enviados por el websocket. Las vistas usan estas clases y la hoja se envía una sola vez por página
+# junto con la cabecera (los fragmentos que se vuelven a ejecutar la siguen usando)
+ESTILOS_TABLERO = """
+<style>
+  div.sc-tabla, div.sc-estado {overflow-x:auto; margin-bottom:20px;}
+  div.sc-tabla table, div.sc-estado table {width:100%; border-collapse:collapse;}
+  div.sc-tabla tr.sc-enc, div.sc-estado tr.sc-enc, div.sc-estado th.sc-fila {background-color:#621132; color:white;}
+  div.sc-tabla table th, div.sc-tabla table td {padding:12px; text-align:center; border:1px solid #ddd;}
+  div.sc-tabla table td.sc-valor {font-weight:500;}
+  div.sc-tabla table td.sc-justificado {text-align:justify;}
+  div.sc-tabla.sc-compacta {font-size:12px; padding:5px;}
+  div.sc-tabla.sc-compacta table th, div.sc-tabla.sc-compacta table td {padding:5px;}
+  div.sc-estado tr.sc-enc {text-align:center;}
+  div.sc-estado table td {text-align:center; border:1px solid #ddd;}
+  div.sc-separada {margin-top:20px;}
+  div.sc-titulo {background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;}
+  div.sc-titulo.sc-seccion {margin-top:30px; margin-bottom:30px;}
+  div.sc-fuente {text-align:right; font-size:12px; color:#666; margin-top:20px;}
+  div.sc-tarjeta {background-color:#f8f9fa; padding:15px; border-radius:10px; margin-bottom:20px; box-shadow:0 2px 4px rgba(0,0,0,0.1);}
+  div.sc-tarjeta.sc-indicadores {padding:20px;}
+  div.sc-tarjeta h3 {color:#621132; margin:0; font-size:14px;}
+  div.sc-tarjeta h2 {text-align:center; color:#2e86c1; margin:0;}
+  div.sc-tarjeta ul {margin:0; padding-left:20px;}
+  div.sc-tarjeta span.sc-cifra {color:#621132;}
+</style>
+"""
+
+#==================================== PRESUPUESTO DE BYTES DEL HTML DE CADA VISTA ============================================
+# [html] presupuesto_kb = 256 en los secrets (o SICOIN_PRESUPUESTO_HTML_KB): cada tabla o tarjeta que lo excede se registra
+# en la salida del proceso (una vez por vista) y en sicoin_html_excedido_total; los tamaños se ven en REPORTES y en
+# sicoin_html_bytes (ver metricas.py)
+PRESUPUESTO_HTML_KB = 256
+
+@st.cache_resource(show_spinner=False)
+def tamaños_html():
+    # Vista -> {"Último": bytes, "Máximo": bytes, "Excedido": veces}; compartido por las sesiones del proceso
+    return {}
+
+def presupuesto_html_bytes():
+    config = leer_secretos_app().get("html", {})
+    return int(float(os.environ.get("SICOIN_PRESUPUESTO_HTML_KB") or config.get("presupuesto_kb", PRESUPUESTO_HTML_KB)) * 1024)
+
+def mostrar_html(html, vista):
+    st.markdown(html, unsafe_allow_html=True)
+    tamaño = len(html.encode("utf-8"))
+    registro = tamaños_html().setdefault(vista, {"Último": 0, "Máximo": 0, "Excedido": 0})
+    registro["Último"], registro["Máximo"] = tamaño, max(registro["Máximo"], tamaño)
+    metricas.fijar("sicoin_html_bytes", tamaño, vista=vista)
+    if tamaño > presupuesto_html:
+        registro["Excedido"] += 1
+        metricas.contar("sicoin_html_excedido_total", vista=vista)
+        if registro["Excedido"] == 1:
+            print(f"Aviso: la vista {vista} envía {tamaño / 1024:.1f} KB de HTML (presupuesto {presupuesto_html / 1024:.0f} KB)",
+                  file=sys.stderr, flush=True)
+
+presupuesto_html = presupuesto_html_bytes()
+
+
 #============================================ CABECERA ESTÁTICA CON LOS TÍTULOS PRINCIPALES ======================================================================================
-st.markdown("""
+st.markdown(ESTILOS_TABLERO + """
 <div style='background-color:#621132; padding:30px; border-radius:8px; margin-bottom:20px;'>
   <h1 style='text-align:center; color:white; margin:0; font-size:28px;'>SISTEMA DE CONTROL INTERNO INSTITUCIONAL 2025</h1>
   <h3 style='text-align:center; color:white; margin:0; margin-top:10px; font-size:20px;'>RIESGOS Y AVANCE DE LAS ACCIONES DE CONTROL</h3>
 </div>
 """, unsafe_allow_html=True)
 
+if respaldo:
+    st.warning(f"No se pudo descargar la fuente de datos ({estado_descarga()['error']}); se muestran los datos de {respaldo}.")
+
+# Aviso si la fuente ya no trae alguna de las columnas que usa la app (manifiesto COLUMNAS_HOJAS de fuentes_datos.py)
+faltantes_fuente = fuentes_datos.columnas_faltantes(datos_crudos)
+if faltantes_fuente:
+    st.warning("Faltan columnas esperadas en las bases del SICOIN: " +
+               "; ".join(f"{hoja}: {', '.join(columnas)}" for hoja, columnas in faltantes_fuente.items()))
+
 
 #====================================== LISTAS DE FILTROS PARTE 1 - PRE CÁLCULO PARA OPTIMIZAR RENDIMIENTO ==============================================
 @st.cache_data(show_spinner=False)
 def precompute_filter_lists(df):
+    metricas.contar("sicoin_cache_fallos_total", cache="listas_filtros")
     # Lista de instituciones y sectores
     inst_list = sorted(df['Institución'].dropna().unique().tolist())
     sector_list = sorted(df['Sector'].dropna().unique().tolist())
@@ -119,13 +402,14 @@ def precompute_filter_lists(df):
     return inst_list, sector_list, years_by_institucion, years_by_sector
 
 #===================================== LISTAS DE FILTROS PARTE 2 - OBTENCIÓN DE LISTA DE FILTROS PRECOMPUTADAS ==============================================
+metricas.contar("sicoin_cache_consultas_total", cache="listas_filtros")
 inst_list, sector_list, years_by_inst, years_by_sector = precompute_filter_lists(df1)  # Obtener listas de filtros precomputadas (se calcula una única vez por sesión)
 
 # Callback para reiniciar sector a "Todas" al cambiar la institución
 def reset_sector():
     st.session_state['sector'] = "Todas"
 
-col1, col2, col3 = st.columns(3)  # Guardar filtros
+col1, col2, col3, col4 = st.columns(4)  # Guardar filtros
 with col1:
     institucion = st.selectbox("Seleccione la Institución", inst_list, key="institucion", on_change=reset_sector)
 with col2:
@@ -137,6 +421,14 @@ with col3:
     else:
         available_years = years_by_inst.get(institucion, [])
     year = st.selectbox("Seleccione el Año", available_years)
+with col4:
+    # Corte del historial con el que se muestra toda la app (por defecto los datos actuales)
+    cortes_historial = listar_cortes()
+    st.selectbox("Ver Datos al Corte de", [CORTE_ACTUAL] + list(cortes_historial), key="corte_historial",
+                 format_func=lambda id_corte: cortes_historial.get(id_corte, id_corte))
+
+if corte_historial != CORTE_ACTUAL:
+    st.info(f"Se muestran los datos al corte del {cortes_historial[corte_historial]}. Seleccione \"{CORTE_ACTUAL}\" para volver a los datos vigentes.")
 
 #======================================= FIN DE LA CABECERA DE LA APP Y CONFIGURACIÓN DE FILTROS PRINCIPALES =========================================================
 #----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -158,11 +450,11 @@ with col3:
 
 
 #================================== SE OBTIENE UNA LISTA CON LOS NOMBRES DE LAS VARIABLES PARA EL REPORTE PTAR =====================================================
-risk_cols = ['Sustantivo','Administrativo','Financiero','Presupuestal','Servicios', 'Seguridad','Obra_Pública','Recursos_Humanos','Imagen','TICs','Salud', 'Otro','Corrupción','Legal']
-cuadrante_cols = ['I','II','III','IV']
-estrategia_cols = ['Evitar','Reducir','Asumir','Transferir','Compartir']
-estados = ['Sin_Avances', 'En_Proceso', 'Concluidas', 'Cumplimiento']
-trimestres = ['1', '2', '3', '4']
+risk_cols = agregados.RIESGOS
+cuadrante_cols = agregados.CUADRANTES
+estrategia_cols = agregados.ESTRATEGIAS
+estados = agregados.ESTADOS
+trimestres = agregados.TRIMESTRES
 
 
 #================================== FUNCIÓN PARA OBTENER INSTITUCION, SECTOR Y SIGLAS FILTRADOS (Header) ==============================================
@@ -173,113 +465,392 @@ trimestres = ['1', '2', '3', '4']
 def generate_dashboard(institucion, year, sector):
   #----- Parte 1 de la función: Calcula data para reportes -----#
     if sector != "Todas":                                       # -------------------- # Caso 1: Sector != "Todas"
-        filtered = df1[(df1['Sector'] == sector) & (df1['Año'] == year)]               # Filtra PTAR o df1 por Sector y Año y lo guarda en filtered
-        instituciones_list = "<ul style='margin:0; padding-left:20px;'>" + "".join(
+        filtered = df1.iloc[motor_consultas.filas(motor, "PTAR", sector, institucion, year)]  # Filtra PTAR o df1 por Sector y Año (índice del motor SQL) y lo guarda en filtered
+        instituciones_list = "<ul>" + "".join(
           f"<li>{inst}</li>" for inst in filtered['Institución'].unique()) + "</ul>"   # Crea lista desordenada de HTML con las instituciones del sector seleccionado y los imprime
         header = f"""
-        <div style='background-color:#f8f9fa; padding:15px; border-radius:10px; margin-bottom:20px; box-shadow:0 2px 4px rgba(0,0,0,0.1);'>
-          <h3 style='color:#621132; margin:0; font-size:14px;'>
+        <div class='sc-tarjeta'>
+          <h3>
             Sector: {sector}<br>
             Instituciones: {instituciones_list}
           </h3>
         </div>
         """
-                                                                                # COMENTARIO: VARIABLE CUMPLIMIENTO - Se guarda en data, el cumplimeinto promedio por trimestre del sector seleccionado para posterior uso
-        data = filtered.sum(numeric_only=True).to_dict()                                # Obtiene los acumulados de filtered (dfi filtrada) y los guarda en data (acumulados por que es un sector) #serie a diccionario para posterior uso en reportes
-        for t in trimestres:                                                            # En el Caso 1, el Cumplimiento por Sector se obtendrá en promedio- aqui recorre la lista de trimestres
-            key = f"{t}Cumplimiento"                                                    # Se interpola la cadena del trimestre con % y se guarda en key
-            if key in filtered.columns:                                                 # Revisa si existe Key (nCumplimiento) como columna en filtered (que es df1 filtrado por Sector y Año)
-                avg_value = pd.to_numeric(filtered[key], errors='coerce').fillna(0).mean()  # Filtra key en filtered, convierte a número, cambia NaN por 0 y obtiene el promedio - finalmente guarda el dataframe
-                data[key] = round(avg_value, 2)                                             # Guarda los promedios de Cumplimiento en data, con dos decimales
-
     else:                                                     # ------------------------ # Caso 2: sector = "Todas"    (Filtro por Institucipon y Año)
-        filtered = df1[(df1['Institución'] == institucion) & (df1['Año'] == year)]       # En este caso se usa iloc[0] por que filtered nadamas tiene un registro (ya que se filtro por institución)
+        filtered = df1.iloc[motor_consultas.filas(motor, "PTAR", sector, institucion, year)]  # En este caso se usa iloc[0] por que filtered nadamas tiene un registro (ya que se filtro por institución)
         header = f"""
-        <div style='background-color:#f8f9fa; padding:15px; border-radius:10px; margin-bottom:20px; box-shadow:0 2px 4px rgba(0,0,0,0.1);'>
-          <h3 style='color:#621132; margin:0; font-size:14px;'>
+        <div class='sc-tarjeta'>
+          <h3>
             Institución: {institucion}<br>
             Sector: {filtered['Sector'].iloc[0]}<br>
             Siglas: {filtered['Siglas'].iloc[0]}
           </h3>
         </div>
         """
-        data = filtered.iloc[0].to_dict()     # Se obtiene un diccionario con los datos filtrados por Institucion y Año para los posteriores reportes
 
-  #---- Parte 2 de la función: Se limpia el data obtenido - se cambian NaN por 0 -----#
-    for key in data:
-        if pd.isna(data[key]):
-            data[key] = 0
-        elif isinstance(data[key], (int, float)) and not str(key).endswith("Cumplimiento"):
-            data[key] = int(round(data[key]))
+  #---- Parte 2 de la función: Acumulados de la selección (sumas del sector o la fila de la institución, sin NaN) -----#
+    data = agregados.acumulados_ptar(filtered, sector)
+
+  #---- Parte 3 de la función: Indicadores principales y tablas de riesgos, cuadrante y estrategia (construir_indicadores_ptar) ----#
+    stats, risk_html, cuadrante_html, estrategia_html = construir_indicadores_ptar(data)
 
-  #---- Parte 3 de la función: Obtenido data, se obtienen los indicadores principales de la pestaña PTAR - Total de AC_Total y Riesgos ----#
+  #---- Parte 4 de la función (Final): Retorna resultados ----#
+    return header, stats, risk_html, cuadrante_html, estrategia_html, data
+
+# Indicadores y tablas a partir de data (acumulados ya limpios): los usan generate_dashboard y la pestaña GRUPOS
+def construir_indicadores_ptar(data):
+  #---- Parte 1: Obtenido data, se obtienen los indicadores principales de la pestaña PTAR - Total de AC_Total y Riesgos ----#
     stats = f"""
-    <div style='background-color:#f8f9fa; padding:20px; border-radius:10px; margin-bottom:20px; box-shadow:0 2px 4px rgba(0,0,0,0.1);'>
-      <h2 style='text-align:center; color:#2e86c1; margin:0;'>
-        Total de Acciones de Control: <span style='color:#621132;'>{data['AC_Total']}</span><br>
-        Total de Riesgos: <span style='color:#621132;'>{data['Riesgos_Totales']}</span>
+    <div class='sc-tarjeta sc-indicadores'>
+      <h2>
+        Total de Acciones de Control: <span class='sc-cifra'>{data['AC_Total']}</span><br>
+        Total de Riesgos: <span class='sc-cifra'>{data['Riesgos_Totales']}</span>
       </h2>
     </div>
     """
 
-  #---- Parte 4 de la función: Obtención de tablas principales ----#
+  #---- Parte 2: Obtención de tablas principales ----#
 
                              # ------------------------ Tabla de Clasificación de Riesgos ------------------------- #
     risk_html = """
-    <div style='overflow-x:auto; margin-bottom:20px;'>
-      <table style='width:100%; border-collapse:collapse;'>
-        <tr style='background-color:#621132; color:white;'>
+    <div class='sc-tabla'>
+      <table>
+        <tr class='sc-enc'>
     """
     for col in risk_cols:
-        risk_html += f"<th style='padding:12px; text-align:center; border:1px solid #ddd;'>{col}</th>"    # Titulos de la tabla
+        risk_html += f"<th>{col}</th>"    # Titulos de la tabla
     risk_html += "</tr><tr>"
     for col in risk_cols:                                                                                 # Valores de la tabla
-        risk_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd; font-weight:500;'>{data[col]}</td>"
+        risk_html += f"<td class='sc-valor'>{data[col]}</td>"
     risk_html += "</tr></table></div>"
 
                              # ------------------------------- Tabla de Cuadrante ---------------------------------- #
     cuadrante_html = """
-    <div style='overflow-x:auto; margin-bottom:20px;'>
-      <table style='width:100%; border-collapse:collapse;'>
-        <tr style='background-color:#621132; color:white;'>
+    <div class='sc-tabla'>
+      <table>
+        <tr class='sc-enc'>
     """
     colors = ['#dc3545', '#ffc107', '#28a745', '#007bff']                                                                              # Guarda los colores de cada riesgo
     for col, color in zip(cuadrante_cols, colors):
-        cuadrante_html += f"<th style='background-color:{color}; padding:12px; text-align:center; border:1px solid #ddd;'>{col}</th>"
+        cuadrante_html += f"<th style='background-color:{color};'>{col}</th>"
     cuadrante_html += "</tr><tr>"
     for col in cuadrante_cols:
-        cuadrante_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd; font-weight:500;'>{data[col]}</td>"
+        cuadrante_html += f"<td class='sc-valor'>{data[col]}</td>"
     cuadrante_html += "</tr></table></div>"
 
                              # ------------------------------- Tabla de Estrategia ---------------------------------- #
     estrategia_html = """
-    <div style='overflow-x:auto; margin-bottom:20px;'>
-      <table style='width:100%; border-collapse:collapse;'>
-        <tr style='background-color:#621132; color:white;'>
+    <div class='sc-tabla'>
+      <table>
+        <tr class='sc-enc'>
     """
     for col in estrategia_cols:
-        estrategia_html += f"<th style='padding:12px; text-align:center; border:1px solid #ddd;'>{col}</th>"
+        estrategia_html += f"<th>{col}</th>"
     estrategia_html += "</tr><tr>"
     for col in estrategia_cols:
-        estrategia_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd; font-weight:500;'>{data[col]}</td>"
+        estrategia_html += f"<td class='sc-valor'>{data[col]}</td>"
     estrategia_html += "</tr></table></div>"
 
-  #---- Parte 5 de la función (Final): Retorna resultados ----#
-    return header, stats, risk_html, cuadrante_html, estrategia_html, data
+    return stats, risk_html, cuadrante_html, estrategia_html
 #============================================================== FIN DE LA FUNCIÓN =======================================================================
 
 
 
+#================================== VISTAS DE LAS PESTAÑAS PTAR Y PTCI (UNA FUNCIÓN POR TABLA O GRÁFICA) ==============================================
+# Reciben la selección de forma explícita para que el precalentamiento del caché pueda construirlas fuera del flujo de la página
+
+#---- PTAR: Gráfica del estado de las Acciones de Control y tabla de Descripción de los Riesgos (ACTRI)
+def construir_grafica_acciones(data):
+    plot_data = []
+    for t in trimestres:
+        for estado in estados:
+            plot_data.append({'Trimestre': f' {t}', 'Estado': estado, 'Cantidad': data.get(f"{t}{estado}", 0)})
+
+                #-------------- Convierte a dataframe la información obtenida y crea la gráfica (fig)  ------------------------#
+    fig = px.bar(pd.DataFrame(plot_data), x='Trimestre', y='Cantidad', color='Estado',
+                 barmode='group', height=400,
+                 color_discrete_map={'Sin_Avances': '#dc3545', 'En_Proceso': '#ffc107',
+                                     'Concluidas': '#28a745', 'Cumplimiento': '#6610f2'})
+
+                                       #--------------  Da el formato a a la gráfica  ------------------#
+    fig.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(color='#333'),
+        xaxis=dict(title=None, gridcolor='#f0f0f0'),
+        yaxis=dict(title=None, gridcolor='#f0f0f0'),
+        legend=dict(title=None),
+        margin=dict(l=20, r=20, t=50, b=20)
+    )
+     #--------------  Agrega la etiqueta de porcentaje en las barras de Cumplimiento (ya que este valor es porcentaje) -----------------#
+    for trace in fig.data:
+        if trace.name == "Cumplimiento":
+            trace.text = [f"{y}%" for y in trace.y]
+            trace.textposition = 'outside'
+    return fig
+
+def construir_tabla_acciones(institucion, year, sector):
+    # Filas de ACTRI para la selección (Sector y Año, o Institución y Año) resueltas con el índice del motor SQL
+    filtered_df2 = df2.iloc[motor_consultas.filas(motor, "ACTRI", sector, institucion, year)]
+
+                  #------------------ Tercero: Se crean los encabezados para la tabla principal de esta sección --------------#
+    table_html = """
+      <div class='sc-tabla'>
+        <table>
+          <tr class='sc-enc'>
+            <th>Año</th>
+            <th>Siglas</th>
+            <th>Riesgo</th>
+            <th>Descripción del Riesgo</th>
+            <th>No. de AC</th>
+            <th>Descripción</th>
+            <th>Avance Institución</th>
+            <th>Avance OIC</th>
+          </tr>
+    """
+
+                               #------------------ Cuarto: Se llenan los datos de la tabla principal --------------#
+        # Primero muestra los valores de Avance como porcentaje
+    for _, row in filtered_df2.iterrows():
+        avance_inst = f"{round(row['Avance_Institución'], 2)}%" if pd.notna(row['Avance_Institución']) else ""
+        avance_oic = f"{round(row['Avance_OIC'], 2)}%" if pd.notna(row['Avance_OIC']) else ""
+        # Crea la tabla de html con los datos correspondientes
+        table_html += "<tr>"
+        table_html += f"<td>{row.get('Año','')}</td>"
+        table_html += f"<td>{row.get('Siglas','')}</td>"
+        table_html += f"<td>{row.get('Riesgo','')}</td>"
+        table_html += f"<td>{row.get('Descripción_del_Riesgo','')}</td>"
+        table_html += f"<td>{row.get('AC','')}</td>"
+        table_html += f"<td class='sc-justificado'>{row.get('Descripcion','')}</td>"
+        table_html += f"<td>{avance_inst}</td>"
+        table_html += f"<td>{avance_oic}</td>"
+        table_html += "</tr>"
+    table_html += "</table></div>" #cierra la tabla fuera del for
+    return len(filtered_df2), table_html
+
+#---- PTCI: Programa de Trabajo, Desglose por Institución, Detalle, Seguimiento, Gráfica y Descripción de las Acciones de Mejora
+def construir_tabla_programa(df_ptci, sector):
+    # Mapeo de nombres amigables
+    friendly_names = {
+        "Acciones_de_Mejora_Programa_Original": "Programa Original de Acciones de Mejora",
+        "Se_Actualizó_el_Programa": "Se Actualizó el Programa",
+        "No_Se_Actualizó_el_Programa": "No Se Actualizó el Programa",
+        "TotalAcciones_de_Mejora_Programa_Actualizado": "Programa Actualizado de Acciones de Mejora"
+    }
+
+            #----------------- Valores de nuestros indicadores según la condición sobre el sector (agregados.py) -----------------#
+    programa = agregados.programa_ptci(df_ptci, sector)
+
+    #-----------------Creamos el inicio de la tabla HTML que vamos a mostrar en PTCI-----------------#
+    ptci_table = "<div class='sc-tabla'><table>"
+    ptci_table += "<tr class='sc-enc'>"
+
+              #----------------- Creamos los headers con nombres amigables para la tabla -----------------#
+    for col in programa:
+        header_name = friendly_names.get(col, col)
+        ptci_table += f"<th>{header_name}</th>"
+    ptci_table += "</tr><tr>"
+
+            #-------------- Parte 2: Llenamos los valores de nuestra tabla según la condición sobre el sector ------------#
+    for cell_value in programa.values():
+        ptci_table += f"<td class='sc-valor'>{cell_value}</td>"
+    ptci_table += "</tr></table></div>"
+    return ptci_table
+
+def construir_desglose(df_ptci, selected_institucion):
+    #----------------- Desglose de las variables a mostrar -----------------#
+    desglose = df_ptci[["Año", "Institución", "Cumplimiento_General_de_las_NGCI", "Informe_Anual_Finalizado", "SUBIO_ARCHIVO",
+                        "Se_Actualizó_el_Programa", "No_Se_Actualizó_el_Programa",
+                        "Acciones_de_Mejora_Programa_Original", "TotalAcciones_de_Mejora_Programa_Actualizado"]]
+
+    # Filtrar el DataFrame según la institución seleccionada
+    desglose = desglose[desglose["Institución"] == selected_institucion]
+
+    #------------- Diccionario de etiquetas amigables --------------
+    friendly_labels = {
+        "Año": "Año",
+        "Institución": "Institución",
+        "Cumplimiento_General_de_las_NGCI": "Cumplimiento General NGCI",
+        "Informe_Anual_Finalizado": "Informe Anual Finalizado",
+        "SUBIO_ARCHIVO": "Subió Archivo",
+        "Se_Actualizó_el_Programa": "Programa Actualizado",
+        "No_Se_Actualizó_el_Programa": "Programa No Actualizado",
+        "Acciones_de_Mejora_Programa_Original": "Acciones Mejora (Original)",
+        "TotalAcciones_de_Mejora_Programa_Actualizado": "Acciones Mejora (Actualizado)"
+    }
+
+    #----------------- Creando las columnas de la Tabla HTML para el desglose -----------------#
+    desglose_html = "<div class='sc-tabla sc-compacta'><table>"
+    desglose_html += "<tr class='sc-enc'>"
+
+    #----------------- Llenado de tabla (cabeceras con etiquetas amigables) -----------------#
+    for col in desglose.columns:
+        friendly_name = friendly_labels.get(col, col)
+        desglose_html += f"<th>{friendly_name}</th>"
+    desglose_html += "</tr>"
+
+    for _, row in desglose.iterrows():
+        desglose_html += "<tr>"
+        for col in desglose.columns:
+            value = row.get(col, '')
+            if col == "Cumplimiento_General_de_las_NGCI":
+                value = f"{int(value)}%" if pd.notna(value) else ""
+            desglose_html += f"<td>{value}</td>"
+        desglose_html += "</tr>"
+    desglose_html += "</table></div>"
+    return desglose_html
+
+def construir_tabla_detalle(df_ptci_df4_filtrado):
+    detalle = agregados.detalle_amtri(df_ptci_df4_filtrado)
+    detalle_table = "<div class='sc-tabla'><table>"
+    detalle_table += "<tr class='sc-enc'>"
+
+    for col in detalle:
+        detalle_table += f"<th>{col}</th>"
+    detalle_table += "</tr><tr>"
+
+    for value in detalle.values():
+        detalle_table += f"<td class='sc-valor'>{value}</td>"
+
+    detalle_table += "</tr></table></div>"
+    return detalle_table
+
+def construir_grafica_mejora(data_ptci_dict):
+    # Crear lista de diccionarios con los datos filtrados
+    plot_data_ptci = []
+    for t in trimestres:
+        for estado in estados:
+            key = f"{t}{estado}"
+            plot_data_ptci.append({
+                'Trimestre': f' {t}',
+                'Estado': estado,
+                'Cantidad': data_ptci_dict.get(key, 0)
+            })
+
+    # Crear gráfico con datos filtrados
+    fig_ptci = px.bar(
+        pd.DataFrame(plot_data_ptci),
+        x='Trimestre',
+        y='Cantidad',
+        color='Estado',
+        barmode='group',
+        height=400,
+        color_discrete_map={
+            'Sin_Avances': '#dc3545',
+            'En_Proceso': '#ffc107',
+            'Concluidas': '#28a745',
+            'Cumplimiento': '#6610f2'
+        }
+    )
+
+    # Añadir formato al gráfico
+    fig_ptci.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(color='#333'),
+        xaxis=dict(title=None, gridcolor='#f0f0f0'),
+        yaxis=dict(title=None, gridcolor='#f0f0f0'),
+        legend=dict(title=None),
+        margin=dict(l=20, r=20, t=50, b=20)
+    )
+
+    # Añadir etiquetas de porcentaje solo para cumplimiento
+    for trace in fig_ptci.data:
+        if trace.name == "Cumplimiento":
+            trace.text = [f"{y}%" for y in trace.y]
+            trace.textposition = 'outside'
+    return fig_ptci
+
+def construir_descripcion_mejora(filtered_df):
+    #-------------- Parte 1: Creamos la tabla que muestra la descripción de los Procesos y Acciones de Mejora ------------#
+    headers_ptci = ["Año", "Trimestre", "Siglas", "Procesos", "AM", "Descripcion", "Fecha_Inicio", "Fecha_Termino",
+                    "Avance_Institución", "Avance_OIC", "¿Evaluado?", "¿Favorable?", "¿AM_Congruete?", "¿Contribuye?"]
+
+    desc_ptci_html = "<div class='sc-tabla'><table>"
+    desc_ptci_html += "<tr class='sc-enc'>"
+
+    for h in headers_ptci:
+        desc_ptci_html += f"<th>{h}</th>"
+    desc_ptci_html += "</tr>"
+
+    #-------------- Llenamos la tabla ------------#
+    for _, row in filtered_df.iterrows():
+        desc_ptci_html += "<tr>"
+        for h in headers_ptci:
+            cell = row.get(h, "")
+            if h in ["Avance_Institución", "Avance_OIC"]:
+                try:
+                    cell = f"{int(float(cell))}%"
+                except:
+                    cell = cell
+            desc_ptci_html += f"<td>{cell}</td>"
+        desc_ptci_html += "</tr>"
+    desc_ptci_html += "</table></div>"
+    return desc_ptci_html
+
+
+#================================== PRECALENTAMIENTO DEL CACHÉ DE VISTAS (UNA VEZ POR SNAPSHOT, EN SEGUNDO PLANO) ==============================================
+# Cada Sector y las instituciones más consultadas (en el año más reciente y en el que se muestra al elegirlos), con los filtros internos del PTCI en sus valores
+# iniciales (primera institución, "Todas", primer trimestre y todas las siglas). Se configura en [cache_vistas] de los secrets:
+# precalentar = true, instituciones = 10, hilos = 4 (SICOIN_PRECALENTAR=0 lo desactiva)
+def precalentar_seleccion(cache, version, institucion, sector, year):
+    seleccion = (institucion if sector == "Todas" else None, sector, year)
+    def en_cache(vista, *filtros, construir):
+        return cache_vistas.obtener(cache, (vista, version) + seleccion + filtros, construir)
+
+    data = en_cache("ptar_tablero", construir=lambda: generate_dashboard(institucion, year, sector))[-1]
+    en_cache("ptar_grafica", construir=lambda: construir_grafica_acciones(data))
+    en_cache("ptar_tabla_acciones", construir=lambda: construir_tabla_acciones(institucion, year, sector))
+
+    df_ptci = df3.iloc[motor_consultas.filas(motor, "PTCI", sector, institucion, year)]
+    df_ptci_df4 = df4.iloc[motor_consultas.filas(motor, "AMTRI", sector, institucion, year)]
+    if df_ptci.empty:
+        return
+    en_cache("ptci_programa", construir=lambda: construir_tabla_programa(df_ptci, sector))
+    if sector != "Todas":
+        primera_institucion = sorted(df_ptci["Institución"].unique())[0]
+        en_cache("ptci_desglose", primera_institucion, construir=lambda: construir_desglose(df_ptci, primera_institucion))
+    en_cache("ptci_detalle", "Todas", construir=lambda: construir_tabla_detalle(df_ptci_df4))
+    data_ptci_dict = en_cache("ptci_seguimiento", "Todas", construir=lambda: agregados.seguimiento_mejora(df_ptci, sector, "Todas"))
+    en_cache("ptci_grafica", "Todas", construir=lambda: construir_grafica_mejora(data_ptci_dict))
+    trimestres_am = sorted(df_ptci_df4["Trimestre"].unique())
+    if trimestres_am:
+        en_cache("ptci_descripcion", trimestres_am[0], "Todas",
+                 construir=lambda: construir_descripcion_mejora(df_ptci_df4[df_ptci_df4["Trimestre"] == trimestres_am[0]]))
+
+def precalentar_vistas(cache, version):
+    config = leer_secretos_app().get("cache_vistas", {})
+    if os.environ.get("SICOIN_PRECALENTAR", str(config.get("precalentar", True))).lower() in ("0", "false", "no"):
+        return
+    # Año más reciente y el año que muestra el selector al elegir la opción (el primero de la lista)
+    años_vista = lambda años: sorted({años[0], max(años)}) if años else []
+    selecciones = [(None, sec, año) for sec in sector_list for año in años_vista(years_by_sector.get(sec, []))]
+    selecciones += [(inst, "Todas", año) for inst in cache_vistas.mas_consultadas(cache, int(config.get("instituciones", 10)))
+                    for año in años_vista(years_by_inst.get(inst, []))]
+    tareas = [lambda sel=sel: precalentar_seleccion(cache, version, *sel) for sel in selecciones]
+    cache_vistas.precalentar(cache, version, tareas, int(config.get("hilos", cache_vistas.HILOS_PRECALENTAMIENTO)))
+
+# Solo los datos vigentes (no los cortes del historial); las instituciones consultadas alimentan el siguiente precalentamiento
+if corte_historial == CORTE_ACTUAL:
+    precalentar_vistas(cache_vistas_app(), motor["version"])
+if sector == "Todas" and st.session_state.get("institucion_contada") != (institucion, motor["version"]):
+    st.session_state["institucion_contada"] = (institucion, motor["version"])
+    cache_vistas.registrar_consulta(cache_vistas_app(), institucion)
+
+
 #============================================== DESEMPAQUETADO DE VALORES QUE DEVUELVE LA FUNCIÓN ==============================================
-header, stats, risk_html, cuadrante_html, estrategia_html, data = generate_dashboard(institucion, year, sector)
+# Selección de la cabecera para las claves del caché de vistas (con un Sector elegido la institución no cambia el resultado)
+seleccion_cabecera = (institucion if sector == "Todas" else None, sector, year)
+header, stats, risk_html, cuadrante_html, estrategia_html, data = vista_en_cache(
+    "ptar_tablero", *seleccion_cabecera, construir=lambda: generate_dashboard(institucion, year, sector))
 
 
 #================================== MOSTRAR INSTITUCIONES, SIGLAS Y  SECTOR FILTRADOS (Header) ==============================================
-st.markdown(header, unsafe_allow_html=True)                                                     #Se muestran fuera de las pestañas pues son datos globales
+mostrar_html(header, "ptar_cabecera")                                   #Se muestran fuera de las pestañas pues son datos globales
 #--------------------------------------------------------------------------------------------------------------------------------------------------
 
-#================================================== CREACIÓN DE PESTAÑAS PTAR, PTCI Y REPORTES =========================================================
-tabs = st.tabs(["PTAR", "PTCI", "REPORTES"])
+#================================================== CREACIÓN DE PESTAÑAS PTAR, PTCI, REPORTES, COMPARATIVO, GRUPOS Y BÚSQUEDA =========================================================
+tabs = st.tabs(["PTAR", "PTCI", "REPORTES", "COMPARATIVO SECTORIAL", "GRUPOS", "BÚSQUEDA"])
 
 
 #===================================================== MOSTRAR RESULTADOS EN LA PESTAÑA PTAR ==============================================
@@ -287,57 +858,57 @@ tabs = st.tabs(["PTAR", "PTCI", "REPORTES"])
 #===================================================== MOSTRAR RESULTADOS EN LA PESTAÑA PTAR ==============================================
 
 #---- Pestaña PTAR
-with tabs[0]:
+with tabs[0], metricas.cronometro("sicoin_pestana_segundos", pestana="PTAR"):
 
   #---- Parte 1 del with: Se muestran los Indicadores Principales (Stats) ----#
-    st.markdown(stats, unsafe_allow_html=True)
+    mostrar_html(stats, "ptar_indicadores")
 
 
 #============================================= SE ABRE LA SECCIÓN 1 - "Clasificación de Riesgos" ==============================================
 #--------------------------------------------------------------------------------------------------------------------------------------------------
     st.markdown("""
-      <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+      <div class='sc-titulo'>
         Clasificación de Riesgos
       </div>
     """, unsafe_allow_html=True)
                                         # ------ Se muestra la Tabla de Clasificación de Riesgos ----#
-    st.markdown(risk_html, unsafe_allow_html=True)
+    mostrar_html(risk_html, "ptar_riesgos")
     col1, col2 = st.columns(2)
 
                                 #-------------- Se muestra la Tabla de Cuadrante (En columna 1) ------------#
     with col1:
         st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+          <div class='sc-titulo'>
             Cuadrante
           </div>
         """, unsafe_allow_html=True)
-        st.markdown(cuadrante_html, unsafe_allow_html=True)
+        mostrar_html(cuadrante_html, "ptar_cuadrante")
 
                                 #-------------- Se muestra la Tabla de Estrategia (En columna 2) ------------#
     with col2:
         st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+          <div class='sc-titulo'>
             Estrategia
           </div>
         """, unsafe_allow_html=True)
-        st.markdown(estrategia_html, unsafe_allow_html=True)
+        mostrar_html(estrategia_html, "ptar_estrategia")
 
 
 
 #====================================== SE ABRE LA SECCIÓN 2 - "Seguimiento de las Acciones de Control" ==============================================
 #--------------------------------------------------------------------------------------------------------------------------------------------------
     st.markdown("""
-      <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+      <div class='sc-titulo'>
         Seguimiento de las Acciones de Control
       </div>
     """, unsafe_allow_html=True)
 
                        #-------------- Parte 1: Se crea y muestra la Tabla para el estado de las Acciones de Control ------------#
     # (Se agregan "%" en Cumplimiento)
-    st.markdown("""
-      <div style='overflow-x:auto; margin-top:20px; margin-bottom:20px;'>
-        <table style='width:100%; border-collapse:collapse;'>
-          <tr style='background-color:#621132; color:white; text-align:center;'>
+    mostrar_html("""
+      <div class='sc-estado sc-separada'>
+        <table>
+          <tr class='sc-enc'>
             <th>Estatdo de las Acciones de Control</th>
             <th>Primero</th>
             <th>Segundo</th>
@@ -345,32 +916,32 @@ with tabs[0]:
             <th>Cuarto</th>
           </tr>
           <tr>
-            <th style='background-color:#621132; color:white;'>Sin Avances</th>
-            <td style='text-align:center; border:1px solid #ddd;'>{0}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{1}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{2}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{3}</td>
+            <th class='sc-fila'>Sin Avances</th>
+            <td>{0}</td>
+            <td>{1}</td>
+            <td>{2}</td>
+            <td>{3}</td>
           </tr>
           <tr>
-            <th style='background-color:#621132; color:white;'>En Proceso</th>
-            <td style='text-align:center; border:1px solid #ddd;'>{4}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{5}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{6}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{7}</td>
+            <th class='sc-fila'>En Proceso</th>
+            <td>{4}</td>
+            <td>{5}</td>
+            <td>{6}</td>
+            <td>{7}</td>
           </tr>
           <tr>
-            <th style='background-color:#621132; color:white;'>Concluidas</th>
-            <td style='text-align:center; border:1px solid #ddd;'>{8}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{9}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{10}</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{11}</td>
+            <th class='sc-fila'>Concluidas</th>
+            <td>{8}</td>
+            <td>{9}</td>
+            <td>{10}</td>
+            <td>{11}</td>
           </tr>
           <tr>
-            <th style='background-color:#621132; color:white;'>% de Cumplimiento</th>
-            <td style='text-align:center; border:1px solid #ddd;'>{12}%</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{13}%</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{14}%</td>
-            <td style='text-align:center; border:1px solid #ddd;'>{15}%</td>
+            <th class='sc-fila'>% de Cumplimiento</th>
+            <td>{12}%</td>
+            <td>{13}%</td>
+            <td>{14}%</td>
+            <td>{15}%</td>
           </tr>
         </table>
       </div>
@@ -379,39 +950,12 @@ with tabs[0]:
       data.get("1En_Proceso",0), data.get("2En_Proceso",0), data.get("3En_Proceso",0), data.get("4En_Proceso",0),
       data.get("1Concluidas",0), data.get("2Concluidas",0), data.get("3Concluidas",0), data.get("4Concluidas",0),
       data.get("1Cumplimiento",0), data.get("2Cumplimiento",0), data.get("3Cumplimiento",0), data.get("4Cumplimiento",0)
-    ), unsafe_allow_html=True)
+    ), "ptar_seguimiento")
 
                            #-------------- Parte 2: Se crea el gráfico de barras para el estado de las AC ------------#
            #----------------- Para ello primero crea lista de diccionarios que contenga los datos para el gráfico -----------------#
 
-    plot_data = []
-    for t in trimestres:
-        for estado in estados:
-            plot_data.append({'Trimestre': f' {t}', 'Estado': estado, 'Cantidad': data.get(f"{t}{estado}", 0)})
-
-                #-------------- Convierte a dataframe la información obtenida y crea la gráfica (fig)  ------------------------#
-    fig = px.bar(pd.DataFrame(plot_data), x='Trimestre', y='Cantidad', color='Estado',
-                 barmode='group', height=400,
-                 color_discrete_map={'Sin_Avances': '#dc3545', 'En_Proceso': '#ffc107',
-                                     'Concluidas': '#28a745', 'Cumplimiento': '#6610f2'})
-
-                                       #--------------  Da el formato a a la gráfica  ------------------#
-    fig.update_layout(
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font=dict(color='#333'),
-        xaxis=dict(title=None, gridcolor='#f0f0f0'),
-        yaxis=dict(title=None, gridcolor='#f0f0f0'),
-        legend=dict(title=None),
-        margin=dict(l=20, r=20, t=50, b=20)
-    )
-     #--------------  Agrega la etiqueta de porcentaje en las barras de Cumplimiento (ya que este valor es porcentaje) -----------------#
-    for trace in fig.data:
-        if trace.name == "Cumplimiento":
-            trace.text = [f"{y}%" for y in trace.y]
-            trace.textposition = 'outside'
-
-                                #-------------- Muestra el gráfico de barras para el estado de las AC ------------#
+    fig = vista_en_cache("ptar_grafica", *seleccion_cabecera, construir=lambda: construir_grafica_acciones(data))
     st.plotly_chart(fig, use_container_width=True)
 
 
@@ -419,7 +963,7 @@ with tabs[0]:
 #================================= SE ABRE LA SECCIÓN 3 - "Descripción de los Riesgos y las Acciones de Control" ==============================================
 #--------------------------------------------------------------------------------------------------------------------------------------------------
     st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-top:30px; margin-bottom:30px; text-align:center;'>
+          <div class='sc-titulo sc-seccion'>
         Descripción de los Riesgos y las Acciones de Control
       </div>
     """, unsafe_allow_html=True)
@@ -429,61 +973,26 @@ with tabs[0]:
                     #--------------Primero:  Se crea un dataframe (filtered_df2) según el filtro seleccionado ------------#
                     #---------------Esto se hace por que estamos usando otra base, pero con los mismos filtros ------------#
 
-    if sector != "Todas":
-        filtered_df2 = df2[(df2['Sector'] == sector) & (df2['Año'] == year)]
-    else:
-        filtered_df2 = df2[(df2['Institución'] == institucion) & (df2['Año'] == year)]
+    # La tabla se construye una sola vez por selección y se comparte entre sesiones (caché de vistas)
+    total_acciones_actri, table_html = vista_en_cache("ptar_tabla_acciones", *seleccion_cabecera,
+                                                      construir=lambda: construir_tabla_acciones(institucion, year, sector))
 
 
             #-------------- Segundo: Se verifica si (data['AC_Total']) coincide con el número de filas en filtered_df2 ------------#
-    if int(data['AC_Total']) != len(filtered_df2):
+    if int(data['AC_Total']) != total_acciones_actri:
         st.markdown("""
           <p style='color:red; font-weight:bold; text-align:center;'>
             Las acciones de control registradas en el PTAR no coinciden con las Acciones de Control Registradas
           </p>
         """, unsafe_allow_html=True)
 
-                  #------------------ Tercero: Se crean los encabezados para la tabla principal de esta sección --------------#
-    table_html = """
-      <div style='overflow-x:auto;'>
-        <table style='width:100%; border-collapse:collapse; margin-bottom:20px;'>
-          <tr style='background-color:#621132; color:white;'>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Año</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Siglas</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Riesgo</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Descripción del Riesgo</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>No. de AC</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Descripción</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Avance Institución</th>
-            <th style='padding:12px; text-align:center; border:1px solid #ddd;'>Avance OIC</th>
-          </tr>
-    """
-
-                               #------------------ Cuarto: Se llenan los datos de la tabla principal --------------#
-        # Primero muestra los valores de Avance como porcentaje
-    for _, row in filtered_df2.iterrows():
-        avance_inst = f"{round(row['Avance_Institución'], 2)}%" if pd.notna(row['Avance_Institución']) else ""
-        avance_oic = f"{round(row['Avance_OIC'], 2)}%" if pd.notna(row['Avance_OIC']) else ""
-        # Crea la tabla de html con los datos correspondientes
-        table_html += "<tr>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{row.get('Año','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{row.get('Siglas','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{row.get('Riesgo','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{row.get('Descripción_del_Riesgo','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{row.get('AC','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:justify; border:1px solid #ddd;'>{row.get('Descripcion','')}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{avance_inst}</td>"
-        table_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{avance_oic}</td>"
-        table_html += "</tr>"
-    table_html += "</table></div>" #cierra la tabla fuera del for
-
                               #------------------ Quinto: Se muestra la tabla principal de la sección--------------#
-    st.markdown(table_html, unsafe_allow_html=True)
+    mostrar_html(table_html, "ptar_tabla_acciones")
 
 
 #============================================= PIE DE PÁGINA DE LA SECCION PTAR - FUENTE SICOIN ==============================================
     st.markdown("""
-      <div style='text-align:right; font-size:12px; color:#666; margin-top:20px;'>
+      <div class='sc-fuente'>
         Fuente: Sistema de Control Interno (SICOIN)
       </div>
     """, unsafe_allow_html=True)
@@ -515,16 +1024,10 @@ with tabs[0]:
 
 
 #---- Pestaña PTCI
-with tabs[1]:
-    # Filtrar df3 y df4 con los mismos filtros
-    if sector != "Todas":
-        filtro_ptci = (df3['Sector'] == sector) & (df3['Año'] == year)
-        filtro_ptci_df4 = (df4['Sector'] == sector) & (df4['Año'] == year)
-    else:
-        filtro_ptci = (df3['Institución'] == institucion) & (df3['Año'] == year)
-        filtro_ptci_df4 = (df4['Institución'] == institucion) & (df4['Año'] == year)
-    df_ptci = df3[filtro_ptci]
-    df_ptci_df4 = df4[filtro_ptci_df4]
+with tabs[1], metricas.cronometro("sicoin_pestana_segundos", pestana="PTCI"):
+    # Filtrar df3 y df4 con los mismos filtros (posiciones de fila obtenidas con el índice del motor SQL)
+    df_ptci = df3.iloc[motor_consultas.filas(motor, "PTCI", sector, institucion, year)]
+    df_ptci_df4 = df4.iloc[motor_consultas.filas(motor, "AMTRI", sector, institucion, year)]
 
                            #--------------- Segundo: Revisa si el DataFrame filtrado df_ptci está vacío ------------#
       #---------------Esto se hace por que vamos a tomar un indicador similar a header pero lo imprimiremos directamente ------------#
@@ -534,24 +1037,9 @@ with tabs[1]:
     else:
 
       #---------------------- Obtiene el Cumplimiento en % según el sector (Este es el indicador que necesitamos) -------------------#
-        if sector != "Todas":
-            # Nuestro indicador será el promedio para sector (ya que son varias instituciones)
-            cum_ngci = df_ptci['Cumplimiento_General_de_las_NGCI'].mean().round(2)
-            cum_ngci_str = f"{cum_ngci}%"
-
-           #Indicador para las AM
-            acciones_mejora_actualizadas = df_ptci['TotalAcciones_de_Mejora_Programa_Actualizado'].sum()
-            acciones_mejora_actualizadas_str = f"{acciones_mejora_actualizadas}"
-
-
-        else:
-            #  Nuestro indicador será el valor directo para institución (ya que solo es una)
-            cum_ngci = df_ptci['Cumplimiento_General_de_las_NGCI'].iloc[0]
-            cum_ngci_str = f"{round(cum_ngci, 2)}%"
-
-               #Indicador para las AM
-            acciones_mejora_actualizadas = df_ptci['TotalAcciones_de_Mejora_Programa_Actualizado'].iloc[0]
-            acciones_mejora_actualizadas_str = f"{acciones_mejora_actualizadas}"
+        # Promedio del sector (varias instituciones) o valor directo de la institución, y total de Acciones de Mejora (agregados.py)
+        acciones_mejora_actualizadas, cum_ngci = agregados.indicadores_ptci(df_ptci, sector)
+        cum_ngci_str = f"{cum_ngci}%"
 
 
       #---------------------- Una vez preparados nuestros datos, estamos listos para mostrarlos en la pestaña PTCI -------------------#
@@ -571,10 +1059,10 @@ with tabs[1]:
 
 #================================== MOSTRAR INDICADOR PRINCIPAL DE LA PESTAÑA PTCI (Cumplimiento General de las NGCI) ==============================================
         st.markdown(f"""
-            <div style='background-color:#f8f9fa; padding:20px; border-radius:10px; margin-bottom:20px; box-shadow:0 2px 4px rgba(0,0,0,0.1);'>
-                <h2 style='text-align:center; color:#2e86c1; margin:0;'>
-                    Total de Acciones de Mejora: <span style='color:#621132;'>{acciones_mejora_actualizadas}</span></br>
-                    Cumplimiento general de las NGCI: <span style='color:#621132;'>{cum_ngci_str}</span>
+            <div class='sc-tarjeta sc-indicadores'>
+                <h2>
+                    Total de Acciones de Mejora: <span class='sc-cifra'>{acciones_mejora_actualizadas}</span></br>
+                    Cumplimiento general de las NGCI: <span class='sc-cifra'>{cum_ngci_str}</span>
                 </h2>
             </div>
             """, unsafe_allow_html=True)
@@ -584,7 +1072,7 @@ with tabs[1]:
 #============================================= SE ABRE LA SECCIÓN 1 - "Programa de Trabajo de Control Interno" ==============================================
 #------------------------------------------------------------------------------------------------------------------------------------------------------------
         st.markdown("""
-            <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+            <div class='sc-titulo'>
                 Programa de Trabajo de Control Interno
             </div>
         """, unsafe_allow_html=True)
@@ -594,50 +1082,11 @@ with tabs[1]:
                     #-----------------  Estos se mostraran como una tabla (Ya que tenemos mas de dos indicadores)-----------------#
                     #-----------------  Mapearemos nombres amigables pare entender mejor las variables en la appp-----------------#
 
-        # Mapeo de nombres amigables
-        friendly_names = {
-            "Acciones_de_Mejora_Programa_Original": "Programa Original de Acciones de Mejora",
-            "Se_Actualizó_el_Programa": "Se Actualizó el Programa",
-            "No_Se_Actualizó_el_Programa": "No Se Actualizó el Programa",
-            "TotalAcciones_de_Mejora_Programa_Actualizado": "Programa Actualizado de Acciones de Mejora"
-        }
-
-                #----------------- Guardaremos las columnas de nuestros indicadores a mostrar según la condición sobre el sector-----------------#
-        if sector == "Todas":
-            ptci_cols = [
-                "Acciones_de_Mejora_Programa_Original",
-                "Se_Actualizó_el_Programa",
-                "No_Se_Actualizó_el_Programa",
-                "TotalAcciones_de_Mejora_Programa_Actualizado"
-            ]
-        else:
-            ptci_cols = [
-                "Acciones_de_Mejora_Programa_Original",
-                "TotalAcciones_de_Mejora_Programa_Actualizado"
-            ]
-
-                #-----------------Creamos el inicio de la tabla HTML que vamos a mostrar en PTCI-----------------#
-        ptci_table = "<div style='overflow-x:auto; margin-bottom:20px;'><table style='width:100%; border-collapse:collapse;'>"
-        ptci_table += "<tr style='background-color:#621132; color:white;'>"
-
-                  #----------------- Creamos los headers con nombres amigables para la tabla -----------------#
-        for col in ptci_cols:
-            header_name = friendly_names.get(col, col)
-            ptci_table += f"<th style='padding:12px; text-align:center; border:1px solid #ddd;'>{header_name}</th>"
-        ptci_table += "</tr><tr>"
-
-                #-------------- Parte 2: Llenamos los valores de nuestra tabla según la condición sobre el sector ------------#
-        for col in ptci_cols:
-            if sector == "Todas" and col in ["Se_Actualizó_el_Programa", "No_Se_Actualizó_el_Programa"]:
-                cell_value = df_ptci[col].iloc[0] if not df_ptci.empty and col in df_ptci.columns else "N/A"
-            else:
-                numeric_value = pd.to_numeric(df_ptci[col], errors='coerce').fillna(0).sum() if col in df_ptci.columns else 0
-                cell_value = int(round(numeric_value))
-            ptci_table += f"<td style='padding:12px; text-align:center; border:1px solid #ddd; font-weight:500;'>{cell_value}</td>"
-        ptci_table += "</tr></table></div>"
+        # Tabla del programa (nombres amigables y columnas según el sector): una sola vez por selección, compartida entre sesiones
+        ptci_table = vista_en_cache("ptci_programa", *seleccion_cabecera, construir=lambda: construir_tabla_programa(df_ptci, sector))
 
                 #-------------- Parte 3: Finalmente mostramos la tabla con nuestros indicadores para el PTCI ------------#
-        st.markdown(ptci_table, unsafe_allow_html=True)
+        mostrar_html(ptci_table, "ptci_programa")
 
 
 #============================================= SE ABRE LA SECCIÓN 2 - "Programa de Trabajo de Control Interno - Desglose por Institución" =============================================
@@ -651,178 +1100,122 @@ with tabs[1]:
               </div>
             """, unsafe_allow_html=True)
 
-            #------------- Filtro por Institución --------------FILTRO CÓDIGO KPP70
-            selected_institucion = st.selectbox("Filtrar Institución del Sector", options=sorted(df_ptci["Institución"].unique()))
-
-            #----------------- Desglose de las variables a mostrar -----------------#
-            desglose = df_ptci[["Año", "Institución", "Cumplimiento_General_de_las_NGCI", "Informe_Anual_Finalizado", "SUBIO_ARCHIVO",
-                                "Se_Actualizó_el_Programa", "No_Se_Actualizó_el_Programa",
-                                "Acciones_de_Mejora_Programa_Original", "TotalAcciones_de_Mejora_Programa_Actualizado"]]
-
-            # Filtrar el DataFrame según la institución seleccionada
-            desglose = desglose[desglose["Institución"] == selected_institucion]
-
-            #------------- Diccionario de etiquetas amigables --------------
-            friendly_labels = {
-                "Año": "Año",
-                "Institución": "Institución",
-                "Cumplimiento_General_de_las_NGCI": "Cumplimiento General NGCI",
-                "Informe_Anual_Finalizado": "Informe Anual Finalizado",
-                "SUBIO_ARCHIVO": "Subió Archivo",
-                "Se_Actualizó_el_Programa": "Programa Actualizado",
-                "No_Se_Actualizó_el_Programa": "Programa No Actualizado",
-                "Acciones_de_Mejora_Programa_Original": "Acciones Mejora (Original)",
-                "TotalAcciones_de_Mejora_Programa_Actualizado": "Acciones Mejora (Actualizado)"
-            }
-
-            #----------------- Creando las columnas de la Tabla HTML para el desglose -----------------#
-            desglose_html = "<div style='overflow-x:auto; margin-bottom:20px; font-size:12px; padding:5px;'><table style='width:100%; border-collapse:collapse;'>"
-            desglose_html += "<tr style='background-color:#621132; color:white;'>"
-
-            #----------------- Llenado de tabla (cabeceras con etiquetas amigables) -----------------#
-            for col in desglose.columns:
-                friendly_name = friendly_labels.get(col, col)
-                desglose_html += f"<th style='padding:5px; text-align:center; border:1px solid #ddd;'>{friendly_name}</th>"
-            desglose_html += "</tr>"
-
-            for _, row in desglose.iterrows():
-                desglose_html += "<tr>"
-                for col in desglose.columns:
-                    value = row.get(col, '')
-                    if col == "Cumplimiento_General_de_las_NGCI":
-                        value = f"{int(value)}%" if pd.notna(value) else ""
-                    desglose_html += f"<td style='padding:5px; text-align:center; border:1px solid #ddd;'>{value}</td>"
-                desglose_html += "</tr>"
-            desglose_html += "</table></div>"
-
-            #-------------- Parte 2: Mostramos la tabla del programa de trabajo desglosado por institución --------------#
-            st.markdown(desglose_html, unsafe_allow_html=True)
+            # Fragmento: el filtro de institución del desglose solo vuelve a ejecutar esta sección (no toda la página)
+            @st.fragment
+            def seccion_desglose():
+                #------------- Filtro por Institución --------------FILTRO CÓDIGO KPP70
+                selected_institucion = st.selectbox("Filtrar Institución del Sector", options=sorted(df_ptci["Institución"].unique()))
+
+                desglose_html = vista_en_cache("ptci_desglose", *seleccion_cabecera, selected_institucion,
+                                               construir=lambda: construir_desglose(df_ptci, selected_institucion))
+
+                #-------------- Parte 2: Mostramos la tabla del programa de trabajo desglosado por institución --------------#
+                mostrar_html(desglose_html, "ptci_desglose")
+            seccion_desglose()
 
 
 
 #============================================= SE ABRE LA SECCIÓN 3 - "Detalle de las Acciones de Mejora"================================= ==============================================
 #------------------------------------------------------------------------------------------------------------------------------------------------------------
         st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
+          <div class='sc-titulo'>
             Detalle de las Acciones de Mejora
           </div>
         """, unsafe_allow_html=True)
 
-        # ========== FILTRO DE INSTITUCIÓN PARA SECCIONES 3 Y 4 ======--------FILTRO CÓDIGO KPP71
-        if sector != "Todas":
-            # Obtener instituciones del sector y añadir opción "Todas"
-            instituciones_sector = ["Todas"] + sorted(df_ptci["Institución"].unique().tolist())
-            selected_institucion_am = st.selectbox(
-                "Filtrar por Institución para Acciones de Mejora",
-                options=instituciones_sector,
-                index=0
-            )
-        else:
-            selected_institucion_am = "Todas"
-
-
-        # ========== PREPARAR DATOS SEGÚN FILTRO ==========
-        # Para sección 3 (Detalle Acciones Mejora)
-        if selected_institucion_am == "Todas":
-            df_ptci_df4_filtrado = df_ptci_df4
-        else:
-            df_ptci_df4_filtrado = df_ptci_df4[df_ptci_df4["Institución"] == selected_institucion_am]
-
-        # Para sección 4 (Seguimiento Acciones Mejora)
-        if selected_institucion_am == "Todas":
-            df_ptci_filtrado = df_ptci
-        else:
-            df_ptci_filtrado = df_ptci[df_ptci["Institución"] == selected_institucion_am]
+        # Fragmento: el filtro de institución de las secciones 3 y 4 solo vuelve a ejecutar estas secciones (no toda la página)
+        @st.fragment
+        def seccion_seguimiento_mejora():
+            # ========== FILTRO DE INSTITUCIÓN PARA SECCIONES 3 Y 4 ======--------FILTRO CÓDIGO KPP71
+            if sector != "Todas":
+                # Obtener instituciones del sector y añadir opción "Todas"
+                instituciones_sector = ["Todas"] + sorted(df_ptci["Institución"].unique().tolist())
+                selected_institucion_am = st.selectbox(
+                    "Filtrar por Institución para Acciones de Mejora",
+                    options=instituciones_sector,
+                    index=0
+                )
+            else:
+                selected_institucion_am = "Todas"
 
-        # ========== CONSTRUIR TABLA DETALLE ==========
-        detalle_cols = ["Registradas", "Localizadas", "No_localizadas", "Suficientes", "Parcielmente_Suficientes", "Insuficientes"]
-        detalle_table = "<div style='overflow-x:auto; margin-bottom:20px;'><table style='width:100%; border-collapse:collapse;'>"
-        detalle_table += "<tr style='background-color:#621132; color:white;'>"
 
-        for col in detalle_cols:
-            detalle_table += f"<th style='padding:12px; text-align:center; border:1px solid #ddd;'>{col}</th>"
-        detalle_table += "</tr><tr>"
+            # ========== PREPARAR DATOS SEGÚN FILTRO ==========
+            # Para sección 3 (Detalle Acciones Mejora)
+            if selected_institucion_am == "Todas":
+                df_ptci_df4_filtrado = df_ptci_df4
+            else:
+                df_ptci_df4_filtrado = df_ptci_df4[df_ptci_df4["Institución"] == selected_institucion_am]
 
-        for col in detalle_cols:
-            value = pd.to_numeric(df_ptci_df4_filtrado[col], errors='coerce').fillna(0).sum() if col in df_ptci_df4_filtrado.columns else 0
-            detalle_table += f"<td style='padding:12px; text-align:center; border:1px solid #ddd; font-weight:500;'>{int(round(value))}</td>"
+            # Para sección 4 (Seguimiento Acciones Mejora)
+            if selected_institucion_am == "Todas":
+                df_ptci_filtrado = df_ptci
+            else:
+                df_ptci_filtrado = df_ptci[df_ptci["Institución"] == selected_institucion_am]
 
-        detalle_table += "</tr></table></div>"
-        st.markdown(detalle_table, unsafe_allow_html=True)
+            # ========== CONSTRUIR TABLA DETALLE ==========
+            detalle_table = vista_en_cache("ptci_detalle", *seleccion_cabecera, selected_institucion_am,
+                                           construir=lambda: construir_tabla_detalle(df_ptci_df4_filtrado))
+            mostrar_html(detalle_table, "ptci_detalle")
 
 #============================================= SE ABRE LA SECCIÓN 4 - "Seguimiento de las Acciones de Mejora"=================================
 #------------------------------------------------------------------------------------------------------------------------------------------------------------
-        st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-bottom:20px; text-align:center;'>
-            Seguimiento de las Acciones de Mejora
-          </div>
-        """, unsafe_allow_html=True)
+            st.markdown("""
+              <div class='sc-titulo'>
+                Seguimiento de las Acciones de Mejora
+              </div>
+            """, unsafe_allow_html=True)
 
-        # ========== PROCESAR DATOS PARA TABLA SEGUIMIENTO ==========
-        data_ptci_dict = {}
-        for t in trimestres:
-            for estado in estados:
-                key = f"{t}{estado}"
-                if key in df_ptci_filtrado.columns:
-                    # Manejar porcentaje de cumplimiento
-                    if estado == "Cumplimiento":
-                        if sector != "Todas" and selected_institucion_am == "Todas":
-                            value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').mean()
-                        else:
-                            value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').sum()
-                    else:
-                        value = pd.to_numeric(df_ptci_filtrado[key], errors='coerce').sum()
-                else:
-                    value = 0
-                data_ptci_dict[key] = int(round(value))
-
-        # ========== CONSTRUIR TABLA SEGUIMIENTO ==========
-        st.markdown("""
-          <div style='overflow-x:auto; margin-bottom:20px;'>
-            <table style='width:100%; border-collapse:collapse;'>
-              <tr style='background-color:#621132; color:white; text-align:center;'>
-                <th>Estatus de las Acciones de Mejora</th>
-                <th>Primero</th>
-                <th>Segundo</th>
-                <th>Tercero</th>
-                <th>Cuarto</th>
-              </tr>
-              <tr>
-                <th style='background-color:#621132; color:white;'>Sin Avances</th>
-                <td style='text-align:center; border:1px solid #ddd;'>{0}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{1}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{2}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{3}</td>
-              </tr>
-              <tr>
-                <th style='background-color:#621132; color:white;'>En Proceso</th>
-                <td style='text-align:center; border:1px solid #ddd;'>{4}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{5}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{6}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{7}</td>
-              </tr>
-              <tr>
-                <th style='background-color:#621132; color:white;'>Concluidas</th>
-                <td style='text-align:center; border:1px solid #ddd;'>{8}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{9}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{10}</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{11}</td>
-              </tr>
-              <tr>
-                <th style='background-color:#621132; color:white;'>% de Cumplimiento</th>
-                <td style='text-align:center; border:1px solid #ddd;'>{12}%</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{13}%</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{14}%</td>
-                <td style='text-align:center; border:1px solid #ddd;'>{15}%</td>
-              </tr>
-            </table>
-          </div>
-        """.format(
-          data_ptci_dict.get("1Sin_Avances",0), data_ptci_dict.get("2Sin_Avances",0), data_ptci_dict.get("3Sin_Avances",0), data_ptci_dict.get("4Sin_Avances",0),
-          data_ptci_dict.get("1En_Proceso",0), data_ptci_dict.get("2En_Proceso",0), data_ptci_dict.get("3En_Proceso",0), data_ptci_dict.get("4En_Proceso",0),
-          data_ptci_dict.get("1Concluidas",0), data_ptci_dict.get("2Concluidas",0), data_ptci_dict.get("3Concluidas",0), data_ptci_dict.get("4Concluidas",0),
-          data_ptci_dict.get("1Cumplimiento",0), data_ptci_dict.get("2Cumplimiento",0), data_ptci_dict.get("3Cumplimiento",0), data_ptci_dict.get("4Cumplimiento",0)
-        ), unsafe_allow_html=True)
+            # ========== PROCESAR DATOS PARA TABLA SEGUIMIENTO ==========
+            data_ptci_dict = vista_en_cache("ptci_seguimiento", *seleccion_cabecera, selected_institucion_am,
+                                            construir=lambda: agregados.seguimiento_mejora(df_ptci_filtrado, sector, selected_institucion_am))
+
+            # ========== CONSTRUIR TABLA SEGUIMIENTO ==========
+            mostrar_html("""
+              <div class='sc-estado'>
+                <table>
+                  <tr class='sc-enc'>
+                    <th>Estatus de las Acciones de Mejora</th>
+                    <th>Primero</th>
+                    <th>Segundo</th>
+                    <th>Tercero</th>
+                    <th>Cuarto</th>
+                  </tr>
+                  <tr>
+                    <th class='sc-fila'>Sin Avances</th>
+                    <td>{0}</td>
+                    <td>{1}</td>
+                    <td>{2}</td>
+                    <td>{3}</td>
+                  </tr>
+                  <tr>
+                    <th class='sc-fila'>En Proceso</th>
+                    <td>{4}</td>
+                    <td>{5}</td>
+                    <td>{6}</td>
+                    <td>{7}</td>
+                  </tr>
+                  <tr>
+                    <th class='sc-fila'>Concluidas</th>
+                    <td>{8}</td>
+                    <td>{9}</td>
+                    <td>{10}</td>
+                    <td>{11}</td>
+                  </tr>
+                  <tr>
+                    <th class='sc-fila'>% de Cumplimiento</th>
+                    <td>{12}%</td>
+                    <td>{13}%</td>
+                    <td>{14}%</td>
+                    <td>{15}%</td>
+                  </tr>
+                </table>
+              </div>
+            """.format(
+              data_ptci_dict.get("1Sin_Avances",0), data_ptci_dict.get("2Sin_Avances",0), data_ptci_dict.get("3Sin_Avances",0), data_ptci_dict.get("4Sin_Avances",0),
+              data_ptci_dict.get("1En_Proceso",0), data_ptci_dict.get("2En_Proceso",0), data_ptci_dict.get("3En_Proceso",0), data_ptci_dict.get("4En_Proceso",0),
+              data_ptci_dict.get("1Concluidas",0), data_ptci_dict.get("2Concluidas",0), data_ptci_dict.get("3Concluidas",0), data_ptci_dict.get("4Concluidas",0),
+              data_ptci_dict.get("1Cumplimiento",0), data_ptci_dict.get("2Cumplimiento",0), data_ptci_dict.get("3Cumplimiento",0), data_ptci_dict.get("4Cumplimiento",0)
+            ), "ptci_seguimiento")
 
 
 
@@ -830,132 +1223,74 @@ with tabs[1]:
 
 
 
-              #-------------- Parte 3: Se crea el gráfico de barras para el seguimiento de las acciones de mejora ------------#
-           #----------------- Para ello primero crea lista de diccionarios que contenga los datos para el gráfico -----------------#
+                  #-------------- Parte 3: Se crea el gráfico de barras para el seguimiento de las acciones de mejora ------------#
+               #----------------- Para ello primero crea lista de diccionarios que contenga los datos para el gráfico -----------------#
 
 # ========== ACTUALIZACIÓN DEL GRÁFICO ==========
-        # Crear lista de diccionarios con los datos filtrados
-        plot_data_ptci = []
-        for t in trimestres:
-            for estado in estados:
-                key = f"{t}{estado}"
-                plot_data_ptci.append({
-                    'Trimestre': f' {t}',
-                    'Estado': estado,
-                    'Cantidad': data_ptci_dict.get(key, 0)
-                })
-
-        # Crear gráfico con datos filtrados
-        fig_ptci = px.bar(
-            pd.DataFrame(plot_data_ptci),
-            x='Trimestre',
-            y='Cantidad',
-            color='Estado',
-            barmode='group',
-            height=400,
-            color_discrete_map={
-                'Sin_Avances': '#dc3545',
-                'En_Proceso': '#ffc107',
-                'Concluidas': '#28a745',
-                'Cumplimiento': '#6610f2'
-            }
-        )
-
-        # Añadir formato al gráfico
-        fig_ptci.update_layout(
-            plot_bgcolor='white',
-            paper_bgcolor='white',
-            font=dict(color='#333'),
-            xaxis=dict(title=None, gridcolor='#f0f0f0'),
-            yaxis=dict(title=None, gridcolor='#f0f0f0'),
-            legend=dict(title=None),
-            margin=dict(l=20, r=20, t=50, b=20)
-        )
-
-        # Añadir etiquetas de porcentaje solo para cumplimiento
-        for trace in fig_ptci.data:
-            if trace.name == "Cumplimiento":
-                trace.text = [f"{y}%" for y in trace.y]
-                trace.textposition = 'outside'
+            fig_ptci = vista_en_cache("ptci_grafica", *seleccion_cabecera, selected_institucion_am,
+                                      construir=lambda: construir_grafica_mejora(data_ptci_dict))
 
-        # Mostrar gráfico
-        st.plotly_chart(fig_ptci, use_container_width=True)
+            # Mostrar gráfico
+            st.plotly_chart(fig_ptci, use_container_width=True)
+        seccion_seguimiento_mejora()
 
 
 
 #============================================= SE ABRE LA SECCIÓN 5 - "Descripción de los Procesos y Acciones de Mejora" =============================================
 #------------------------------------------------------------------------------------------------------------------------------------------------------------
         st.markdown("""
-          <div style='background-color:#621132; color:white; padding:10px; border-radius:5px; margin-top:30px; margin-bottom:30px; text-align:center;'>
+          <div class='sc-titulo sc-seccion'>
             Descripción de los Procesos y las Acciones de Mejora
           </div>
         """, unsafe_allow_html=True)
 
-        #------------- Filtros --------------
-        col1, col2 = st.columns(2)
-        with col1:
-            selected_trimester = st.selectbox("Filtrar por Trimestre", options=sorted(df_ptci_df4["Trimestre"].unique()))
-        with col2:
-            # Añadir opción "Todas" al filtro de Siglas
-            siglas_options = ["Todas"] + sorted(df_ptci_df4["Siglas"].unique().tolist())
-            selected_siglas = st.selectbox("Filtrar por Siglas", options=siglas_options, index=0)
-
-        # Filtrar el DataFrame según los filtros seleccionados
-        if selected_siglas == "Todas":
-            filtered_df = df_ptci_df4[df_ptci_df4["Trimestre"] == selected_trimester]
-        else:
-            filtered_df = df_ptci_df4[
-                (df_ptci_df4["Trimestre"] == selected_trimester) &
-                (df_ptci_df4["Siglas"] == selected_siglas)
-            ]
-
-        #-------------- Parte 1: Creamos la tabla que muestra la descripción de los Procesos y Acciones de Mejora ------------#
-        headers_ptci = ["Año", "Trimestre", "Siglas", "Procesos", "AM", "Descripcion", "Fecha_Inicio", "Fecha_Termino",
-                        "Avance_Institución", "Avance_OIC", "¿Evaluado?", "¿Favorable?", "¿AM_Congruete?", "¿Contribuye?"]
-
-        desc_ptci_html = "<div style='overflow-x:auto;'><table style='width:100%; border-collapse:collapse; margin-bottom:20px;'>"
-        desc_ptci_html += "<tr style='background-color:#621132; color:white;'>"
+        # Fragmento: los filtros de Trimestre y Siglas solo vuelven a ejecutar esta sección (no toda la página)
+        @st.fragment
+        def seccion_descripcion_mejora():
+            #------------- Filtros --------------
+            col1, col2 = st.columns(2)
+            with col1:
+                selected_trimester = st.selectbox("Filtrar por Trimestre", options=sorted(df_ptci_df4["Trimestre"].unique()))
+            with col2:
+                # Añadir opción "Todas" al filtro de Siglas
+                siglas_options = ["Todas"] + sorted(df_ptci_df4["Siglas"].unique().tolist())
+                selected_siglas = st.selectbox("Filtrar por Siglas", options=siglas_options, index=0)
+
+            # Filtrar el DataFrame según los filtros seleccionados
+            if selected_siglas == "Todas":
+                filtered_df = df_ptci_df4[df_ptci_df4["Trimestre"] == selected_trimester]
+            else:
+                filtered_df = df_ptci_df4[
+                    (df_ptci_df4["Trimestre"] == selected_trimester) &
+                    (df_ptci_df4["Siglas"] == selected_siglas)
+                ]
 
-        for h in headers_ptci:
-            desc_ptci_html += f"<th style='padding:12px; text-align:center; border:1px solid #ddd;'>{h}</th>"
-        desc_ptci_html += "</tr>"
+            desc_ptci_html = vista_en_cache("ptci_descripcion", *seleccion_cabecera, selected_trimester, selected_siglas,
+                                            construir=lambda: construir_descripcion_mejora(filtered_df))
 
-        #-------------- Llenamos la tabla ------------#
-        for _, row in filtered_df.iterrows():
-            desc_ptci_html += "<tr>"
-            for h in headers_ptci:
-                cell = row.get(h, "")
-                if h in ["Avance_Institución", "Avance_OIC"]:
-                    try:
-                        cell = f"{int(float(cell))}%"
-                    except:
-                        cell = cell
-                desc_ptci_html += f"<td style='padding:12px; text-align:center; border:1px solid #ddd;'>{cell}</td>"
-            desc_ptci_html += "</tr>"
-        desc_ptci_html += "</table></div>"
-
-        # Verificación de correspondencia (actualizada para trabajar con múltiples instituciones)
-        if selected_siglas == "Todas":
-            acciones_mejora_actualizadas_AMTRI = len(filtered_df)
-        else:
-            acciones_mejora_actualizadas_AMTRI = len(filtered_df['Trimestre'] == 4)
+            # Verificación de correspondencia (actualizada para trabajar con múltiples instituciones)
+            if selected_siglas == "Todas":
+                acciones_mejora_actualizadas_AMTRI = len(filtered_df)
+            else:
+                acciones_mejora_actualizadas_AMTRI = len(filtered_df['Trimestre'] == 4)
 
 
 
-        if selected_siglas == "Todas":
-            if int(acciones_mejora_actualizadas) != acciones_mejora_actualizadas_AMTRI:
-                st.markdown(f"""
-                  <p style='color:red; font-weight:bold; text-align:center;'>
-                    Las Acciones de Mejora registradas en el PTCI (Actualizado) no coinciden con las Acciones de Mejora Registradas en Sistema al 4to Trimestre <br>
-                    AM en el PTCI = {acciones_mejora_actualizadas}<br>
-                    AM en Sistema = {acciones_mejora_actualizadas_AMTRI}
-                  </p>
-                """, unsafe_allow_html=True)
+            if selected_siglas == "Todas":
+                if int(acciones_mejora_actualizadas) != acciones_mejora_actualizadas_AMTRI:
+                    st.markdown(f"""
+                      <p style='color:red; font-weight:bold; text-align:center;'>
+                        Las Acciones de Mejora registradas en el PTCI (Actualizado) no coinciden con las Acciones de Mejora Registradas en Sistema al 4to Trimestre <br>
+                        AM en el PTCI = {acciones_mejora_actualizadas}<br>
+                        AM en Sistema = {acciones_mejora_actualizadas_AMTRI}
+                      </p>
+                    """, unsafe_allow_html=True)
 
 
 
-        #-------------- Parte 2: Imprimimos la tabla ------------#
-        st.markdown(desc_ptci_html, unsafe_allow_html=True)
+            #-------------- Parte 2: Imprimimos la tabla ------------#
+            mostrar_html(desc_ptci_html, "ptci_descripcion")
+        seccion_descripcion_mejora()
 
 
 
@@ -968,7 +1303,7 @@ with tabs[1]:
 #============================================= PIE DE PÁGINA DE LA SECCION PTCI - FUENTE SICOIN ==============================================
 
     st.markdown("""
-      <div style='text-align:right; font-size:12px; color:#666; margin-top:20px;'>
+      <div class='sc-fuente'>
         Fuente: Sistema de Control Interno (SICOIN)
       </div>
     """, unsafe_allow_html=True)
@@ -990,20 +1325,259 @@ with tabs[1]:
 ###########################################################
 
 
-with tabs[2]:
+#====================================== PREPARACIÓN DE DATOS ANTES DE MOSTRAR RESULTADOS EN LA PESTAÑA REPORTES =====================================================================
+#------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+#================================== DETECCIÓN DE ACCIONES CASI DUPLICADAS (SHINGLES + MINHASH + LSH, ver agregados.py) ==============================================
+@st.cache_data(show_spinner=False)
+def detectar_casi_duplicados(df, grupo_cols, clave_col, texto_col="Descripcion"):
+    return agregados.detectar_casi_duplicados(df, grupo_cols, clave_col, texto_col)
+
+
+#================================== MOTOR DE REGLAS DE CALIDAD DE DATOS (DECLARADAS EN reglas_calidad.toml) ==============================================
+# Sustituye las listas escritas a mano de "Registros Basura" y "Modificaciones Necesarias": cada regla del archivo
+# se evalúa como una máscara vectorizada sobre las hojas crudas (antes de limpiar, para detectar encabezados repetidos).
+RUTA_REGLAS_CALIDAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reglas_calidad.toml")
+MUESTRAS_POR_REGLA = 10         # Filas de ejemplo que se guardan por regla y hoja
+
+@st.cache_data(show_spinner=False)
+def cargar_reglas_calidad(ruta=RUTA_REGLAS_CALIDAD):
+    with open(ruta, "rb") as archivo:
+        return tomllib.load(archivo).get("regla", [])
+
+def mascara_regla(df, regla):
+    # Devuelve una máscara booleana (una entrada por fila) o None si la regla no aplica a la hoja
+    tipo = regla["tipo"]
+    columna = regla.get("columna")
+    if tipo == "columna_requerida":
+        return pd.Series(columna not in df.columns, index=df.index)
+    if tipo == "encabezado":
+        columnas = [c for c in regla["columnas"] if c in df.columns]
+        if not columnas:
+            return None
+        return np.logical_or.reduce([df[c].astype(str).str.strip() == c for c in columnas])
+    if columna not in df.columns:
+        return None
+    if tipo == "patron":
+        return normalize_text_serie(df[columna]).str.contains(regla["patron"], regex=True)
+    if tipo == "vacio":
+        return df[columna].isna() | df[columna].astype(str).str.strip().isin(["", "nan", "None"])
+    if tipo == "rango":
+        valores = pd.to_numeric(df[columna], errors='coerce')
+        return (valores < regla.get("minimo", -np.inf)) | (valores > regla.get("maximo", np.inf))
+    if tipo == "fecha_anterior":
+        if regla["referencia"] not in df.columns:
+            return None
+        fecha = pd.to_datetime(df[columna], format="mixed", dayfirst=True, errors='coerce')
+        referencia = pd.to_datetime(df[regla["referencia"]], format="mixed", dayfirst=True, errors='coerce')
+        return fecha < referencia
+    raise ValueError(f"Tipo de regla desconocido: {tipo}")
+
+@st.cache_data(show_spinner=False)
+def evaluar_reglas_calidad(datos, reglas):
+    hallazgos, muestras = [], {}
+    for regla in reglas:
+        for hoja in regla.get("hojas", list(datos)):
+            if hoja not in datos:
+                continue
+            df = datos[hoja].rename(columns=lambda c: str(c).strip())
+            mascara = mascara_regla(df, regla)
+            if mascara is None:
+                continue
+            mascara = np.asarray(mascara, dtype=bool)
+            afectados = df[mascara]
+            columna = regla.get("columna") or ", ".join(regla.get("columnas", []))
+            valores = tuple(afectados[regla["columna"]].astype(str).str.strip().unique()) if regla.get("columna") in afectados.columns else ()
+            hallazgos.append({
+                "Regla": regla["nombre"],
+                "Categoría": regla.get("categoria", "calidad"),
+                "Hoja": hoja,
+                "Columna": columna,
+                "Registros Afectados": int(mascara.sum()) if regla["tipo"] != "columna_requerida" else int(mascara.any()),
+                "Valores Detectados": valores,
+                "Acción Sugerida": regla.get("accion", "")
+            })
+            muestras[(regla["nombre"], hoja)] = afectados.head(MUESTRAS_POR_REGLA)
+    return pd.DataFrame(hallazgos, columns=["Regla", "Categoría", "Hoja", "Columna", "Registros Afectados", "Valores Detectados", "Acción Sugerida"]), muestras
+
+#================================== DIFERENCIAS ENTRE CORTES DEL HISTORIAL (CACHEADAS POR PAR DE CORTES) ==============================================
+# Los cortes no cambian una vez guardados, así que cada comparación se calcula una sola vez
+@st.cache_data(show_spinner=False)
+def comparar_cortes_historial(corte_anterior, corte_posterior):
+    return historial_datos.comparar_cortes(configuracion_historial_app(), corte_anterior, corte_posterior)
+
+@st.cache_data(show_spinner=False)
+def detalle_cortes_historial(corte_anterior, corte_posterior, hoja):
+    cambios = comparar_cortes_historial(corte_anterior, corte_posterior)[hoja]
+    return historial_datos.detalle_cambios(configuracion_historial_app(), corte_anterior, corte_posterior, hoja, cambios)
+
+#================================== BRECHA ENTRE EL AVANCE DE LA INSTITUCIÓN Y EL VALIDADO POR EL OIC (UNA VEZ POR SNAPSHOT) ==============================================
+# Brecha = Avance_Institución - Avance_OIC de cada acción de ACTRI (control) y AMTRI (mejora); una brecha positiva es sobrerreporte
+# (la institución reporta más avance del que valida el OIC). Se guardan las brechas por acción y sumas parciales por Hoja, Año,
+# Trimestre, Sector e Institución, de modo que al cambiar los filtros solo se suman grupos ya calculados.
+COLUMNAS_BRECHA = ["Hoja", "Año", "Trimestre", "Sector", "Institución", "Siglas", "Clave", "Descripcion",
+                   "Avance_Institución", "Avance_OIC", "Brecha"]
+RESULTADOS_BRECHAS = 50         # Acciones con mayor brecha que se listan
+
+@st.cache_data(show_spinner=False)
+def calcular_brechas_avance(df_actri, df_amtri):
+    partes = []
+    for hoja, df, clave_col in (("ACTRI", df_actri, "AC"), ("AMTRI", df_amtri, "AM")):
+        if df.empty or "Avance_Institución" not in df.columns or "Avance_OIC" not in df.columns:
+            continue
+        parte = pd.DataFrame({
+            "Hoja": hoja,
+            "Año": pd.to_numeric(df["Año"], errors="coerce").astype("Int64"),
+            "Trimestre": pd.to_numeric(df["Trimestre"], errors="coerce").astype("Int64") if "Trimestre" in df.columns else pd.NA,
+            "Sector": df["Sector"].astype(str),
+            "Institución": df["Institución"].astype(str),
+            "Siglas": df["Siglas"].astype(str) if "Siglas" in df.columns else "",
+            "Clave": df[clave_col].astype(str) if clave_col in df.columns else "",
+            "Descripcion": df["Descripcion"].astype(str) if "Descripcion" in df.columns else "",
+            "Avance_Institución": pd.to_numeric(df["Avance_Institución"], errors="coerce"),
+            "Avance_OIC": pd.to_numeric(df["Avance_OIC"], errors="coerce"),
+        })
+        partes.append(parte.astype({"Trimestre": "Int64"}))
+    acciones = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUMNAS_BRECHA)
+    # Solo las acciones con ambos avances capturados
+    acciones = acciones.dropna(subset=["Avance_Institución", "Avance_OIC"]).reset_index(drop=True)
+    acciones["Brecha"] = acciones["Avance_Institución"] - acciones["Avance_OIC"]
+
+    grupos = acciones.assign(Brecha_Absoluta=acciones["Brecha"].abs(), Sobrerreporte=(acciones["Brecha"] > 0).astype(int))
+    grupos = grupos.groupby(["Hoja", "Año", "Trimestre", "Sector", "Institución"], dropna=False, as_index=False).agg(
+        Acciones=("Brecha", "size"), Suma_Brecha=("Brecha", "sum"), Suma_Brecha_Absoluta=("Brecha_Absoluta", "sum"),
+        Sobrerreportes=("Sobrerreporte", "sum"), Brecha_Maxima=("Brecha", "max"))
+    return acciones[COLUMNAS_BRECHA], grupos
+
+def filtrar_brechas(df, hojas, año, trimestre):
+    mascara = df["Hoja"].isin(hojas)
+    if año != "Todos":
+        mascara &= (df["Año"] == año).fillna(False)
+    if trimestre != "Todos":
+        mascara &= (df["Trimestre"] == trimestre).fillna(False)     # ACTRI no tiene trimestre
+    return df[mascara]
+
+def resumir_brechas(grupos, por):
+    # Brecha promedio, brecha absoluta promedio y tasa de sobrerreporte a partir de las sumas parciales
+    resumen = grupos.groupby(por, as_index=False).agg(
+        Acciones=("Acciones", "sum"), Suma_Brecha=("Suma_Brecha", "sum"), Suma_Brecha_Absoluta=("Suma_Brecha_Absoluta", "sum"),
+        Sobrerreportes=("Sobrerreportes", "sum"), Brecha_Maxima=("Brecha_Maxima", "max"))
+    return pd.DataFrame({
+        **{col: resumen[col] for col in por},
+        "Acciones Comparadas": resumen["Acciones"],
+        "Brecha Promedio": (resumen["Suma_Brecha"] / resumen["Acciones"]).round(2),
+        "Brecha Absoluta Promedio": (resumen["Suma_Brecha_Absoluta"] / resumen["Acciones"]).round(2),
+        "% de Sobrerreporte": (resumen["Sobrerreportes"] / resumen["Acciones"] * 100).round(1),
+        "Brecha Máxima": resumen["Brecha_Maxima"].round(2)
+    }).sort_values(["% de Sobrerreporte", "Brecha Promedio"], ascending=False, ignore_index=True)
+
+#================================== TRAYECTORIA TRIMESTRAL DE CADA ACCIÓN DE MEJORA (AMTRI, UNA VEZ POR SNAPSHOT) ==============================================
+# AMTRI tiene una fila por acción y trimestre. Se pivotea una sola vez por snapshot a una fila por acción (Institución, Año, AM)
+# con el Avance_Institución y el Avance_OIC de los trimestres 1 a 4, y las alertas se calculan columna a columna sobre todas
+# las acciones a la vez:
+#   - Retroceso: algún avance (institución u OIC) es menor que el del trimestre reportado anterior.
+#   - Estancada: el avance de la institución lleva al menos TRIMESTRES_ESTANCADA trimestres sin subir y es menor a 100. Cuentan
+#     los últimos trimestres reportados sin cambio y también los trimestres sin captura desde su último reporte hasta el
+#     trimestre más reciente del año en AMTRI (una acción que dejó de reportarse en el T1 está estancada aunque nadie la marque).
+#     [trayectorias] trimestres_estancada = 2 en los secrets (o SICOIN_TRIMESTRES_ESTANCADA); un solo trimestre sin cambio
+#     es normal entre revisiones del OIC y no se marca.
+#   - Vencida: la Fecha_Termino ya pasó y la acción no está concluida (avance de la institución o del OIC menor a 100).
+TRIMESTRES_AMTRI = [1, 2, 3, 4]
+TRIMESTRES_ESTANCADA = 2        # Trimestres consecutivos sin avance para considerar estancada una acción (predeterminado)
+AVANCE_COMPLETO = 100
+ALERTAS_TRAYECTORIA = ["Retroceso", "Estancada", "Vencida"]
+
+def trimestres_estancada_configurados():
+    config = leer_secretos_app().get("trayectorias", {})
+    return int(os.environ.get("SICOIN_TRIMESTRES_ESTANCADA", config.get("trimestres_estancada", TRIMESTRES_ESTANCADA)))
+
+@st.cache_data(show_spinner=False)
+def calcular_trayectorias_amtri(df_amtri, fecha_corte, trimestres_estancada=TRIMESTRES_ESTANCADA):
+    claves = ["Institución", "Año", "AM"]
+    if df_amtri.empty or not set(claves + ["Trimestre", "Avance_Institución", "Avance_OIC"]) <= set(df_amtri.columns):
+        return pd.DataFrame()
+    df = pd.DataFrame({
+        "Institución": df_amtri["Institución"].astype(str),
+        "Año": pd.to_numeric(df_amtri["Año"], errors="coerce").astype("Int64"),
+        "AM": df_amtri["AM"].astype(str),
+        "Trimestre": pd.to_numeric(df_amtri["Trimestre"], errors="coerce").astype("Int64"),
+        "Avance_Institución": pd.to_numeric(df_amtri["Avance_Institución"], errors="coerce"),
+        "Avance_OIC": pd.to_numeric(df_amtri["Avance_OIC"], errors="coerce"),
+        **{col: df_amtri[col].astype(str) for col in ["Sector", "Siglas", "Descripcion", "Fecha_Termino"] if col in df_amtri.columns},
+    })
+    df = df[df["Trimestre"].isin(TRIMESTRES_AMTRI) & (df["AM"].str.strip() != "")]
+    # Si una acción se capturó dos veces en el mismo trimestre cuenta la última fila
+    df = df.drop_duplicates(claves + ["Trimestre"], keep="last").sort_values("Trimestre", kind="stable")
+    if df.empty:
+        return pd.DataFrame()
+
+    pivote = df.set_index(claves + ["Trimestre"])[["Avance_Institución", "Avance_OIC"]].unstack("Trimestre")
+    pivote = pivote.reindex(columns=pd.MultiIndex.from_product([["Avance_Institución", "Avance_OIC"], TRIMESTRES_AMTRI]))
+    institucion, oic = pivote["Avance_Institución"], pivote["Avance_OIC"]
+
+    # Cambio contra el último trimestre reportado antes de cada trimestre (los trimestres sin captura no cuentan)
+    cambio = lambda avances: avances - avances.ffill(axis=1).shift(1, axis=1)
+    cambio_institucion, cambio_oic = cambio(institucion), cambio(oic)
+    retroceso = (cambio_institucion < 0).any(axis=1) | (cambio_oic < 0).any(axis=1)
+    sin_avance = pd.Series(0, index=pivote.index)
+    seguidos = pd.Series(True, index=pivote.index)
+    for t in reversed(TRIMESTRES_AMTRI):
+        igual = cambio_institucion[t].eq(0)
+        sin_avance += (seguidos & igual).astype(int)
+        seguidos &= igual | cambio_institucion[t].isna()
+    avance_actual, avance_actual_oic = institucion.ffill(axis=1)[4], oic.ffill(axis=1)[4]
+
+    # Datos descriptivos y Fecha_Termino del último trimestre reportado de cada acción
+    ultimo = df.groupby(claves, sort=False).last()
+    ultimo = ultimo.reindex(pivote.index)
+
+    # Trimestres sin captura desde el último reporte de la acción hasta el trimestre más reciente de su año en AMTRI
+    trimestre_vigente = pivote.index.get_level_values("Año").map(df.groupby("Año")["Trimestre"].max())
+    sin_reporte = (pd.Series(trimestre_vigente, index=pivote.index) - ultimo["Trimestre"]).fillna(0).clip(lower=0).astype(int)
+    sin_avance += sin_reporte
+    termino = pd.to_datetime(ultimo["Fecha_Termino"], dayfirst=True, errors="coerce", format="mixed") if "Fecha_Termino" in ultimo.columns else pd.NaT
+    concluida = (avance_actual >= AVANCE_COMPLETO) & (avance_actual_oic >= AVANCE_COMPLETO)
+
+    trayectorias = pd.DataFrame({
+        "Sector": ultimo["Sector"] if "Sector" in ultimo.columns else "",
+        "Siglas": ultimo["Siglas"] if "Siglas" in ultimo.columns else "",
+        "Descripcion": ultimo["Descripcion"] if "Descripcion" in ultimo.columns else "",
+        **{f"T{t} Institución": institucion[t] for t in TRIMESTRES_AMTRI},
+        **{f"T{t} OIC": oic[t] for t in TRIMESTRES_AMTRI},
+        "Último Trimestre": ultimo["Trimestre"],
+        "Trimestres sin Reporte": sin_reporte,
+        "Avance Actual": avance_actual,
+        "Avance Actual OIC": avance_actual_oic,
+        "Trimestres sin Avance": sin_avance,
+        "Fecha_Termino": termino,
+        "Retroceso": retroceso,
+        "Estancada": (sin_avance >= trimestres_estancada) & (avance_actual < AVANCE_COMPLETO),
+        "Vencida": (termino < fecha_corte).fillna(False) & ~concluida,
+    }, index=pivote.index).reset_index()
+    return trayectorias
+
+def resumir_trayectorias(trayectorias):
+    # Conteo de acciones y de cada alerta por institución, de la que tiene más alertas a la que tiene menos
+    alertas = trayectorias.assign(Alguna=trayectorias[ALERTAS_TRAYECTORIA].any(axis=1))
+    resumen = alertas.groupby(["Institución", "Sector", "Año"], as_index=False).agg(
+        Acciones=("AM", "size"), Con_Alerta=("Alguna", "sum"), **{alerta: (alerta, "sum") for alerta in ALERTAS_TRAYECTORIA},
+        Avance_Promedio=("Avance Actual", "mean"))
+    resumen["Avance_Promedio"] = resumen["Avance_Promedio"].round(2)
+    return resumen.rename(columns={"Con_Alerta": "Con Alguna Alerta", "Avance_Promedio": "Avance Promedio"}).sort_values(
+        ["Con Alguna Alerta", "Vencida", "Acciones"], ascending=False, ignore_index=True)
+
+
+with tabs[2], metricas.cronometro("sicoin_pestana_segundos", pestana="REPORTES"):
 
     st.markdown("<h2>📋 CONSOLIDACIÓN DE LAS BASES DE DATOS SICOIN 📋</h2><p>Información Actualizada al 13/06/2025 04:30 PM.</p>", unsafe_allow_html=True)
 
+    # Evaluación de las reglas de calidad sobre las hojas crudas (cacheada: una vez por descarga)
+    hallazgos_calidad, muestras_calidad = evaluar_reglas_calidad(datos_crudos, cargar_reglas_calidad())
+
     import unicodedata
     import pandas as pd
 
-    # Funciones de normalización
-    def normalize_name(name):
-        return str(name).strip().lower()
-
-    def normalize_text(text):
-        return unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('utf-8').strip().lower()
-
     # Funciones de estilo para colorear la fila completa según verificación
     def style_row_instituciones(row):
         # Para la tabla de instituciones, se verifica la columna "¿Coincide el Nombre de la Institución?"
@@ -1075,6 +1649,31 @@ with tabs[2]:
         st.dataframe(df_instituciones.style.apply(style_row_instituciones, axis=1),
                     use_container_width=True)
 
+    # Emparejamiento difuso (calculado al cargar los datos): nombres de las cinco bases contra el catálogo del PEF
+    # Función de estilo: verde si es idéntico, amarillo si se concilia por similitud y rojo si no hay coincidencia confiable
+    # o si el nombre del PEF ya es la clave de otra institución (colisión)
+    def style_row_emparejamiento(row):
+        if row["Observación"]:
+            return ['background-color: #ffcdd2'] * len(row)
+        elif row["Confianza"] == 1:
+            return ['background-color: #c8e6c9'] * len(row)
+        elif row["Confianza"] >= UMBRAL_COINCIDENCIA:
+            return ['background-color: #fff3cd'] * len(row)
+        else:
+            return ['background-color: #ffcdd2'] * len(row)
+
+    st.markdown(f"""
+    Las conciliaciones de esta pestaña usan como clave el nombre del PEF sugerido cuando la confianza es de al menos {UMBRAL_COINCIDENCIA}.
+    Cada nombre del PEF se asigna a una sola institución del SICOIN (la más parecida); las demás se concilian con su propio nombre.
+    """)
+    colisiones = emparejamiento[emparejamiento["Observación"] != ""]
+    if not colisiones.empty:
+        st.warning(f"{len(colisiones)} instituciones del SICOIN comparten el nombre sugerido del PEF con otra institución "
+                   "y no se concilian con él; revise la columna Observación.")
+    with st.expander("Ver Coincidencias Sugeridas por Similitud de Nombre"):
+        st.dataframe(emparejamiento.drop(columns=["Clave_Institución"]).sort_values("Confianza").style.apply(style_row_emparejamiento, axis=1),
+                     use_container_width=True)
+
 
 
     # Función de estilo condicional para pintar los registros basura de rojo
@@ -1085,33 +1684,38 @@ with tabs[2]:
         else:
             return [''] * len(row)  # Sin estilo si no es "❌"
 
-    # Datos de ejemplo de instituciones (como en tu código)
+    # Registros de prueba detectados por el motor de reglas (categoría "prueba" en reglas_calidad.toml)
     instituciones_data = [
         {
-            "Nombre de las Instituciones en el Sistema SICOIN": "Institución de Prueba (Se encuentra en PTCI)",
-            "Nombre de los Sectores en el Sistema SICOIN": "",
-            "Nombre Correcto del Sector Según el PEF 2025": "El registro es de Prueba por lo Tanto Eliminar",
-            "Nombre Correcto de la Institución Según el PEF 2025": "El registro es de Prueba por lo Tanto Eliminar",
-            "¿Coincide el Nombre de la Institución?": "❌"
-        },
-        {
-            "Nombre de las Instituciones en el Sistema SICOIN": "Instituto de Tamaulipas Demo (Se encuentra en el PTAR)",
+            "Nombre de las Instituciones en el Sistema SICOIN": f"{valor} (Se encuentra en {hallazgo['Hoja']})",
             "Nombre de los Sectores en el Sistema SICOIN": "",
-            "Nombre Correcto del Sector Según el PEF 2025": "El registro es de Prueba por lo Tanto Eliminar",
-            "Nombre Correcto de la Institución Según el PEF 2025": "El registro es de Prueba por lo Tanto Eliminar",
+            "Nombre Correcto del Sector Según el PEF 2025": hallazgo["Acción Sugerida"],
+            "Nombre Correcto de la Institución Según el PEF 2025": hallazgo["Acción Sugerida"],
             "¿Coincide el Nombre de la Institución?": "❌"
-        },
+        }
+        for _, hallazgo in hallazgos_calidad[hallazgos_calidad["Categoría"] == "prueba"].iterrows()
+        for valor in hallazgo["Valores Detectados"]
     ]
+    registros_prueba = sorted({valor for valores in hallazgos_calidad.loc[hallazgos_calidad["Categoría"] == "prueba", "Valores Detectados"] for valor in valores})
 
     # Crear el DataFrame de las instituciones
-    df_instituciones_basura = pd.DataFrame(instituciones_data)
+    df_instituciones_basura = pd.DataFrame(instituciones_data, columns=[
+        "Nombre de las Instituciones en el Sistema SICOIN",
+        "Nombre de los Sectores en el Sistema SICOIN",
+        "Nombre Correcto del Sector Según el PEF 2025",
+        "Nombre Correcto de la Institución Según el PEF 2025",
+        "¿Coincide el Nombre de la Institución?"
+    ])
 
     # Mostrar el título para los registros basura
     st.markdown('<p class="section-title">📋 Registros Basura</p>', unsafe_allow_html=True)
 
     # Expander para mostrar los registros basura
     with st.expander("Ver Registros Basura"):
-        st.dataframe(df_instituciones_basura.style.apply(style_row_instituciones_basura, axis=1), use_container_width=True)
+        if not df_instituciones_basura.empty:
+            st.dataframe(df_instituciones_basura.style.apply(style_row_instituciones_basura, axis=1), use_container_width=True)
+        else:
+            st.success("✅ No se encontraron registros de prueba en las bases.")
 
 
     # --------------------------------------------------------------------------------
@@ -1126,13 +1730,16 @@ with tabs[2]:
         else:
             return ['background-color: red' for _ in row]
 
-    # Datos de ejemplo para las modificaciones, usando palomita y tache
-    data_modificaciones = [
-        {"Base SICOIN": "PTCI",         "¿Contiene Datos Suficientes?": "✅", "Modificación a realizar": ""},
-        {"Base SICOIN": "PTAR",         "¿Contiene Datos Suficientes?": "✅", "Modificación a realizar": ""},
-        {"Base SICOIN": "ACTrimestral", "¿Contiene Datos Suficientes?": "❌", "Modificación a realizar": 'Añadir Columna "Detalle del Riesgo"'},
-        {"Base SICOIN": "AMTrimestral", "¿Contiene Datos Suficientes?": "❌", "Modificación a realizar": 'Añadir Columna "Sector"'}
-    ]
+    # Modificaciones derivadas de las reglas de categoría "estructura" (una fila por base)
+    hallazgos_estructura = hallazgos_calidad[(hallazgos_calidad["Categoría"] == "estructura") & (hallazgos_calidad["Registros Afectados"] > 0)]
+    data_modificaciones = []
+    for base in datos_crudos:
+        acciones = hallazgos_estructura.loc[hallazgos_estructura["Hoja"] == base, "Acción Sugerida"].unique()
+        data_modificaciones.append({
+            "Base SICOIN": base,
+            "¿Contiene Datos Suficientes?": "❌" if len(acciones) else "✅",
+            "Modificación a realizar": "; ".join(acciones)
+        })
 
     # Crear el DataFrame para las modificaciones
     df_modificaciones = pd.DataFrame(data_modificaciones)
@@ -1151,6 +1758,32 @@ with tabs[2]:
         st.dataframe(df_modificaciones.style.apply(style_modificaciones, axis=1), use_container_width=True)
 
 
+    # --------------------------------------------------------------------------------
+    # Resumen de todas las reglas de calidad (conteo por regla y hoja, con filas de ejemplo)
+    def style_row_hallazgos(row):
+        if row["Registros Afectados"] == 0:
+            return ['background-color: #c8e6c9'] * len(row)
+        else:
+            return ['background-color: #ffcdd2'] * len(row)
+
+    st.markdown('<p class="section-title">📋 Reglas de Calidad de los Datos</p>', unsafe_allow_html=True)
+    st.markdown("""
+    Las reglas se declaran en el archivo reglas_calidad.toml y se evalúan una sola vez por cada descarga de datos.
+    """)
+
+    with st.expander("Ver Resultado de las Reglas de Calidad"):
+        st.dataframe(hallazgos_calidad.drop(columns=["Valores Detectados"]).style.apply(style_row_hallazgos, axis=1),
+                     use_container_width=True)
+
+    with st.expander("Ver Registros de Ejemplo por Regla"):
+        hallazgos_con_registros = hallazgos_calidad[hallazgos_calidad["Registros Afectados"] > 0]
+        if hallazgos_con_registros.empty:
+            st.success("✅ Ninguna regla de calidad encontró registros.")
+        for _, hallazgo in hallazgos_con_registros.iterrows():
+            st.markdown(f"**{hallazgo['Regla']}** ({hallazgo['Hoja']}): {hallazgo['Registros Afectados']} registro(s)")
+            st.dataframe(muestras_calidad[(hallazgo["Regla"], hallazgo["Hoja"])], use_container_width=True)
+
+
 
     ##########################################
     # BLOQUE 1: Verificación de Acciones de Control (PTAR vs ACTRI)
@@ -1164,76 +1797,12 @@ with tabs[2]:
     ❌ Indica que existe una discrepancia.
     """)
 
-    # Normalización de nombres para agrupación (se utiliza df1 y df2)
-    df1["Institución_N"] = df1["Institución"].apply(normalize_text)
-    df2["Institución_N"] = df2["Institución"].apply(normalize_text)
-
-    # Agrupación en PTAR (tomando el primer valor de AC_Total por institución y año)
-    ptar_group = df1.groupby(["Institución_N", "Año"], as_index=False)["AC_Total"].first()
-
-    # Para ACTRI: total de acciones (conteo) y cantidad de acciones únicas (según clave AC)
-    actri_group_all = df2.groupby(["Institución_N", "Año"], as_index=False).size().rename(columns={"size": "Acciones_ACTRI"})
-    actri_group_unique = df2.groupby(["Institución_N", "Año"], as_index=False)["AC"].nunique().rename(columns={"AC": "Acciones_ACTRI_Unique"})
-
-    # Duplicados en ACTRI
-    dup_count = df2.groupby(["Institución_N", "Año", "AC"], as_index=False).size()
-    dup_entries = dup_count[dup_count["size"] > 1]
-    dup_summary = dup_entries.groupby(["Institución_N", "Año"], as_index=False)["size"].agg({"Cantidad_Duplicados": lambda x: x.sum() - len(x)})
-
-    # Merge de los datos de control
-    control_merge = pd.merge(ptar_group, actri_group_all, on=["Institución_N", "Año"], how="outer")
-    control_merge = pd.merge(control_merge, actri_group_unique, on=["Institución_N", "Año"], how="outer")
-    control_merge = pd.merge(control_merge, dup_summary, on=["Institución_N", "Año"], how="left")
-
-    # Rellenar NaN y convertir a entero
-    control_merge["AC_Total"] = control_merge["AC_Total"].fillna(0).astype(int)
-    control_merge["Acciones_ACTRI"] = control_merge["Acciones_ACTRI"].fillna(0).astype(int)
-    control_merge["Acciones_ACTRI_Unique"] = control_merge["Acciones_ACTRI_Unique"].fillna(0).astype(int)
-    control_merge["Cantidad_Duplicados"] = control_merge["Cantidad_Duplicados"].fillna(0).astype(int)
-
-    # Calcular la diferencia (usando el total vs. el conteo sin duplicados)
-    control_merge["Diferencia"] = control_merge["AC_Total"] - control_merge["Acciones_ACTRI"]
-    control_merge["Duplicado"] = control_merge["Cantidad_Duplicados"].apply(lambda x: "Sí" if x > 0 else "No")
-    control_merge["¿Coincide Eliminando Duplicados?"] = control_merge.apply(
-        lambda row: "✅" if row["AC_Total"] == row["Acciones_ACTRI_Unique"] else "❌",
-        axis=1
-    )
-
-    # Extraer el nombre original de la institución (primer valor por grupo en df1) y hacer merge
-    orig_names = df1.groupby(["Institución_N", "Año"], as_index=False)["Institución"].first()
-    control_merge = pd.merge(orig_names, control_merge, on=["Institución_N", "Año"], how="right")
-
-    # Omitir la columna 'Institución_N'
-    if "Institución_N" in control_merge.columns:
-        control_merge.drop(columns=["Institución_N"], inplace=True)
-
-    # Renombrar columnas a etiquetas amigables
-    control_merge.rename(columns={
-        "AC_Total": "Acciones de Control en PTAR",
-        "Acciones_ACTRI": "Acciones de Control en SISTEMA",
-        "Duplicado": "¿El Sistema Contiene Duplicados?",
-        "Cantidad_Duplicados": "Cantidad de AC Duplicadas",
-        "Acciones_ACTRI_Unique": "Cantidad de AC Eliminando Duplicidad"
-    }, inplace=True)
+    # Casi duplicados en ACTRI (misma acción registrada con otra clave AC y descripción ligeramente distinta)
+    casi_dup_actri = detectar_casi_duplicados(df2, ["Institución", "Año"], "AC")
 
-    # Reordenar columnas según lo solicitado:
-    # (Año, Institución, Acciones de Control en PTAR, Acciones de Control en SISTEMA, Diferencia,
-    #  ¿El Sistema Contiene Duplicados?, Cantidad de AC Duplicadas, Cantidad de AC Eliminando Duplicidad,
-    #  ¿Coincide Eliminando Duplicados?)
-    control_merge = control_merge[[
-        "Año",
-        "Institución",
-        "Acciones de Control en PTAR",
-        "Acciones de Control en SISTEMA",
-        "Diferencia",
-        "¿El Sistema Contiene Duplicados?",
-        "Cantidad de AC Duplicadas",
-        "Cantidad de AC Eliminando Duplicidad",
-        "¿Coincide Eliminando Duplicados?"
-    ]]
-
-    # Ordenar para visualizar
-    control_merge.sort_values(["Año", "Institución"], inplace=True)
+    # Cruce PTAR vs ACTRI con la consulta preparada del motor SQL (clave: nombre del PEF sugerido por el emparejamiento difuso):
+    # AC_Total del PTAR, acciones en el sistema, únicas, duplicadas y casi duplicadas por institución y año (agregados.py)
+    control_merge = agregados.conciliacion_control(motor, casi_dup_actri, emparejamiento)
 
     # Primer expander: Tabla completa de análisis (aplicando estilo a la fila completa)
     with st.expander("Ver Análisis Completo de Acciones de Control"):
@@ -1241,8 +1810,7 @@ with tabs[2]:
                      use_container_width=True)
 
     # Segundo expander: Resumen de Claves de Acción Duplicadas en ACTRI (con nombres reales y filas en rojo)
-    dup_ac_counts = df2.groupby(['Institución', 'Año', 'AC'], as_index=False).size()
-    dup_ac_counts = dup_ac_counts[dup_ac_counts['size'] > 1]
+    dup_ac_counts = motor_consultas.consultar(motor, "duplicados_ac")
     with st.expander("Resumen de Claves de Acción Duplicadas en ACTRI"):
         if not dup_ac_counts.empty:
             dup_ac_counts.rename(columns={
@@ -1254,6 +1822,14 @@ with tabs[2]:
         else:
             st.success("✅ No se encontraron claves de acción duplicadas en ACTRI.")
 
+    # Expander adicional: Acciones con descripción casi idéntica registradas bajo otra clave AC
+    with st.expander("Resumen de Posibles Acciones de Control Duplicadas con Otra Clave (Descripción Similar)"):
+        if not casi_dup_actri.empty:
+            st.dataframe(casi_dup_actri.style.apply(style_row_dup, axis=1),
+                         use_container_width=True)
+        else:
+            st.success("✅ No se encontraron acciones de control con descripción similar bajo otra clave.")
+
     # Tercer expander: Registros con discrepancia, renombrado a "Ver Registros con Discrepancia Aún Después de Eliminar Duplicados"
     no_coincidencia = control_merge[control_merge["¿Coincide Eliminando Duplicados?"] == "❌"]
     with st.expander("Ver Registros con Discrepancia Aún Después de Eliminar Duplicados"):
@@ -1282,44 +1858,12 @@ with tabs[2]:
 
     """)
 
-    # Normalización de nombres
-    df3["Institución_N"] = df3["Institución"].apply(normalize_text)
-    df4["Institución_N"] = df4["Institución"].apply(normalize_text)
-
-    # Agrupar en PTCI (tomando el primer valor de TotalAcciones_de_Mejora_Programa_Actualizado)
-    ptci_group = df3.groupby(["Institución_N", "Año"], as_index=False)["TotalAcciones_de_Mejora_Programa_Actualizado"].first()
-
-    # Filtrar AMTRI solo para el trimestre 4 y agrupar (conteo de registros)
-    amtri_filtered = df4[df4["Trimestre"] == 4]
-    amtri_group = amtri_filtered.groupby(["Institución_N", "Año"], as_index=False).size().rename(columns={"size": "Acciones_AMTRI"})
-
-    # Merge para comparar
-    mejora_merge = pd.merge(ptci_group, amtri_group, on=["Institución_N", "Año"], how="outer")
-    mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"] = mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"].fillna(0).astype(int)
-    mejora_merge["Acciones_AMTRI"] = mejora_merge["Acciones_AMTRI"].fillna(0).astype(int)
-    mejora_merge["Diferencia"] = mejora_merge["TotalAcciones_de_Mejora_Programa_Actualizado"] - mejora_merge["Acciones_AMTRI"]
-
-    # Agregar el nombre original de la institución (desde df3) y eliminar la columna normalizada
-    orig_names_ptci = df3.groupby(["Institución_N", "Año"], as_index=False)["Institución"].first()
-    mejora_merge = pd.merge(orig_names_ptci, mejora_merge, on=["Institución_N", "Año"], how="right")
-    if "Institución_N" in mejora_merge.columns:
-        mejora_merge.drop(columns=["Institución_N"], inplace=True)
-
-    # Renombrar columnas a etiquetas amigables
-    mejora_merge.rename(columns={
-        "TotalAcciones_de_Mejora_Programa_Actualizado": "Acciones de Mejora en PTCI",
-        "Acciones_AMTRI": "Acciones de Mejora en SISTEMA"
-    }, inplace=True)
+    # Casi duplicados en AMTRI (se compara dentro de cada Institución, Año y Trimestre porque cada AM se repite por trimestre)
+    casi_dup_amtri = detectar_casi_duplicados(df4, ["Institución", "Año", "Trimestre"], "AM")
 
-    # Reordenar columnas: (Año, Institución, Acciones de Mejora en PTCI, Acciones de Mejora en SISTEMA, Diferencia)
-    mejora_merge = mejora_merge[[
-        "Año",
-        "Institución",
-        "Acciones de Mejora en PTCI",
-        "Acciones de Mejora en SISTEMA",
-        "Diferencia"
-    ]]
-    mejora_merge.sort_values(["Año", "Institución"], inplace=True)
+    # Cruce PTCI (primer valor de TotalAcciones_de_Mejora_Programa_Actualizado) vs AMTRI (conteo de registros del trimestre 4)
+    # con la consulta preparada del motor SQL (clave: emparejamiento difuso contra el PEF); ver agregados.py
+    mejora_merge = agregados.conciliacion_mejora(motor, casi_dup_amtri, emparejamiento)
 
     with st.expander("Ver Análisis de Acciones de Mejora"):
         if not mejora_merge.empty:
@@ -1328,6 +1872,233 @@ with tabs[2]:
         else:
             st.success("✅ No se encontraron discrepancias en las acciones de mejora.")
 
+    with st.expander("Resumen de Posibles Acciones de Mejora Duplicadas con Otra Clave (Descripción Similar)"):
+        if not casi_dup_amtri.empty:
+            st.dataframe(casi_dup_amtri.style.apply(style_row_dup, axis=1),
+                         use_container_width=True)
+        else:
+            st.success("✅ No se encontraron acciones de mejora con descripción similar bajo otra clave.")
+
+
+    ##########################################
+    # BLOQUE 3: Brecha entre el avance reportado por la institución y el validado por el OIC (ACTRI y AMTRI)
+    ##########################################
+    st.markdown('<p class="section-title">📏 Brecha entre el Avance Reportado por la Institución y el Validado por el OIC</p>', unsafe_allow_html=True)
+    st.markdown("""
+    Para cada acción de control (ACTRI) y de mejora (AMTRI) se calcula la brecha **Avance Institución − Avance OIC**.
+    Una brecha positiva indica **sobrerreporte**: la institución reporta más avance del que valida el OIC.
+    """)
+
+    brechas_acciones, brechas_grupos = calcular_brechas_avance(df2, df4)
+
+    @st.fragment
+    def seccion_brechas_avance():
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            hojas_brecha = st.multiselect("Acciones", ["ACTRI", "AMTRI"], default=["ACTRI", "AMTRI"], key="hojas_brecha",
+                                          format_func={"ACTRI": "De Control (ACTRI)", "AMTRI": "De Mejora (AMTRI)"}.get)
+        with col2:
+            año_brecha = st.selectbox("Año", ["Todos"] + sorted(brechas_grupos["Año"].dropna().unique().tolist()), key="año_brecha")
+        with col3:
+            trimestre_brecha = st.selectbox("Trimestre (solo AMTRI)", ["Todos"] + sorted(brechas_grupos["Trimestre"].dropna().unique().tolist()),
+                                            key="trimestre_brecha")
+
+        grupos = filtrar_brechas(brechas_grupos, hojas_brecha, año_brecha, trimestre_brecha)
+        acciones = filtrar_brechas(brechas_acciones, hojas_brecha, año_brecha, trimestre_brecha)
+        if acciones.empty:
+            st.info("No hay acciones con ambos avances capturados para los filtros seleccionados.")
+            return
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Acciones Comparadas", f"{len(acciones):,}")
+        col2.metric("Brecha Promedio", f"{acciones['Brecha'].mean():.2f}")
+        col3.metric("% de Sobrerreporte", f"{(acciones['Brecha'] > 0).mean() * 100:.1f}%")
+        col4.metric("% sin Brecha", f"{(acciones['Brecha'] == 0).mean() * 100:.1f}%")
+
+        fig_brechas = px.histogram(acciones, x="Brecha", color="Hoja", nbins=40, barmode="overlay",
+                                   color_discrete_map={"ACTRI": "#621132", "AMTRI": "#BC955C"},
+                                   labels={"Brecha": "Brecha (Avance Institución − Avance OIC)", "count": "Acciones"})
+        fig_brechas.update_layout(yaxis_title="Acciones", height=350, margin=dict(t=30, b=30))
+        st.plotly_chart(fig_brechas, use_container_width=True)
+
+        with st.expander("Ver Brecha por Sector"):
+            st.dataframe(resumir_brechas(grupos, ["Sector"]), hide_index=True, use_container_width=True)
+        with st.expander("Ver Brecha por Institución"):
+            st.dataframe(resumir_brechas(grupos, ["Institución", "Sector"]), hide_index=True, use_container_width=True)
+        with st.expander(f"Ver las {RESULTADOS_BRECHAS} Acciones con Mayor Brecha"):
+            mayores = acciones.iloc[np.argsort(-acciones["Brecha"].abs().to_numpy(), kind="stable")[:RESULTADOS_BRECHAS]]
+            st.dataframe(mayores, hide_index=True, use_container_width=True)
+    seccion_brechas_avance()
+
+
+    ##########################################
+    # BLOQUE 4: Trayectoria trimestral de las acciones de mejora (AMTRI)
+    ##########################################
+    st.markdown('<p class="section-title">📉 Trayectoria Trimestral de las Acciones de Mejora (AMTRI)</p>', unsafe_allow_html=True)
+    trimestres_estancada = trimestres_estancada_configurados()
+    st.markdown(f"""
+    Cada acción de mejora se sigue del Trimestre 1 al 4 con su avance reportado por la institución y el validado por el OIC.
+    Se marcan las acciones con **retroceso** (algún avance baja respecto al trimestre anterior), las **estancadas**
+    (el avance de la institución no sube en {trimestres_estancada} o más trimestres, contando los trimestres sin reporte
+    hasta el más reciente del año) y las **vencidas**
+    (su Fecha de Término ya pasó y no están al {AVANCE_COMPLETO}%).
+    """)
+
+    trayectorias_amtri = calcular_trayectorias_amtri(df4, pd.Timestamp.today().normalize(), trimestres_estancada)
+
+    @st.fragment
+    def seccion_trayectorias_amtri():
+        if trayectorias_amtri.empty:
+            st.info("No hay acciones de mejora con avances trimestrales para analizar.")
+            return
+        años_trayectoria = sorted(trayectorias_amtri["Año"].dropna().unique().tolist(), reverse=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            año_trayectoria = st.selectbox("Año", ["Todos"] + años_trayectoria, index=1 if años_trayectoria else 0, key="año_trayectoria")
+        with col2:
+            sector_trayectoria = st.selectbox("Sector", ["Todos"] + sorted(trayectorias_amtri["Sector"].dropna().unique().tolist()),
+                                              key="sector_trayectoria")
+        with col3:
+            alerta_trayectoria = st.selectbox("Mostrar", ["Con alguna alerta"] + ALERTAS_TRAYECTORIA + ["Todas"], key="alerta_trayectoria")
+
+        mascara = pd.Series(True, index=trayectorias_amtri.index)
+        if año_trayectoria != "Todos":
+            mascara &= (trayectorias_amtri["Año"] == año_trayectoria).fillna(False)
+        if sector_trayectoria != "Todos":
+            mascara &= trayectorias_amtri["Sector"] == sector_trayectoria
+        seleccion = trayectorias_amtri[mascara]
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Acciones de Mejora", f"{len(seleccion):,}")
+        col2.metric("Con Retroceso", f"{int(seleccion['Retroceso'].sum()):,}")
+        col3.metric("Estancadas", f"{int(seleccion['Estancada'].sum()):,}")
+        col4.metric("Vencidas sin Concluir", f"{int(seleccion['Vencida'].sum()):,}")
+
+        with st.expander("Ver Alertas por Institución"):
+            st.dataframe(resumir_trayectorias(seleccion), hide_index=True, use_container_width=True)
+
+        if alerta_trayectoria == "Con alguna alerta":
+            seleccion = seleccion[seleccion[ALERTAS_TRAYECTORIA].any(axis=1)]
+        elif alerta_trayectoria != "Todas":
+            seleccion = seleccion[seleccion[alerta_trayectoria]]
+        if seleccion.empty:
+            st.success("Ninguna acción de mejora cumple el criterio seleccionado.")
+            return
+        # Tabla ordenable (clic en el encabezado); por defecto las vencidas primero y después las de menor avance
+        seleccion = seleccion.sort_values(["Vencida", "Avance Actual", "Institución", "AM"], ascending=[False, True, True, True], ignore_index=True)
+        st.dataframe(seleccion, hide_index=True, use_container_width=True,
+                     column_config={"Fecha_Termino": st.column_config.DateColumn("Fecha_Termino", format="DD/MM/YYYY"),
+                                    "Año": st.column_config.NumberColumn("Año", format="%d")})
+    seccion_trayectorias_amtri()
+
+
+    ##########################################
+    # BLOQUE 5: Cambios entre actualizaciones (historial de cortes)
+    ##########################################
+    st.markdown('<p class="section-title">📋 Cambios Entre Actualizaciones de las Bases del SICOIN</p>', unsafe_allow_html=True)
+
+    cortes_comparables = list(cortes_historial)
+    if len(cortes_comparables) < 2:
+        st.info("Aún no hay dos cortes en el historial para comparar (se guarda un corte en cada actualización con cambios).")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            corte_anterior = st.selectbox("Corte Anterior", cortes_comparables, index=1, key="corte_anterior",
+                                          format_func=lambda id_corte: cortes_historial[id_corte])
+        with col2:
+            corte_posterior = st.selectbox("Corte Posterior", cortes_comparables, index=0, key="corte_posterior",
+                                           format_func=lambda id_corte: cortes_historial[id_corte])
+
+        # Cruce por hash de clave sobre las firmas de cada hoja; solo se leen del historial las filas que cambiaron
+        cambios_cortes = comparar_cortes_historial(corte_anterior, corte_posterior)
+        st.dataframe(historial_datos.resumen_cambios(cambios_cortes), hide_index=True, use_container_width=True)
+        for hoja, cambios_hoja in cambios_cortes.items():
+            if not cambios_hoja.empty:
+                with st.expander(f"Ver Cambios en {hoja} ({len(cambios_hoja)} filas)"):
+                    st.dataframe(detalle_cortes_historial(corte_anterior, corte_posterior, hoja), hide_index=True, use_container_width=True)
+                    if len(cambios_hoja) > historial_datos.FILAS_DETALLE:
+                        st.caption(f"Se muestran las primeras {historial_datos.FILAS_DETALLE} filas con cambios.")
+
+
+    ##########################################
+    # BLOQUE 6: Bandeja de alertas (discrepancias nuevas y resueltas en cada actualización)
+    ##########################################
+    st.markdown('<p class="section-title">📋 Bandeja de Alertas de Discrepancias</p>', unsafe_allow_html=True)
+
+    if not configuracion_alertas_app()["activo"]:
+        st.info("Las alertas de discrepancias están desactivadas ([alertas] activo = false en los secrets).")
+    else:
+        eventos_alertas, discrepancias_abiertas = bandeja_alertas(marca_bandeja())
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Discrepancias Abiertas", len(discrepancias_abiertas))
+        col2.metric("Nuevas (Recientes)", int((eventos_alertas["Evento"] == "Nueva").sum()))
+        col3.metric("Resueltas (Recientes)", int((eventos_alertas["Evento"] == "Resuelta").sum()))
+        if eventos_alertas.empty:
+            st.info("Aún no se han publicado alertas (se revisan todas las instituciones en cada actualización de las bases).")
+        else:
+            st.dataframe(eventos_alertas, hide_index=True, use_container_width=True,
+                         column_config={"Año": st.column_config.NumberColumn("Año", format="%d")})
+        with st.expander(f"Ver Discrepancias Abiertas ({len(discrepancias_abiertas)})"):
+            st.dataframe(discrepancias_abiertas, hide_index=True, use_container_width=True,
+                         column_config={"Año": st.column_config.NumberColumn("Año", format="%d")})
+
+
+    # Efectividad del caché de vistas compartido entre sesiones (aciertos, fallos y memoria por vista)
+    # Bytes de HTML que envía cada tabla o tarjeta (último y máximo en el proceso) contra el presupuesto configurado
+    with st.expander(f"Ver Tamaño del HTML por Vista (presupuesto {presupuesto_html // 1024} KB)"):
+        st.dataframe(pd.DataFrame([{"Vista": vista, "KB Último": round(registro["Último"] / 1024, 1), "KB Máximo": round(registro["Máximo"] / 1024, 1),
+                                    "Veces Excedido": registro["Excedido"]} for vista, registro in sorted(tamaños_html().items())],
+                                  columns=["Vista", "KB Último", "KB Máximo", "Veces Excedido"]),
+                     hide_index=True, use_container_width=True)
+
+    with st.expander("Ver Estadísticas del Caché de Vistas Compartido"):
+        estadisticas_cache = cache_vistas.estadisticas(cache_vistas_app())
+        por_vista = estadisticas_cache.pop("Por Vista")
+        precalentamientos = estadisticas_cache.pop("Precalentamientos")
+        st.dataframe(pd.DataFrame([estadisticas_cache]), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame([{"Vista": vista, "Entradas": entradas, "KB": round(tamaño / 1024, 1)}
+                                   for vista, (entradas, tamaño) in sorted(por_vista.items())]),
+                     hide_index=True, use_container_width=True)
+        if precalentamientos:
+            st.markdown("**Precalentamientos al cargar cada snapshot** (el más reciente primero)")
+            st.dataframe(pd.DataFrame(precalentamientos), hide_index=True, use_container_width=True)
+
+    # Memoria del proceso: hojas crudas y limpias, cachés de Streamlit, sesiones activas y RSS a lo largo del tiempo
+    with st.expander("Ver Uso de Memoria del Proceso"):
+        monitor = monitor_memoria()
+        memoria.muestrear(monitor)
+        rss = memoria.historial_rss(monitor)
+        st.markdown(f"**Memoria residente del proceso:** {rss['MB RSS'].iloc[-1] if not rss.empty else 'no disponible'} MB")
+        if len(rss) > 1:
+            st.line_chart(rss, x="Momento", y="MB RSS", height=200)
+
+        st.markdown("**Hojas cargadas** (memory_usage con deep=True)")
+        st.dataframe(memoria.memoria_hojas(datos_crudos, datos_limpios), hide_index=True, use_container_width=True)
+        # None: Streamlit no permitió leer el dato (ver memoria.py); se indica en lugar de mostrar una tabla vacía
+        def tabla_memoria(tabla):
+            if tabla is None:
+                st.markdown("_No disponible_")
+            else:
+                st.dataframe(tabla, hide_index=True, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**st.cache_resource** (MB estimados)")
+            tabla_memoria(memoria.entradas_cache_resource())
+        with col2:
+            st.markdown("**st.cache_data** (MB serializados)")
+            tabla_memoria(memoria.entradas_cache_data())
+        sesiones = memoria.sesiones_activas()
+        st.markdown(f"**Sesiones activas:** {sesiones if sesiones is not None else 'no disponible'} (session_state por sesión)")
+        tabla_memoria(memoria.memoria_sesiones())
+
+        ahorro = ahorro_deduplicacion_app(motor["version"])
+        estado_deduplicacion = "activa" if deduplicar_textos else "inactiva; se activa con deduplicar = true en [memoria]"
+        st.markdown(f"**Deduplicación de textos repetidos** ({estado_deduplicacion}): "
+                    f"{ahorro['KB Ahorrados'].sum() / 1024:.2f} MB {'ahorrados' if deduplicar_textos else 'que se ahorrarían'}")
+        if not ahorro.empty:
+            st.dataframe(ahorro, hide_index=True, use_container_width=True)
+
 
     ##########################################
     # Resumen Final de los Análisis
@@ -1335,12 +2106,434 @@ with tabs[2]:
     st.markdown("""
     ---
     ### Resumen General de Análisis
-    - **Cantidad de Registros de Prueba que aparecen en las bases de datos (eliminar estos registros):** 2
-      - Institución de Prueba
-      - Instituto de Tamaulipas Demo
+    - **Cantidad de Registros de Prueba que aparecen en las bases de datos (eliminar estos registros):** {0}{1}
 
     *Nota: Los valores numéricos anteriores son los resultados obtenidos de la consolidación real de las bases de datos.*
+    """.format(len(registros_prueba), "".join(f"\n      - {nombre}" for nombre in registros_prueba)), unsafe_allow_html=True)
+
+
+
+
+###########################################################
+###########################################################
+###########################################################
+# 4. PESTAÑA COMPARATIVO SECTORIAL
+###########################################################
+###########################################################
+###########################################################
+
+
+#====================================== MATRIZ COMPARATIVA PRE CALCULADA (UNA SOLA VEZ POR SNAPSHOT) ==============================================
+# Se calcula con un único groupby sobre df1 (PTAR) y df3 (PTCI) para todos los sectores y años a la vez;
+# al cambiar de sector o año solo se filtra esta tabla pequeña (una fila por Institución y Año).
+cumplimiento_cols = [f"{t}Cumplimiento" for t in trimestres]
+
+@st.cache_data(show_spinner=False)
+def precompute_comparativo_sectorial(df_ptar, df_ptci):
+    # Columnas numéricas del PTAR que se comparan entre instituciones
+    columnas_ptar = [c for c in risk_cols + cuadrante_cols + ["Riesgos_Totales", "AC_Total"] + cumplimiento_cols if c in df_ptar.columns]
+
+    # Se convierten a número una sola vez (las hojas llegan como objeto)
+    ptar = df_ptar[["Sector", "Año", "Institución"]].copy()
+    ptar[columnas_ptar] = df_ptar[columnas_ptar].apply(pd.to_numeric, errors='coerce')
+    ptar["Institución_N"] = ptar["Institución"].map(normalize_text)
+
+    # Conteos se suman y el cumplimiento se promedia (igual que en generate_dashboard)
+    agregaciones = {c: ("mean" if c in cumplimiento_cols else "sum") for c in columnas_ptar}
+    agregaciones["Institución"] = "first"
+    matriz = ptar.groupby(["Sector", "Año", "Institución_N"], as_index=False).agg(agregaciones)
+
+    # Distribución por cuadrante (I-IV) en porcentaje del total de riesgos de la institución
+    total_cuadrante = matriz[cuadrante_cols].sum(axis=1).replace(0, np.nan)
+    for col in cuadrante_cols:
+        matriz[f"%{col}"] = (matriz[col] / total_cuadrante * 100).round(2).fillna(0)
+
+    # Cumplimiento promedio anual (promedio de los cuatro trimestres)
+    matriz["Cumplimiento_Promedio"] = matriz[cumplimiento_cols].mean(axis=1).round(2)
+
+    # Cumplimiento de las NGCI desde el PTCI (una fila por Institución y Año)
+    ptci = df_ptci[["Institución", "Año"]].copy()
+    ptci["Institución_N"] = ptci["Institución"].map(normalize_text)
+    ptci["Cumplimiento_General_de_las_NGCI"] = pd.to_numeric(df_ptci["Cumplimiento_General_de_las_NGCI"], errors='coerce')
+    ngci = ptci.groupby(["Institución_N", "Año"], as_index=False)["Cumplimiento_General_de_las_NGCI"].first()
+    matriz = pd.merge(matriz, ngci, on=["Institución_N", "Año"], how="left")
+
+    return matriz.drop(columns=["Institución_N"])
+
+
+#---- Pestaña COMPARATIVO SECTORIAL
+with tabs[3], metricas.cronometro("sicoin_pestana_segundos", pestana="COMPARATIVO SECTORIAL"):
+
+    matriz_comparativa = precompute_comparativo_sectorial(df1, df3)
+
+    st.markdown("""
+      <div class='sc-titulo'>
+        Comparativo de las Instituciones del Sector
+      </div>
     """, unsafe_allow_html=True)
 
+    #------------- Filtros propios de la pestaña (por defecto toman el sector y año de la cabecera) --------------
+    col1, col2 = st.columns(2)
+    with col1:
+        sector_default = sector_list.index(sector) if sector in sector_list else 0
+        sector_comparativo = st.selectbox("Sector a Comparar", sector_list, index=sector_default, key="sector_comparativo")
+    with col2:
+        years_comparativo = years_by_sector.get(sector_comparativo, [])
+        year_default = years_comparativo.index(year) if year in years_comparativo else max(len(years_comparativo) - 1, 0)
+        year_comparativo = st.selectbox("Año a Comparar", years_comparativo, index=year_default, key="year_comparativo")
+
+    comparativo = matriz_comparativa[(matriz_comparativa["Sector"] == sector_comparativo) & (matriz_comparativa["Año"] == year_comparativo)]
+
+    if comparativo.empty:
+        st.markdown("No hay datos para comparar con los filtros seleccionados.")
+    else:
+        #-------------- Parte 1: Mapa de calor Institución x Variable ------------#
+        matrices_heatmap = {
+            "Clasificación de Riesgos": risk_cols,
+            "Cuadrante (% de Riesgos)": [f"%{c}" for c in cuadrante_cols],
+            "Cumplimiento por Trimestre y NGCI": cumplimiento_cols + ["Cumplimiento_General_de_las_NGCI"]
+        }
+        vista_heatmap = st.radio("Variable del Mapa de Calor", list(matrices_heatmap), horizontal=True, key="vista_heatmap")
+        heatmap_cols = [c for c in matrices_heatmap[vista_heatmap] if c in comparativo.columns]
+
+        fig_heatmap = px.imshow(
+            comparativo.set_index("Institución")[heatmap_cols],
+            text_auto=True,
+            aspect="auto",
+            color_continuous_scale=["#ffffff", "#621132"],
+            height=max(300, 35 * len(comparativo) + 150)
+        )
+        fig_heatmap.update_layout(
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            font=dict(color='#333'),
+            xaxis=dict(title=None, side='top'),
+            yaxis=dict(title=None),
+            margin=dict(l=20, r=20, t=50, b=20)
+        )
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+
+        #-------------- Parte 2: Tabla ordenable con ranking ------------#
+        friendly_comparativo = {
+            "Riesgos_Totales": "Total de Riesgos",
+            "AC_Total": "Total de Acciones de Control",
+            "%I": "% Cuadrante I", "%II": "% Cuadrante II", "%III": "% Cuadrante III", "%IV": "% Cuadrante IV",
+            "1Cumplimiento": "% Cumplimiento T1", "2Cumplimiento": "% Cumplimiento T2",
+            "3Cumplimiento": "% Cumplimiento T3", "4Cumplimiento": "% Cumplimiento T4",
+            "Cumplimiento_Promedio": "% Cumplimiento Promedio",
+            "Cumplimiento_General_de_las_NGCI": "Cumplimiento General NGCI"
+        }
+        ranking_cols = [c for c in friendly_comparativo if c in comparativo.columns]
+
+        col1, col2 = st.columns(2)
+        with col1:
+            ranking_por = st.selectbox("Ordenar Ranking por", ranking_cols, format_func=lambda c: friendly_comparativo[c],
+                                       index=ranking_cols.index("Cumplimiento_Promedio"), key="ranking_por")
+        with col2:
+            ranking_asc = st.radio("Orden", ["Mayor a menor", "Menor a mayor"], horizontal=True, key="ranking_orden") == "Menor a mayor"
+
+        tabla_comparativa = comparativo.drop(columns=["Sector"]).copy()
+        tabla_comparativa.insert(0, "Ranking", tabla_comparativa[ranking_por].rank(method="min", ascending=ranking_asc).astype("Int64"))
+        tabla_comparativa = tabla_comparativa.sort_values("Ranking")
+        tabla_comparativa = tabla_comparativa[["Ranking", "Institución", "Año"] + ranking_cols + [c for c in risk_cols + cuadrante_cols if c in tabla_comparativa.columns]]
+
+        st.dataframe(tabla_comparativa.rename(columns=friendly_comparativo), use_container_width=True, hide_index=True)
+
+#============================================= PIE DE PÁGINA DE LA SECCION COMPARATIVO - FUENTE SICOIN ==============================================
+    st.markdown("""
+      <div class='sc-fuente'>
+        Fuente: Sistema de Control Interno (SICOIN)
+      </div>
+    """, unsafe_allow_html=True)
+
+
+
+
+###########################################################
+###########################################################
+###########################################################
+# 5. PESTAÑA GRUPOS
+###########################################################
+###########################################################
+###########################################################
+
+
+#====================================== CUBO POR INSTITUCIÓN Y AÑO (UNA SOLA VEZ POR SNAPSHOT) ==============================================
+# La cabecera filtra una sola Institución o un solo Sector y un Año. Para ver grupos arbitrarios (varios sectores en varios años o un
+# conjunto de instituciones) se guarda una fila por Institución y Año con las medidas del PTAR y del PTCI ya sumadas; cualquier
+# selección se responde sumando las filas del cubo que le corresponden, sin volver a filtrar las hojas.
+# Los conteos se suman; el Cumplimiento (promedio por fila, como en generate_dashboard) se guarda como suma y número de filas,
+# de modo que el promedio de cualquier grupo es la suma de las sumas entre la suma de las filas (promedio reponderado).
+medidas_ptar = risk_cols + cuadrante_cols + estrategia_cols + ["AC_Total", "Riesgos_Totales"] + \
+               [f"{t}{estado}" for t in trimestres for estado in estados]
+medidas_ptci = [f"{t}{estado}" for t in trimestres for estado in estados] + \
+               ["Acciones_de_Mejora_Programa_Original", "TotalAcciones_de_Mejora_Programa_Actualizado"]
+
+def sumas_por_institucion(df, medidas, prefijo):
+    # Suma de cada medida (NaN como 0) y filas por Institución y Año
+    base = df[["Institución", "Año", "Sector", "Siglas"]].copy() if "Siglas" in df.columns else df[["Institución", "Año", "Sector"]].assign(Siglas="")
+    columnas = [c for c in medidas if c in df.columns]
+    base[[prefijo + c for c in columnas]] = df[columnas].apply(pd.to_numeric, errors='coerce').fillna(0)
+    base[prefijo + "Filas"] = 1
+    agregaciones = {prefijo + c: "sum" for c in columnas + ["Filas"]}
+    agregaciones.update({"Sector": "first", "Siglas": "first"})
+    return base.dropna(subset=["Año"]).groupby(["Institución", "Año"], as_index=False).agg(agregaciones)
+
+@st.cache_data(show_spinner=False)
+def precompute_cubo_grupos(df_ptar, df_ptci):
+    ptar = sumas_por_institucion(df_ptar, medidas_ptar, "PTAR_")
+    ptci = sumas_por_institucion(df_ptci, medidas_ptci, "PTCI_")
+    cubo = pd.merge(ptar, ptci, on=["Institución", "Año"], how="outer", suffixes=("", "_ptci"))
+    cubo["Sector"] = cubo["Sector"].fillna(cubo.pop("Sector_ptci"))
+    cubo["Siglas"] = cubo["Siglas"].fillna(cubo.pop("Siglas_ptci"))
+    medidas = [c for c in cubo.columns if c.startswith(("PTAR_", "PTCI_"))]
+    cubo[medidas] = cubo[medidas].fillna(0)
+    cubo["Año"] = cubo["Año"].astype(int)
+    return cubo
+
+def seleccionar_cubo(cubo, instituciones, sectores, años):
+    # Una lista vacía no filtra (equivale a todas)
+    mascara = pd.Series(True, index=cubo.index)
+    if instituciones:
+        mascara &= cubo["Institución"].isin(instituciones)
+    if sectores:
+        mascara &= cubo["Sector"].isin(sectores)
+    if años:
+        mascara &= cubo["Año"].isin(años)
+    return cubo[mascara]
+
+def componer_cubo(filas, prefijo):
+    # Medidas del grupo: conteos sumados y Cumplimiento reponderado por el número de filas de cada Institución y Año
+    sumas = filas[[c for c in filas.columns if c.startswith(prefijo)]].sum()
+    data = {c[len(prefijo):]: sumas[c] for c in sumas.index if c != prefijo + "Filas"}
+    for t in trimestres:
+        clave = f"{t}Cumplimiento"
+        data[clave] = data.get(clave, 0) / sumas[prefijo + "Filas"] if sumas[prefijo + "Filas"] else 0
+    return data
+
+def resumir_cubo(filas, por):
+    # Tabla del grupo desglosada (p. ej. por Sector y Año) con las mismas reglas que componer_cubo
+    sumas = filas.groupby(por, as_index=False)[[c for c in filas.columns if c.startswith(("PTAR_", "PTCI_"))]].sum()
+    tabla = sumas[por].assign(Instituciones=filas.groupby(por)["Institución"].nunique().to_numpy(),
+                              **{"Acciones de Control": sumas["PTAR_AC_Total"], "Riesgos": sumas["PTAR_Riesgos_Totales"],
+                                 "Acciones de Mejora (Programa Actualizado)": sumas["PTCI_TotalAcciones_de_Mejora_Programa_Actualizado"]})
+    for t in trimestres:
+        tabla[f"% Cumplimiento PTAR T{t}"] = (sumas[f"PTAR_{t}Cumplimiento"] / sumas["PTAR_Filas"].replace(0, np.nan)).round(2)
+    for t in trimestres:
+        tabla[f"% Cumplimiento PTCI T{t}"] = (sumas[f"PTCI_{t}Cumplimiento"] / sumas["PTCI_Filas"].replace(0, np.nan)).round(2)
+    return tabla
+
+
+#---- Pestaña GRUPOS
+with tabs[4], metricas.cronometro("sicoin_pestana_segundos", pestana="GRUPOS"):
+
+    cubo_grupos = precompute_cubo_grupos(df1, df3)
+
+    st.markdown("""
+      <div class='sc-titulo'>
+        Indicadores de Grupos de Instituciones, Sectores y Años
+      </div>
+    """, unsafe_allow_html=True)
+
+    # Fragmento: cambiar el grupo solo vuelve a ejecutar esta pestaña (no toda la página)
+    @st.fragment
+    def seccion_grupos():
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sectores_grupo = st.multiselect("Sectores", sector_list, key="sectores_grupo", placeholder="Todos")
+        with col2:
+            opciones_instituciones = sorted(seleccionar_cubo(cubo_grupos, [], sectores_grupo, [])["Institución"].unique())
+            instituciones_grupo = st.multiselect("Instituciones", opciones_instituciones, key="instituciones_grupo", placeholder="Todas")
+        with col3:
+            años_grupo = st.multiselect("Años", sorted(cubo_grupos["Año"].unique().tolist()), key="años_grupo", placeholder="Todos")
+
+        filas_grupo = seleccionar_cubo(cubo_grupos, instituciones_grupo, sectores_grupo, años_grupo)
+        if filas_grupo.empty:
+            st.markdown("No hay datos para el grupo seleccionado.")
+            return
+
+        st.markdown(f"""
+        <div class='sc-tarjeta'>
+          <h3>
+            Sectores: {", ".join(sorted(filas_grupo["Sector"].dropna().unique()))}<br>
+            Instituciones: {filas_grupo["Institución"].nunique()}<br>
+            Años: {", ".join(str(a) for a in sorted(filas_grupo["Año"].unique()))}
+          </h3>
+        </div>
+        """, unsafe_allow_html=True)
+
+        def titulo_seccion(texto):
+            st.markdown(f"""
+              <div class='sc-titulo'>
+                {texto}
+              </div>
+            """, unsafe_allow_html=True)
+
+        #-------------- Parte 1: Indicadores y tablas del PTAR del grupo (mismas vistas que la pestaña PTAR) ------------#
+        data_grupo = {clave: (round(valor, 2) if clave.endswith("Cumplimiento") else int(round(valor)))
+                      for clave, valor in componer_cubo(filas_grupo, "PTAR_").items()}
+        stats_grupo, risk_grupo, cuadrante_grupo, estrategia_grupo = construir_indicadores_ptar(data_grupo)
+        mostrar_html(stats_grupo, "grupos_indicadores")
+        titulo_seccion("Clasificación de Riesgos")
+        mostrar_html(risk_grupo, "grupos_riesgos")
+        col1, col2 = st.columns(2)
+        with col1:
+            titulo_seccion("Cuadrante")
+            mostrar_html(cuadrante_grupo, "grupos_cuadrante")
+        with col2:
+            titulo_seccion("Estrategia")
+            mostrar_html(estrategia_grupo, "grupos_estrategia")
+        titulo_seccion("Seguimiento de las Acciones de Control del Grupo")
+        st.plotly_chart(construir_grafica_acciones(data_grupo), use_container_width=True, key="grafica_acciones_grupo")
+
+        #-------------- Parte 2: Seguimiento de las Acciones de Mejora del grupo (PTCI) ------------#
+        titulo_seccion("Seguimiento de las Acciones de Mejora del Grupo")
+        data_mejora_grupo = {clave: int(round(valor)) for clave, valor in componer_cubo(filas_grupo, "PTCI_").items()}
+        st.plotly_chart(construir_grafica_mejora(data_mejora_grupo), use_container_width=True, key="grafica_mejora_grupo")
+
+        #-------------- Parte 3: Desglose del grupo por Sector y Año ------------#
+        with st.expander("Ver Desglose del Grupo por Sector y Año"):
+            st.dataframe(resumir_cubo(filas_grupo, ["Sector", "Año"]), hide_index=True, use_container_width=True)
+        with st.expander("Ver Desglose del Grupo por Institución y Año"):
+            st.dataframe(resumir_cubo(filas_grupo, ["Institución", "Año"]), hide_index=True, use_container_width=True)
+    seccion_grupos()
+
+#============================================= PIE DE PÁGINA DE LA SECCION GRUPOS - FUENTE SICOIN ==============================================
+    st.markdown("""
+      <div class='sc-fuente'>
+        Fuente: Sistema de Control Interno (SICOIN)
+      </div>
+    """, unsafe_allow_html=True)
+
+
+
+
+###########################################################
+###########################################################
+###########################################################
+# 6. PESTAÑA BÚSQUEDA
+###########################################################
+###########################################################
+###########################################################
+
+
+#====================================== ÍNDICE INVERTIDO PARA BÚSQUEDA DE TEXTO (UNA SOLA VEZ POR SNAPSHOT) ==============================================
+# Se indexan Riesgo, Descripción_del_Riesgo y Descripcion de ACTRI y Procesos y Descripcion de AMTRI con la misma normalización
+# que normalize_text (sin acentos y en minúsculas). Las consultas solo recorren las listas de los términos buscados (BM25),
+# en lugar de aplicar str.contains sobre todas las columnas de texto en cada rerun.
+BM25_K1 = 1.2
+BM25_B = 0.75
+RESULTADOS_BUSQUEDA = 50        # Máximo de resultados que se muestran por consulta
+
+@st.cache_resource(show_spinner="Construyendo índice de búsqueda...")
+def construir_indice_busqueda(df_actri, df_amtri):
+    def columna(df, col):
+        return df[col].astype(str) if col in df.columns else pd.Series("", index=df.index)
+
+    # Documentos de ACTRI (una fila por acción de control)
+    actri = pd.DataFrame({
+        "Hoja": "ACTRI", "Año": df_actri["Año"], "Sector": columna(df_actri, "Sector"), "Institución": df_actri["Institución"],
+        "Clave": columna(df_actri, "AC"), "Riesgo / Proceso": columna(df_actri, "Riesgo"), "Descripción": columna(df_actri, "Descripcion"),
+        "texto": columna(df_actri, "Riesgo") + " " + columna(df_actri, "Descripción_del_Riesgo") + " " + columna(df_actri, "Descripcion")
+    })
+
+    # Documentos de AMTRI: cada AM se repite por trimestre, se indexa solo su último trimestre registrado
+    df_amtri = df_amtri.sort_values("Trimestre").drop_duplicates(["Institución", "Año", "AM"], keep="last") if "AM" in df_amtri.columns else df_amtri
+    amtri = pd.DataFrame({
+        "Hoja": "AMTRI", "Año": df_amtri["Año"], "Sector": columna(df_amtri, "Sector"), "Institución": df_amtri["Institución"],
+        "Clave": columna(df_amtri, "AM"), "Riesgo / Proceso": columna(df_amtri, "Procesos"), "Descripción": columna(df_amtri, "Descripcion"),
+        "texto": columna(df_amtri, "Procesos") + " " + columna(df_amtri, "Descripcion")
+    })
+
+    documentos = pd.concat([actri, amtri], ignore_index=True)
+    tokens = normalize_text_serie(documentos.pop("texto")).str.findall(r"[a-z0-9]+")
+
+    # Listas de apariciones: (término, documento, frecuencia) ordenadas por término
+    apariciones = tokens.explode().dropna().rename("termino").reset_index().rename(columns={"index": "doc"})
+    apariciones = apariciones.groupby(["termino", "doc"]).size().reset_index(name="tf")
+    vocabulario, inicio = np.unique(apariciones["termino"].to_numpy(dtype=str), return_index=True)
+
+    longitudes = tokens.str.len().to_numpy(dtype=float)
+    return {
+        "documentos": documentos,
+        "vocabulario": vocabulario.tolist(),
+        "inicio": np.append(inicio, len(apariciones)),
+        "doc": apariciones["doc"].to_numpy(),
+        "tf": apariciones["tf"].to_numpy(dtype=float),
+        "longitudes": longitudes,
+        "longitud_promedio": longitudes.mean() if len(longitudes) else 0.0
+    }
+
+def buscar_texto(indice, consulta, años=(), sectores=(), limite=RESULTADOS_BUSQUEDA):
+    documentos = indice["documentos"]
+    terminos = re.findall(r"[a-z0-9]+", normalize_text(consulta))
+    if not terminos or documentos.empty:
+        return documentos.iloc[0:0].assign(Puntaje=[])
+
+    n = len(documentos)
+    puntajes = np.zeros(n)
+    coincidencias = np.zeros(n, dtype=int)
+    normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * indice["longitudes"] / max(indice["longitud_promedio"], 1e-9))
+    for termino in terminos:
+        # Cada término se busca como prefijo ("licita" encuentra "licitacion" y "licitaciones")
+        desde = bisect.bisect_left(indice["vocabulario"], termino)
+        hasta = bisect.bisect_left(indice["vocabulario"], termino + "\uffff")
+        encontrado = np.zeros(n, dtype=bool)
+        for k in range(desde, hasta):
+            inicio, fin = indice["inicio"][k], indice["inicio"][k + 1]
+            docs, tf = indice["doc"][inicio:fin], indice["tf"][inicio:fin]
+            idf = np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            puntajes[docs] += idf * tf * (BM25_K1 + 1) / (tf + normalizacion[docs])
+            encontrado[docs] = True
+        coincidencias += encontrado
+
+    # Todos los términos deben aparecer; después se aplican los filtros de Año y Sector
+    mascara = coincidencias == len(terminos)
+    if años:
+        mascara &= documentos["Año"].isin(años).to_numpy()
+    if sectores:
+        mascara &= documentos["Sector"].isin(sectores).to_numpy()
+    candidatos = np.flatnonzero(mascara)
+    mejores = candidatos[np.argsort(-puntajes[candidatos], kind="stable")[:limite]]
+    return documentos.iloc[mejores].assign(Puntaje=puntajes[mejores].round(2))
+
+
+#---- Pestaña BÚSQUEDA
+with tabs[5], metricas.cronometro("sicoin_pestana_segundos", pestana="BÚSQUEDA"):
+
+    indice_busqueda = construir_indice_busqueda(df2, df4)
+
+    st.markdown("""
+      <div class='sc-titulo'>
+        Búsqueda en Riesgos, Acciones de Control y Acciones de Mejora
+      </div>
+    """, unsafe_allow_html=True)
+
+    consulta = st.text_input("Buscar (no distingue acentos ni mayúsculas)", placeholder="Ejemplo: licitación", key="consulta_busqueda")
+    col1, col2 = st.columns(2)
+    with col1:
+        años_busqueda = st.multiselect("Filtrar por Año", sorted(indice_busqueda["documentos"]["Año"].dropna().unique().tolist()), key="años_busqueda")
+    with col2:
+        sectores_busqueda = st.multiselect("Filtrar por Sector", sector_list, key="sectores_busqueda")
+
+    if consulta.strip():
+        inicio_busqueda = time.perf_counter()
+        resultados = buscar_texto(indice_busqueda, consulta, años_busqueda, sectores_busqueda)
+        duracion_ms = (time.perf_counter() - inicio_busqueda) * 1000
+        st.caption(f"{len(resultados)} resultado(s) en {duracion_ms:.1f} ms (se muestran como máximo los {RESULTADOS_BUSQUEDA} más relevantes)")
+        if resultados.empty:
+            st.markdown("No se encontraron registros con los términos buscados.")
+        else:
+            st.dataframe(resultados, use_container_width=True, hide_index=True)
+
+#============================================= PIE DE PÁGINA DE LA SECCION BÚSQUEDA - FUENTE SICOIN ==============================================
+    st.markdown("""
+      <div class='sc-fuente'>
+        Fuente: Sistema de Control Interno (SICOIN)
+      </div>
+    """, unsafe_allow_html=True)
 
 
+#============================================= LATENCIA DE LA EJECUCIÓN COMPLETA (MÉTRICAS) ==============================================
+# Las ejecuciones parciales de los fragmentos (st.fragment) no llegan hasta aquí
+metricas.observar("sicoin_ejecucion_segundos", time.perf_counter() - inicio_ejecucion)
@@ -0,0 +1,195 @@
+import copy
+import json
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+import pandas as pd
+
+###########################################################
+# CACHÉ DE VISTAS RENDERIZADAS COMPARTIDO ENTRE SESIONES (LRU LIMITADO POR BYTES)
+###########################################################
+#
+# Muchas sesiones consultan las mismas selecciones (los sectores grandes del año en curso) y cada una volvía a construir
+# las tablas HTML, los indicadores y las figuras de Plotly. Este caché guarda esos artefactos una sola vez por proceso con
+# la clave (vista, versión de los datos, selección); cuando el total de bytes supera el límite se descartan las entradas
+# usadas hace más tiempo. Los contadores de aciertos, fallos y desalojos permiten medir su efectividad.
+#
+# El caché es un diccionario (como el motor de consultas) que la app crea una sola vez con st.cache_resource.
+#
+# Las sesiones comparten las entradas, así que nunca se entrega el objeto guardado (ver ARTEFACTOS INMUTABLES): una sesión
+# que modificara una figura o un diccionario recibido del caché cambiaría lo que ven las demás.
+#
+# Precalentamiento: al cargar cada snapshot la app encola en un pool de hilos en segundo plano la construcción de las vistas
+# más pedidas (cada Sector en el año más reciente y las instituciones más consultadas), de modo que la primera visita después
+# de una recarga ya encuentra sus vistas en el caché.
+
+LIMITE_PREDETERMINADO_MB = 64
+HILOS_PRECALENTAMIENTO = 4
+PRECALENTAMIENTOS_GUARDADOS = 5            # Estado de los últimos precalentamientos (uno por versión de los datos)
+
+
+#============================================ ARTEFACTOS INMUTABLES ============================================================
+# Se guarda una forma inmutable de cada artefacto y cada consulta recibe algo que puede modificar sin afectar al caché:
+#   textos, bytes y números    -> se guardan y se entregan tal cual (ya son inmutables)
+#   figuras de Plotly          -> se guarda su JSON; cada consulta recibe un dict nuevo (st.plotly_chart lo acepta igual
+#                                 que la figura y de todos modos convierte la figura a dict antes de enviarla)
+#   diccionarios de valores    -> vista de solo lectura (MappingProxyType) de una copia
+#   tuplas y listas            -> tupla con sus elementos congelados
+#   DataFrames                 -> se entrega una copia superficial (con copy-on-write las modificaciones no llegan al caché)
+#   otros (p. ej. Styler)      -> se entrega una copia profunda
+INMUTABLES = (str, bytes, int, float, bool, type(None))
+
+class FiguraCongelada(str):
+    # JSON de una figura de Plotly guardada en el caché
+    pass
+
+def congelar(valor):
+    if isinstance(valor, INMUTABLES):
+        return valor
+    if hasattr(valor, "to_plotly_json"):
+        return FiguraCongelada(valor.to_json())
+    if isinstance(valor, (tuple, list)):
+        return tuple(congelar(v) for v in valor)
+    if isinstance(valor, Mapping) and all(isinstance(v, INMUTABLES) for v in valor.values()):
+        return MappingProxyType(dict(valor))
+    return valor
+
+def descongelar(valor):
+    if isinstance(valor, FiguraCongelada):
+        return json.loads(valor)
+    if isinstance(valor, INMUTABLES + (MappingProxyType,)):
+        return valor
+    if isinstance(valor, tuple):
+        return tuple(descongelar(v) for v in valor)
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy(deep=False)
+    return copy.deepcopy(valor)
+
+
+#============================================ TAMAÑO DE CADA ARTEFACTO ============================================================
+def tamaño_artefacto(valor):
+    # Bytes aproximados que ocupa un artefacto renderizado (HTML, figura, tabla o combinaciones de ellos)
+    if isinstance(valor, str):
+        return len(valor.encode("utf-8"))
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(getattr(valor, "data", None), pd.DataFrame):        # Styler: se cuenta el DataFrame que contiene
+        return int(valor.data.memory_usage(index=True, deep=True).sum())
+    if hasattr(valor, "to_plotly_json"):             # Figuras de Plotly: tamaño de su JSON
+        return len(valor.to_json())
+    if isinstance(valor, Mapping):
+        return sys.getsizeof(valor) + sum(tamaño_artefacto(k) + tamaño_artefacto(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamaño_artefacto(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+#============================================ OPERACIONES DEL CACHÉ ============================================================
+def crear_cache(limite_mb=LIMITE_PREDETERMINADO_MB):
+    return {"entradas": OrderedDict(), "bytes": 0, "limite": int(limite_mb * 1024 * 1024),
+            "aciertos": 0, "fallos": 0, "desalojos": 0, "candado": threading.Lock(),
+            "trafico": Counter(), "precalentamientos": OrderedDict()}
+
+def obtener(cache, clave, construir):
+    # Devuelve el artefacto guardado o lo construye (fuera del candado, para no bloquear a las demás sesiones) y lo guarda.
+    # En ambos casos se entrega la forma descongelada, nunca el objeto que queda en el caché
+    with cache["candado"]:
+        acierto = clave in cache["entradas"]
+        if acierto:
+            cache["entradas"].move_to_end(clave)
+            cache["aciertos"] += 1
+            valor = cache["entradas"][clave][0]
+        else:
+            cache["fallos"] += 1
+    if not acierto:
+        valor = guardar(cache, clave, construir())
+    return descongelar(valor)
+
+def guardar(cache, clave, valor):
+    # Guarda la forma congelada del artefacto y la devuelve
+    valor = congelar(valor)
+    tamaño = tamaño_artefacto(valor)
+    with cache["candado"]:
+        if tamaño > cache["limite"]:                 # Un artefacto más grande que todo el caché no se guarda
+            return valor
+        anterior = cache["entradas"].pop(clave, None)
+        if anterior is not None:
+            cache["bytes"] -= anterior[1]
+        cache["entradas"][clave] = (valor, tamaño)
+        cache["bytes"] += tamaño
+        while cache["bytes"] > cache["limite"]:
+            _, (_, tamaño_desalojado) = cache["entradas"].popitem(last=False)
+            cache["bytes"] -= tamaño_desalojado
+            cache["desalojos"] += 1
+    return valor
+
+def vaciar(cache):
+    with cache["candado"]:
+        cache["entradas"].clear()
+        cache["bytes"] = 0
+
+#============================================ TRÁFICO Y PRECALENTAMIENTO ============================================================
+def registrar_consulta(cache, clave):
+    # Cuenta las selecciones de las sesiones (p. ej. la institución elegida) para precalentar las más consultadas
+    with cache["candado"]:
+        cache["trafico"][clave] += 1
+
+def mas_consultadas(cache, n):
+    with cache["candado"]:
+        return [clave for clave, _ in cache["trafico"].most_common(n)]
+
+def precalentar(cache, version, tareas, hilos=HILOS_PRECALENTAMIENTO):
+    # Ejecuta las tareas (funciones sin argumentos que llaman a obtener) una sola vez por versión de los datos, aunque varias
+    # sesiones carguen el mismo snapshot a la vez. No bloquea a quien lo llama; devuelve False si esa versión ya se precalentó
+    with cache["candado"]:
+        if version in cache["precalentamientos"]:
+            return False
+        estado = {"Versión": version, "Tareas": len(tareas), "Completadas": 0, "Errores": 0, "Segundos": None}
+        cache["precalentamientos"][version] = estado
+        while len(cache["precalentamientos"]) > PRECALENTAMIENTOS_GUARDADOS:
+            cache["precalentamientos"].popitem(last=False)
+        # El tráfico cuenta como "reciente": con cada snapshot nuevo los conteos anteriores pierden la mitad de su peso
+        cache["trafico"] = Counter({clave: n // 2 for clave, n in cache["trafico"].items() if n > 1})
+
+    def ejecutar(tarea):
+        try:
+            tarea()
+            resultado = "Completadas"
+        except Exception:
+            resultado = "Errores"                    # Una selección con datos inconsistentes no detiene el resto
+        with cache["candado"]:
+            estado[resultado] += 1
+
+    def correr():
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="precalentar_vistas") as pool:
+            list(pool.map(ejecutar, tareas))
+        estado["Segundos"] = round(time.perf_counter() - inicio, 2)
+
+    threading.Thread(target=correr, name=f"precalentar_{version}", daemon=True).start()
+    return True
+
+
+def estadisticas(cache):
+    with cache["candado"]:
+        consultas = cache["aciertos"] + cache["fallos"]
+        por_vista = {}
+        for clave, (_, tamaño) in cache["entradas"].items():
+            entradas, bytes_vista = por_vista.get(clave[0], (0, 0))
+            por_vista[clave[0]] = (entradas + 1, bytes_vista + tamaño)
+        return {
+            "Entradas": len(cache["entradas"]),
+            "MB Usados": round(cache["bytes"] / 1024 / 1024, 2),
+            "MB Límite": round(cache["limite"] / 1024 / 1024, 2),
+            "Aciertos": cache["aciertos"],
+            "Fallos": cache["fallos"],
+            "Desalojos": cache["desalojos"],
+            "% de Aciertos": round(cache["aciertos"] / consultas * 100, 1) if consultas else 0.0,
+            "Por Vista": por_vista,
+            "Precalentamientos": [dict(estado) for estado in reversed(cache["precalentamientos"].values())]
+        }
@@ -0,0 +1,657 @@
+import argparse
+import datetime
+import email.utils
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import tomllib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+###########################################################
+# FUENTES DE DATOS DEL SICOIN (GOOGLE SHEETS, ARCHIVOS LOCALES Y SQLITE)
+###########################################################
+#
+# Todas las fuentes devuelven las mismas cinco hojas (PTAR, ACTRI, PTCI, AMTRI y NOMBRES) como DataFrames con los mismos
+# tipos que entrega gspread.get_all_records(): los números como int/float y las celdas vacías como "".
+# La fuente se elige con la sección [fuente_datos] de .streamlit/secrets.toml, por ejemplo:
+#
+#   [fuente_datos]
+#   tipo = "local"                 # "sheets" (predeterminado), "local", "sqlite" o "compartido"
+#   ruta = "datos/"                # carpeta con PTAR.parquet/.csv/.xlsx ..., un libro .xlsx, un archivo .sqlite o la carpeta del snapshot compartido
+#   libro = "SICOIN_BASE"          # solo para "sheets"
+#   proyectar = true               # solo se leen las columnas que usa la app (COLUMNAS_HOJAS); false para leer todas
+#   filas_por_bloque = 5000        # solo para "sheets": ACTRI y AMTRI se descargan y convierten por bloques de filas
+#   peticiones_por_minuto = 50     # solo para "sheets": presupuesto de peticiones del proceso (cliente compartido, ver FUENTE 1)
+#   reintentos = 5                 # solo para "sheets": reintentos ante errores de cuota (429) o del servidor (5xx)
+#   url_api = "http://127.0.0.1:8900"  # solo para "sheets": servidor alterno de las APIs de Sheets y Drive (proxy o prueba_sheets.py)
+#
+# Varios libros (p. ej. uno por año histórico): libros = ["SICOIN_BASE", "SICOIN_2023"] para "sheets", o ruta = [...] para
+# "local" y "sqlite". Se descargan en paralelo y cada hoja se une con la columna Libro; si dos libros traen la misma
+# Institución y Año se conservan solo las filas del que tiene precedencia (ver VARIOS LIBROS):
+#
+#   precedencia = "orden"          # "orden": gana el primer libro de la lista; "reciente": gana el modificado más recientemente
+#   hilos_libros = 4               # libros que se descargan a la vez
+#
+# Con varios procesos de Streamlit se usa tipo = "compartido": refrescador.py descarga la fuente una sola vez y todos los
+# procesos mapean en memoria el mismo snapshot Arrow (ver FUENTE 4).
+#
+# Las variables de entorno SICOIN_FUENTE, SICOIN_RUTA y SICOIN_LIBRO tienen prioridad sobre [fuente_datos] (no sobre la fuente
+# de origen de [refrescador]), lo que permite ejecutar la app, pruebas y mediciones sin credenciales de Google:
+#   SICOIN_FUENTE=local SICOIN_RUTA=datos/ streamlit run app.py
+# (SICOIN_LIBRO acepta varios libros separados por comas y SICOIN_RUTA varias rutas separadas por os.pathsep)
+
+HOJAS = ["PTAR", "ACTRI", "PTCI", "AMTRI", "NOMBRES"]
+LIBRO_PREDETERMINADO = "SICOIN_BASE"
+EXTENSIONES_LOCALES = [".parquet", ".csv", ".xlsx"]     # Orden de preferencia cuando existen varias exportaciones de la misma hoja
+ARCHIVO_PUNTERO = "ACTUAL"                              # Snapshot compartido: archivo con el nombre de la versión vigente
+VERSIONES_COMPARTIDAS = 3                               # Versiones del snapshot compartido que se conservan en disco
+HOJAS_POR_BLOQUES = ["ACTRI", "AMTRI"]                  # Hojas de Sheets que se leen por bloques de filas (registros_por_bloques)
+FILAS_POR_BLOQUE = 5000                                 # [fuente_datos] filas_por_bloque; 0 lee estas hojas completas
+estadisticas_carga = {}                                 # Filas, bloques y filas/s de la última lectura por bloques de cada hoja
+segundos_por_hoja = {}                                  # Segundos de la última descarga de cada hoja de Sheets (metricas.py)
+estadisticas_libros = {}                                # Marca, segundos y si se reutilizó cada libro en la última unión
+
+# Columnas de cada hoja que usa la app (tablas, gráficas, REPORTES, búsqueda, historial y motor de consultas). Con la
+# proyección activa cada fuente lee solo estas columnas (en Sheets solo se descargan sus rangos) y avisa si falta alguna
+TRIMESTRALES = [f"{t}{estado}" for t in "1234" for estado in ["Sin_Avances", "En_Proceso", "Concluidas", "Cumplimiento"]]
+COLUMNAS_HOJAS = {
+    "PTAR": ["Año", "Institución", "Sector", "Siglas",
+             "Sustantivo", "Administrativo", "Financiero", "Presupuestal", "Servicios", "Seguridad", "Obra_Pública",
+             "Recursos_Humanos", "Imagen", "TICs", "Salud", "Otro", "Corrupción", "Legal",
+             "I", "II", "III", "IV", "Evitar", "Reducir", "Asumir", "Transferir", "Compartir",
+             "AC_Total", "Riesgos_Totales"] + TRIMESTRALES,
+    "ACTRI": ["Año", "Institución", "Sector", "Siglas", "Riesgo", "Descripción_del_Riesgo", "AC", "Descripcion",
+              "Avance_Institución", "Avance_OIC"],
+    "PTCI": ["Año", "Institución", "Sector", "Siglas", "Cumplimiento_General_de_las_NGCI", "Informe_Anual_Finalizado", "SUBIO_ARCHIVO",
+             "Se_Actualizó_el_Programa", "No_Se_Actualizó_el_Programa", "Acciones_de_Mejora_Programa_Original",
+             "TotalAcciones_de_Mejora_Programa_Actualizado"] + TRIMESTRALES,
+    "AMTRI": ["Año", "Trimestre", "Institución", "Sector", "Siglas", "Procesos", "AM", "Descripcion", "Fecha_Inicio", "Fecha_Termino",
+              "Avance_Institución", "Avance_OIC", "¿Evaluado?", "¿Favorable?", "¿AM_Congruete?", "¿Contribuye?",
+              "Registradas", "Localizadas", "No_localizadas", "Suficientes", "Parcielmente_Suficientes", "Insuficientes"],
+    "NOMBRES": ["NOMBRE_SICOIN", "SECTOR_SICOIN", "SECTOR_PEF", "NOMBRE_PEF", "COINCIDE"]
+}
+# Se conservan si existen pero su ausencia no genera aviso (la revisa una regla de reglas_calidad.toml)
+COLUMNAS_OPCIONALES = {"ACTRI": ["Detalle_del_Riesgo"]}
+
+
+#============================================ CONFIGURACIÓN DE LA FUENTE ============================================================
+def leer_secretos(ruta=os.path.join(".streamlit", "secrets.toml")):
+    # Lectura de secrets.toml fuera de Streamlit (scripts de línea de comandos)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, "rb") as archivo:
+        return tomllib.load(archivo)
+
+def configuracion_fuente(secretos, seccion="fuente_datos"):
+    config = dict(secretos.get(seccion, {}))
+    # Las variables de entorno solo sustituyen a [fuente_datos] (lo que leen la app y los scripts); la fuente de origen del
+    # refrescador ([refrescador]) no debe cambiar porque el proceso herede, p. ej., SICOIN_FUENTE=compartido
+    variables = [("tipo", "SICOIN_FUENTE"), ("ruta", "SICOIN_RUTA"), ("libro", "SICOIN_LIBRO")] if seccion == "fuente_datos" else []
+    for clave, variable in variables:
+        if os.environ.get(variable):
+            config[clave] = os.environ[variable]
+            if clave == "libro":
+                config.pop("libros", None)
+    config.setdefault("tipo", "sheets")
+    config.setdefault("libro", LIBRO_PREDETERMINADO)
+    return config, secretos.get("gcp_service_account")
+
+
+#============================================ PROYECCIÓN DE COLUMNAS (MANIFIESTO COLUMNAS_HOJAS) ============================================================
+def proyectar(config):
+    return str(config.get("proyectar", True)).lower() not in ("false", "0", "no")
+
+def columnas_a_leer(hoja, disponibles):
+    # Columnas de la fuente (con su nombre original, en su orden) que están en el manifiesto; los nombres se comparan sin espacios
+    # a los lados porque limpiar_datos los recorta después
+    manifiesto = set(COLUMNAS_HOJAS[hoja]) | set(COLUMNAS_OPCIONALES.get(hoja, []))
+    return [c for c in disponibles if str(c).strip() in manifiesto]
+
+def columnas_faltantes(datos):
+    # {hoja: [columnas del manifiesto que no trae la fuente]} para avisar en la app, el refrescador y la línea de comandos
+    faltantes = {}
+    for hoja, columnas in COLUMNAS_HOJAS.items():
+        presentes = {str(c).strip() for c in datos[hoja].columns} if hoja in datos else set()
+        if [c for c in columnas if c not in presentes]:
+            faltantes[hoja] = [c for c in columnas if c not in presentes]
+    return faltantes
+
+
+#============================================ NORMALIZACIÓN DE TIPOS (IGUAL QUE get_all_records) ============================================================
+def numerizar(valor):
+    # Misma conversión que gspread (numericise): "12" -> 12, "12.5" -> 12.5 y el resto de los textos se conservan
+    if isinstance(valor, str):
+        try:
+            return int(valor)
+        except ValueError:
+            try:
+                return float(valor)
+            except ValueError:
+                return valor
+    return valor
+
+def tipar_hoja(df):
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if pd.api.types.is_string_dtype(df[col].dtype):         # object o str (pandas >= 3)
+            df[col] = df[col].where(df[col].notna(), "").astype(object).map(numerizar)
+    return df.infer_objects()      # Columnas completamente numéricas quedan como int64/float64, igual que con Sheets
+
+
+#============================================ FUENTE 1: GOOGLE SHEETS ============================================================
+# Un solo cliente por proceso y cuenta de servicio: la sesión HTTP conserva sus conexiones abiertas (pool de urllib3) y el
+# token de acceso se reutiliza hasta que vence, en lugar de autenticarse y abrir el libro en cada recarga. Todas las
+# peticiones pasan por un limitador de ritmo (presupuesto de peticiones por minuto del proceso) y los errores de cuota (429)
+# o del servidor (5xx) se reintentan con espera exponencial con jitter; si la respuesta trae Retry-After se espera al menos
+# ese tiempo (con el mismo tope ESPERA_MAXIMA_SHEETS). prueba_sheets.py lo comprueba contra un servidor falso.
+PETICIONES_POR_MINUTO = 50          # La cuota de lectura de Sheets es de 60 por minuto por usuario; se deja margen
+REINTENTOS_SHEETS = 5
+ESPERA_BASE_SHEETS = 1.0            # Segundos; se duplica en cada reintento hasta ESPERA_MAXIMA_SHEETS (espera al azar hasta ese tope)
+ESPERA_MAXIMA_SHEETS = 32.0
+CODIGOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+CONEXIONES_SHEETS = 10              # Conexiones del pool HTTP que comparten las sesiones del proceso
+TIEMPO_LIMITE_SHEETS = (10, 120)    # Segundos para conectar y para recibir cada respuesta
+
+clientes_sheets = {}                # (cuenta de servicio) -> cliente de gspread; (cuenta, libro) -> libro abierto
+candado_clientes = threading.Lock()
+
+def crear_limitador(peticiones_por_minuto=PETICIONES_POR_MINUTO):
+    # Cubeta de fichas: se recargan peticiones_por_minuto / 60 fichas por segundo hasta un máximo de peticiones_por_minuto
+    return {"capacidad": float(peticiones_por_minuto), "fichas": float(peticiones_por_minuto), "ultima": time.monotonic(),
+            "candado": threading.Lock(), "peticiones": 0, "reintentos": 0, "esperas": 0, "segundos_en_espera": 0.0}
+
+limitador_sheets = crear_limitador()
+
+def esperar_turno(limitador):
+    # Cada petición toma una ficha; si no hay, reserva la siguiente (las fichas quedan negativas) y espera a que se recargue,
+    # de modo que los hilos que llegan a la vez se ordenan en lugar de salir todos juntos
+    with limitador["candado"]:
+        ahora = time.monotonic()
+        recarga = limitador["capacidad"] / 60
+        limitador["fichas"] = min(limitador["capacidad"], limitador["fichas"] + (ahora - limitador["ultima"]) * recarga)
+        limitador["ultima"] = ahora
+        limitador["fichas"] -= 1
+        limitador["peticiones"] += 1
+        espera = -limitador["fichas"] / recarga if limitador["fichas"] < 0 else 0.0
+        if espera:
+            limitador["esperas"] += 1
+            limitador["segundos_en_espera"] += espera
+    if espera:
+        time.sleep(espera)
+
+def espera_reintento(intento, sugerida=0.0):
+    # Espera exponencial con jitter completo: al azar entre 0 y base * 2^intento (con tope); nunca menos que la sugerida por
+    # el servidor (Retry-After), que también respeta el tope
+    return max(random.uniform(0, min(ESPERA_MAXIMA_SHEETS, ESPERA_BASE_SHEETS * 2 ** intento)), min(ESPERA_MAXIMA_SHEETS, sugerida))
+
+def segundos_retry_after(respuesta):
+    # Retry-After en segundos ("30") o como fecha HTTP; 0 si no viene o no se entiende
+    valor = respuesta.headers.get("Retry-After") if respuesta is not None else None
+    if not valor:
+        return 0.0
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (email.utils.parsedate_to_datetime(valor) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
+URLS_GOOGLE = ["https://sheets.googleapis.com", "https://www.googleapis.com"]
+
+def clase_cliente_http(limitador=limitador_sheets, reintentos=REINTENTOS_SHEETS, url_api=None):
+    # Cliente HTTP de gspread con pool de conexiones, limitador y reintentos (gspread recibe la clase, no una instancia)
+    import requests
+    from gspread.exceptions import APIError
+    from gspread.http_client import HTTPClient
+
+    class ClienteHTTPSheets(HTTPClient):
+        def __init__(self, auth, session=None):
+            super().__init__(auth, session)
+            adaptador = requests.adapters.HTTPAdapter(pool_connections=CONEXIONES_SHEETS, pool_maxsize=CONEXIONES_SHEETS)
+            self.session.mount("https://", adaptador)
+            self.session.mount("http://", adaptador)
+            self.timeout = TIEMPO_LIMITE_SHEETS
+
+        def request(self, method, endpoint, *args, **kwargs):
+            for url in URLS_GOOGLE if url_api else []:
+                if endpoint.startswith(url):
+                    endpoint = url_api.rstrip("/") + endpoint[len(url):]
+            for intento in range(reintentos + 1):
+                esperar_turno(limitador)
+                sugerida = 0.0
+                try:
+                    return super().request(method, endpoint, *args, **kwargs)
+                except APIError as error:
+                    if error.code not in CODIGOS_REINTENTABLES or intento == reintentos:
+                        raise
+                    sugerida = segundos_retry_after(error.response)
+                except (requests.ConnectionError, requests.Timeout):
+                    if intento == reintentos:
+                        raise
+                with limitador["candado"]:
+                    limitador["reintentos"] += 1
+                time.sleep(espera_reintento(intento, sugerida))
+
+    return ClienteHTTPSheets
+
+def libro_sheets(config, credenciales):
+    import gspread      # Solo se requiere cuando la fuente es Google Sheets
+
+    if not credenciales:
+        raise ValueError("La fuente 'sheets' requiere la sección gcp_service_account en los secrets")
+    cuenta = credenciales.get("client_email", "")
+    libro = config.get("libro", LIBRO_PREDETERMINADO)
+    with candado_clientes:
+        if cuenta not in clientes_sheets:
+            if "peticiones_por_minuto" in config:
+                limitador_sheets["capacidad"] = float(config["peticiones_por_minuto"])
+            clase = clase_cliente_http(limitador_sheets, int(config.get("reintentos", REINTENTOS_SHEETS)), config.get("url_api"))
+            clientes_sheets[cuenta] = gspread.service_account_from_dict(credenciales, http_client=clase)
+        if (cuenta, libro) not in clientes_sheets:
+            clientes_sheets[(cuenta, libro)] = clientes_sheets[cuenta].open(libro)
+        return clientes_sheets[(cuenta, libro)]
+
+def cargar_desde_sheets(config, credenciales):
+    sh = libro_sheets(config, credenciales)
+    filas_por_bloque = int(config.get("filas_por_bloque", FILAS_POR_BLOQUE))
+    hojas_por_bloques = config.get("hojas_por_bloques", HOJAS_POR_BLOQUES) if filas_por_bloque > 0 else []
+    datos = {}
+    for hoja in HOJAS:
+        # Al unir varios libros las estadísticas de cada hoja se guardan como "libro/hoja"
+        etiqueta = f"{config['libro']}/{hoja}" if config.get("etiquetar_libro") else hoja
+        inicio = time.perf_counter()
+        hoja_calculo = sh.worksheet(hoja)
+        if hoja in hojas_por_bloques:
+            datos[hoja] = registros_por_bloques(hoja_calculo, hoja, proyectar(config), filas_por_bloque, etiqueta)
+        elif proyectar(config):
+            datos[hoja] = registros_proyectados(hoja_calculo, hoja)
+        else:
+            datos[hoja] = pd.DataFrame(hoja_calculo.get_all_records())
+        segundos_por_hoja[etiqueta] = round(time.perf_counter() - inicio, 3)
+    return datos
+
+def tramos_columnas(hoja_calculo, hoja, proyeccion=True):
+    # Encabezados y tramos de columnas contiguas por descargar (p. ej. [0, 3] y [7, 7] -> "A:D" y "H:H")
+    encabezados = hoja_calculo.row_values(1)
+    elegidas = set(columnas_a_leer(hoja, encabezados)) if proyeccion else set(encabezados)
+    tramos = []
+    for i, columna in enumerate(encabezados):
+        if columna not in elegidas:
+            continue
+        if tramos and tramos[-1][1] == i - 1:
+            tramos[-1][1] = i
+        else:
+            tramos.append([i, i])
+    return encabezados, tramos
+
+def leer_tramos(hoja_calculo, tramos, fila_inicio=None, fila_fin=None):
+    # Un solo batch_get con todos los tramos (opcionalmente solo las filas fila_inicio..fila_fin). La API omite las celdas y
+    # filas vacías al final de cada rango: se rellenan con "" como hace get_all_records
+    from gspread.utils import rowcol_to_a1
+
+    letra = lambda i: rowcol_to_a1(1, i + 1).rstrip("0123456789")
+    rangos = hoja_calculo.batch_get([f"{letra(a)}{fila_inicio or ''}:{letra(b)}{fila_fin or ''}" for a, b in tramos])
+    total_filas = max((len(rango) for rango in rangos), default=0)
+    filas = [[] for _ in range(total_filas)]
+    for (a, b), rango in zip(tramos, rangos):
+        ancho = b - a + 1
+        for n in range(total_filas):
+            valores = list(rango[n]) if n < len(rango) else []
+            filas[n].extend(valores + [""] * (ancho - len(valores)))
+    return filas
+
+def registros_proyectados(hoja_calculo, hoja):
+    # Igual que get_all_records() pero solo descarga los rangos de las columnas del manifiesto: primero la fila de
+    # encabezados y después un solo batch_get con los tramos de columnas contiguas
+    from gspread.utils import numericise_all
+
+    encabezados, tramos = tramos_columnas(hoja_calculo, hoja)
+    if not tramos:
+        return pd.DataFrame()
+    filas = leer_tramos(hoja_calculo, tramos)
+    return pd.DataFrame([numericise_all(fila) for fila in filas[1:]], columns=filas[0])
+
+def registros_por_bloques(hoja_calculo, hoja, proyeccion=True, filas_por_bloque=FILAS_POR_BLOQUE, etiqueta=None):
+    # Lectura por bloques de filas para las hojas que crecen cada trimestre (ACTRI y AMTRI): cada bloque se convierte en
+    # seguida en un DataFrame con columnas tipadas (int64/float64 o texto), de modo que nunca existe la lista completa de
+    # registros en memoria; al final se concatenan los bloques. El resultado es el mismo que con get_all_records
+    from gspread.utils import numericise_all
+
+    inicio = time.perf_counter()
+    encabezados, tramos = tramos_columnas(hoja_calculo, hoja, proyeccion)
+    columnas = [encabezados[i] for a, b in tramos for i in range(a, b + 1)]
+    bloques, vacias, fila, lecturas = [], 0, 2, 0
+    while fila <= hoja_calculo.row_count:
+        lecturas += 1
+        filas = leer_tramos(hoja_calculo, tramos, fila, min(fila + filas_por_bloque - 1, hoja_calculo.row_count))
+        if filas:
+            # Filas vacías entre bloques con datos: se conservan (get_all_records solo descarta las del final)
+            if vacias:
+                bloques.append(pd.DataFrame([[""] * len(columnas)] * vacias, columns=columnas))
+            bloques.append(pd.DataFrame([numericise_all(f) for f in filas], columns=columnas))
+        vacias = (vacias if not filas else 0) + min(filas_por_bloque, hoja_calculo.row_count - fila + 1) - len(filas)
+        fila += filas_por_bloque
+    df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame(columns=columnas)
+
+    duracion = time.perf_counter() - inicio
+    estadisticas_carga[etiqueta or hoja] = {"Filas": len(df), "Bloques": lecturas, "Segundos": round(duracion, 2),
+                                "Filas/s": round(len(df) / duracion) if duracion else None}
+    return df
+
+
+#============================================ FUENTE 2: ARCHIVOS LOCALES (CSV / XLSX / PARQUET) ============================================================
+def cargar_desde_local(config, credenciales=None):
+    ruta = config["ruta"]
+
+    # Con la proyección, CSV y Excel solo materializan las columnas del manifiesto y Parquet solo lee sus columnas del archivo
+    def usecols(hoja):
+        return (lambda columna: bool(columnas_a_leer(hoja, [columna]))) if proyectar(config) else None
+
+    # Un solo libro de Excel con una pestaña por hoja (el archivo se abre una sola vez)
+    if os.path.isfile(ruta):
+        with pd.ExcelFile(ruta) as libro:
+            return {hoja: tipar_hoja(libro.parse(hoja, usecols=usecols(hoja))) for hoja in HOJAS}
+
+    # Una carpeta con un archivo por hoja
+    datos = {}
+    for hoja in HOJAS:
+        archivo = next((os.path.join(ruta, hoja + ext) for ext in EXTENSIONES_LOCALES if os.path.exists(os.path.join(ruta, hoja + ext))), None)
+        if archivo is None:
+            raise FileNotFoundError(f"No se encontró la hoja {hoja} en {ruta} ({', '.join(EXTENSIONES_LOCALES)})")
+        if archivo.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            columnas = columnas_a_leer(hoja, pq.read_schema(archivo).names) if proyectar(config) else None
+            df = pd.read_parquet(archivo, columns=columnas)
+        elif archivo.endswith(".csv"):
+            df = pd.read_csv(archivo, dtype=str, keep_default_na=False, usecols=usecols(hoja))
+        else:
+            df = pd.read_excel(archivo, usecols=usecols(hoja))
+        datos[hoja] = tipar_hoja(df)
+    return datos
+
+
+#============================================ FUENTE 3: SQLITE ============================================================
+def cargar_desde_sqlite(config, credenciales=None):
+    datos = {}
+    with sqlite3.connect(config["ruta"]) as conexion:
+        for hoja in HOJAS:
+            seleccion = "*"
+            if proyectar(config):
+                disponibles = [fila[1] for fila in conexion.execute(f'PRAGMA table_info("{hoja}")')]
+                seleccion = ", ".join('"' + c.replace('"', '""') + '"' for c in columnas_a_leer(hoja, disponibles)) or "*"
+            datos[hoja] = tipar_hoja(pd.read_sql_query(f'SELECT {seleccion} FROM "{hoja}"', conexion))
+    return datos
+
+
+#============================================ FUENTE 4: SNAPSHOT COMPARTIDO (ARROW MAPEADO EN MEMORIA) ============================================================
+# El refrescador escribe las hojas como archivos Arrow IPC sin comprimir en <ruta>/<version>/ y después reemplaza de forma
+# atómica el archivo <ruta>/ACTUAL con el nombre de la versión. Cada proceso mapea los archivos en memoria: las columnas
+# numéricas y de texto quedan respaldadas por las mismas páginas del sistema operativo en todos los procesos (una sola
+# copia física y una sola descarga); solo las columnas mixtas (números y "") se convierten a objeto como en get_all_records.
+def version_compartida(config):
+    with open(os.path.join(config["ruta"], ARCHIVO_PUNTERO), encoding="utf-8") as archivo:
+        return archivo.read().strip()
+
+def cargar_desde_compartido(config, credenciales=None):
+    import pyarrow as pa
+
+    carpeta = os.path.join(config["ruta"], version_compartida(config))
+    datos = {}
+    for hoja in HOJAS:
+        tabla = pa.ipc.open_file(pa.memory_map(os.path.join(carpeta, f"{hoja}.arrow"))).read_all()
+        if proyectar(config):
+            tabla = tabla.select(columnas_a_leer(hoja, tabla.column_names))
+        df = tabla.to_pandas(split_blocks=True)         # Sin consolidar bloques: las columnas siguen apuntando al archivo mapeado
+        mixtas = json.loads((tabla.schema.metadata or {}).get(b"columnas_mixtas", b"[]"))
+        for col in [c for c in mixtas if c in df.columns]:          # La proyección puede haber descartado alguna
+            df[col] = df[col].astype(object).map(numerizar)
+        datos[hoja] = df
+    return datos
+
+def escribir_compartido(datos, ruta, conservar=VERSIONES_COMPARTIDAS):
+    import pyarrow as pa
+
+    # Nombre único aunque dos publicaciones caigan en el mismo segundo (el prefijo de fecha mantiene el orden para depurar);
+    # las hojas se escriben en una carpeta oculta que se renombra completa, así nunca se mapea una versión a medio escribir
+    ahora = time.time()
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(ahora))}.{int(ahora % 1 * 1e6):06d}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+    carpeta = os.path.join(ruta, version)
+    temporal_carpeta = os.path.join(ruta, f".{version}.tmp")
+    os.makedirs(temporal_carpeta)
+    for hoja, df in datos.items():
+        mixtas = [c for c in df.columns if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True) != "string"]
+        tabla = pa.Table.from_pandas(texto_para_archivo(df), preserve_index=False)
+        tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}), b"columnas_mixtas": json.dumps(mixtas).encode("utf-8")})
+        with pa.ipc.new_file(os.path.join(temporal_carpeta, f"{hoja}.arrow"), tabla.schema) as escritor:
+            escritor.write_table(tabla)
+    os.replace(temporal_carpeta, carpeta)
+
+    # Cambio atómico del puntero: los procesos leen la versión anterior o la nueva, nunca una a medio escribir
+    temporal = os.path.join(ruta, f"{ARCHIVO_PUNTERO}.{version}.tmp")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        archivo.write(version)
+    os.replace(temporal, os.path.join(ruta, ARCHIVO_PUNTERO))
+
+    # Las versiones antiguas se eliminan (nunca la vigente ni las carpetas ocultas que otro proceso aún está escribiendo);
+    # un proceso que aún las tenga mapeadas conserva el acceso hasta liberarlas
+    vigente = version_compartida({"ruta": ruta})
+    versiones = sorted(d for d in os.listdir(ruta) if not d.startswith(".") and os.path.isdir(os.path.join(ruta, d)))
+    for antigua in versiones[:-conservar]:
+        if antigua != vigente:
+            shutil.rmtree(os.path.join(ruta, antigua), ignore_errors=True)
+    return version
+
+
+FUENTES = {
+    "sheets": cargar_desde_sheets,
+    "local": cargar_desde_local,
+    "sqlite": cargar_desde_sqlite,
+    "compartido": cargar_desde_compartido
+}
+
+
+#============================================ VARIOS LIBROS: CARGA EN PARALELO Y UNIÓN ============================================================
+# Cada libro (o ruta) se carga con su propia configuración en un pool de hilos; en Sheets comparten el cliente y el limitador
+# de peticiones (FUENTE 1). Los libros que no cambiaron desde la carga anterior (misma fecha de modificación en Drive o en
+# disco) no se vuelven a descargar ni a convertir: se reutilizan sus DataFrames de cache_libros, de modo que agregar un año
+# histórico no alarga proporcionalmente cada recarga. cache_libros solo conserva los libros de la configuración vigente: al
+# quitar un libro de la lista sus DataFrames se liberan en la siguiente carga.
+#
+# Un mismo libro o ruta repetido en la lista es un error de configuración (sus filas competirían consigo mismas por la
+# precedencia) y se rechaza en lugar de ignorarse.
+PRECEDENCIAS = ["orden", "reciente"]
+HILOS_LIBROS = 4
+COLUMNA_LIBRO = "Libro"
+CLAVES_UNION = {"NOMBRES": ["NOMBRE_SICOIN"]}           # Las demás hojas se deduplican por Institución y Año
+cache_libros = {}                                       # (tipo, libro o ruta) -> (marca de modificación, datos)
+candado_libros = threading.Lock()
+
+def libros_configurados(config):
+    # Lista de (nombre, configuración) de cada libro o ruta; una sola fuente devuelve una lista de un elemento
+    tipo = config.get("tipo", "sheets")
+    if tipo == "sheets":
+        clave, libros, separador = "libro", config.get("libros") or config.get("libro", LIBRO_PREDETERMINADO), ","
+    elif tipo in ("local", "sqlite"):
+        clave, libros, separador = "ruta", config.get("ruta"), os.pathsep
+    else:
+        return [(config.get("ruta"), config)]
+    if isinstance(libros, str):
+        libros = libros.split(separador)
+    libros = [str(libro).strip() for libro in libros or [] if str(libro).strip()]
+    if not libros:
+        return [(None, config)]
+    if len(libros) == 1:
+        return [(libros[0], {**config, clave: libros[0]})]
+    return [(libro, {**config, clave: libro, "etiquetar_libro": True}) for libro in libros]
+
+def marca_libro(tipo, config, credenciales):
+    # Fecha de la última modificación del libro (Drive) o del archivo o carpeta más reciente (local y SQLite)
+    if tipo == "sheets":
+        return libro_sheets(config, credenciales).get_lastUpdateTime()
+    ruta = config["ruta"]
+    if os.path.isdir(ruta):
+        return max((entrada.stat().st_mtime for entrada in os.scandir(ruta) if entrada.is_file()), default=0.0)
+    return os.path.getmtime(ruta)
+
+def cargar_libro(tipo, nombre, config, credenciales):
+    inicio = time.perf_counter()
+    marca = marca_libro(tipo, config, credenciales)
+    with candado_libros:
+        anterior = cache_libros.get((tipo, nombre))
+    reutilizado = anterior is not None and anterior[0] == marca
+    if reutilizado:
+        datos = anterior[1]
+    else:
+        datos = FUENTES[tipo](config, credenciales)
+        with candado_libros:
+            cache_libros[(tipo, nombre)] = (marca, datos)
+    estadisticas_libros[nombre] = {"Marca": marca, "Reutilizado": reutilizado, "Segundos": round(time.perf_counter() - inicio, 2)}
+    return marca, datos
+
+def depurar_cache_libros(vigentes):
+    # Libera los libros que ya no están en la configuración (vigentes: conjunto de (tipo, libro o ruta))
+    with candado_libros:
+        for clave in [clave for clave in cache_libros if clave not in vigentes]:
+            del cache_libros[clave]
+
+def columna_clave(serie, columna):
+    # Valores de la clave con la misma limpieza que la app; NaN si la celda está vacía o el año no es numérico
+    if columna == "Año":
+        return pd.to_numeric(serie, errors='coerce')
+    texto = serie.astype(str).str.strip()
+    return texto.where(serie.notna() & (texto != ""))
+
+def unir_libros(por_libro, orden):
+    # Concatena cada hoja con la columna Libro y, por cada clave (Institución y Año), conserva solo las filas del libro con
+    # mayor precedencia (el primero de "orden"). Las filas sin clave (institución vacía o año no numérico) no se pueden
+    # atribuir a ninguna institución y año: se conservan de todos los libros
+    prioridad = {libro: i for i, libro in enumerate(orden)}
+    datos = {}
+    for hoja in HOJAS:
+        union = pd.concat([hojas[hoja].assign(**{COLUMNA_LIBRO: libro}) for libro, hojas in por_libro.items()], ignore_index=True)
+        claves = CLAVES_UNION.get(hoja, ["Institución", "Año"])
+        if all(col in union.columns for col in claves):
+            grupos = [columna_clave(union[col], col) for col in claves]
+            sin_clave = pd.concat(grupos, axis=1).isna().any(axis=1)
+            rango = union[COLUMNA_LIBRO].map(prioridad)
+            minimo = rango[~sin_clave].groupby([grupo[~sin_clave] for grupo in grupos]).transform("min")
+            union = union[sin_clave | (rango == minimo.reindex(union.index))].reset_index(drop=True)
+        datos[hoja] = union
+    return datos
+
+def libros_repetidos(tipo, libros):
+    # Libros (Sheets, por nombre) o rutas (local y SQLite, por ruta real) que aparecen más de una vez en la lista
+    clave = (lambda nombre: nombre) if tipo == "sheets" else (lambda ruta: os.path.realpath(ruta))
+    vistos, repetidos = set(), []
+    for nombre, _ in libros:
+        if clave(nombre) in vistos:
+            repetidos.append(nombre)
+        vistos.add(clave(nombre))
+    return repetidos
+
+def cargar_varios_libros(config, credenciales, libros):
+    tipo = config.get("tipo", "sheets")
+    precedencia = config.get("precedencia", "orden")
+    if precedencia not in PRECEDENCIAS:
+        raise ValueError(f"Precedencia desconocida: {precedencia} (opciones: {', '.join(PRECEDENCIAS)})")
+    repetidos = libros_repetidos(tipo, libros)
+    if repetidos:
+        raise ValueError(f"Libros repetidos en la configuración de {tipo}: {', '.join(repetidos)}")
+    depurar_cache_libros({(tipo, nombre) for nombre, _ in libros})
+    estadisticas_libros.clear()
+    hilos = min(int(config.get("hilos_libros", HILOS_LIBROS)), len(libros))
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="cargar_libros") as pool:
+        resultados = list(pool.map(lambda libro: cargar_libro(tipo, libro[0], libro[1], credenciales), libros))
+    nombres = [nombre for nombre, _ in libros]
+    orden = nombres
+    if precedencia == "reciente":
+        marcas = {nombre: marca for nombre, (marca, _) in zip(nombres, resultados)}
+        orden = sorted(nombres, key=lambda nombre: marcas[nombre], reverse=True)
+    return unir_libros({nombre: datos for nombre, (_, datos) in zip(nombres, resultados)}, orden)
+
+
+#============================================ PUNTO DE ENTRADA ÚNICO ============================================================
+def cargar_datos(config, credenciales=None):
+    tipo = config.get("tipo", "sheets")
+    if tipo not in FUENTES:
+        raise ValueError(f"Fuente de datos desconocida: {tipo} (opciones: {', '.join(FUENTES)})")
+    libros = libros_configurados(config)
+    if len(libros) > 1:
+        datos = cargar_varios_libros(config, credenciales, libros)
+    else:
+        depurar_cache_libros(set())             # Ya no se unen varios libros: se liberan los que se habían guardado
+        datos = FUENTES[tipo](libros[0][1], credenciales)
+    faltantes = [hoja for hoja in HOJAS if hoja not in datos]
+    if faltantes:
+        raise ValueError(f"La fuente {tipo} no devolvió las hojas: {', '.join(faltantes)}")
+    return {hoja: datos[hoja] for hoja in HOJAS}
+
+
+#============================================ EXPORTACIÓN (ESPEJO LOCAL) ============================================================
+def texto_para_archivo(df):
+    # Las columnas mixtas (números y "") se guardan como texto; tipar_hoja las recupera al cargar
+    return df.astype({c: str for c in df.columns if pd.api.types.is_string_dtype(df[c].dtype)})
+
+def exportar_datos(datos, destino, formato="parquet"):
+    texto = {hoja: texto_para_archivo(df) for hoja, df in datos.items()}
+    if formato == "sqlite":
+        with sqlite3.connect(destino) as conexion:
+            for hoja, df in texto.items():
+                df.to_sql(hoja, conexion, if_exists="replace", index=False)
+        return
+    os.makedirs(destino, exist_ok=True)
+    for hoja, df in texto.items():
+        archivo = os.path.join(destino, f"{hoja}.{formato}")
+        if formato == "parquet":
+            df.to_parquet(archivo, index=False)
+        elif formato == "csv":
+            df.to_csv(archivo, index=False)
+        else:
+            raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+# python fuentes_datos.py medir                                   -> tiempo de carga y filas por hoja de la fuente configurada
+# python fuentes_datos.py exportar --destino datos/ --formato csv -> crea un espejo local de la fuente configurada
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Carga, mide y exporta las bases del SICOIN")
+    parser.add_argument("accion", choices=["medir", "exportar"])
+    parser.add_argument("--destino", help="Carpeta (parquet/csv) o archivo (sqlite) de destino")
+    parser.add_argument("--formato", choices=["parquet", "csv", "sqlite"], default="parquet")
+    args = parser.parse_args(argumentos)
+
+    config, credenciales = configuracion_fuente(leer_secretos())
+    inicio = time.perf_counter()
+    datos = cargar_datos(config, credenciales)
+    duracion = time.perf_counter() - inicio
+    print(f"Fuente: {config['tipo']} - carga completa en {duracion:.2f} s")
+    for hoja, df in datos.items():
+        print(f"  {hoja:<8} {len(df):>8} filas  {len(df.columns):>4} columnas")
+    for hoja, columnas in columnas_faltantes(datos).items():
+        print(f"  Aviso: faltan en {hoja} las columnas {', '.join(columnas)}")
+    for hoja, estadisticas in estadisticas_carga.items():
+        print(f"  {hoja:<8} leída por bloques: {estadisticas['Bloques']} bloques, {estadisticas['Filas/s']} filas/s")
+    for libro, estadisticas in estadisticas_libros.items():
+        print(f"  Libro {libro}: {'reutilizado' if estadisticas['Reutilizado'] else 'descargado'} en {estadisticas['Segundos']} s")
+
+    if args.accion == "exportar":
+        if not args.destino:
+            parser.error("exportar requiere --destino")
+        exportar_datos(datos, args.destino, args.formato)
+        print(f"Exportado en {args.destino} ({args.formato})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
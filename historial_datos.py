@@ -0,0 +1,281 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import fuentes_datos
+
+try:
+    import fcntl
+except ImportError:                 # Windows: sin candado entre procesos
+    fcntl = None
+
+###########################################################
+# HISTORIAL VERSIONADO DE LAS BASES DEL SICOIN (CORTES POR ACTUALIZACIÓN)
+###########################################################
+#
+# Cada recarga de la fuente se guarda como un "corte": una entrada en manifiesto.json que apunta a una versión de cada hoja.
+# Las versiones se identifican por el hash de su contenido, por lo que una hoja que no cambió entre recargas reutiliza la
+# partición anterior (no se vuelve a escribir) y una recarga sin cambios en ninguna hoja no crea un corte nuevo.
+#
+#   historial/
+#     manifiesto.json                              -> lista de cortes: id, fecha, fuente y versión/filas por hoja
+#     hojas/ACTRI/<version>.datos.parquet          -> la hoja completa (Parquet comprimido con zstd)
+#     hojas/ACTRI/<version>.firmas.parquet         -> por fila: posición, hash de la clave y hash del contenido
+#
+# Las diferencias entre dos cortes se calculan con un cruce por hash de clave sobre los archivos de firmas (16 bytes por
+# fila), sin cargar las hojas completas; solo se leen de los Parquet las filas que cambiaron para mostrar el detalle.
+# La carpeta se configura en la sección [historial] de los secrets (ruta, conservar, activo) o con SICOIN_HISTORIAL; por
+# defecto es historial/ junto a este archivo (no depende del directorio desde el que se lanza la app o el refrescador).
+#
+# Varios procesos pueden registrar cortes a la vez (procesos de la app sin snapshot compartido, el refrescador, cron): el
+# registro completo (particiones, manifiesto y depuración) se hace bajo un candado de archivo (historial.lock).
+
+HISTORIAL_PREDETERMINADO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "historial")
+CONSERVAR_PREDETERMINADO = 720         # Cortes que se conservan (unos 30 días de recargas horarias con cambios)
+COMPRESION = "zstd"
+FILAS_DETALLE = 200                    # Máximo de filas por hoja que se leen para mostrar el detalle de los cambios
+
+# Columnas que identifican una fila en cada hoja; las claves repetidas (p. ej. AC duplicadas) se distinguen por su orden
+CLAVES_HOJA = {
+    "PTAR": ["Año", "Institución"],
+    "ACTRI": ["Año", "Institución", "AC"],
+    "PTCI": ["Año", "Institución"],
+    "AMTRI": ["Año", "Trimestre", "Institución", "AM"],
+    "NOMBRES": ["NOMBRE_SICOIN"]
+}
+FIRMAS_VACIAS = pd.DataFrame({"fila": pd.Series(dtype="int64"), "clave": pd.Series(dtype="uint64"), "contenido": pd.Series(dtype="uint64")})
+
+
+#============================================ CONFIGURACIÓN Y RUTAS ============================================================
+def configuracion_historial(secretos):
+    config = dict(secretos.get("historial", {}))
+    if os.environ.get("SICOIN_HISTORIAL"):
+        config["ruta"] = os.environ["SICOIN_HISTORIAL"]
+    config.setdefault("ruta", HISTORIAL_PREDETERMINADO)
+    config.setdefault("conservar", CONSERVAR_PREDETERMINADO)
+    config.setdefault("activo", True)
+    return config
+
+def ruta_version(config, hoja, version, tipo="datos"):
+    return os.path.join(config["ruta"], "hojas", hoja, f"{version}.{tipo}.parquet")
+
+def escribir_atomico(ruta, escribir):
+    # Se escribe en un temporal y se renombra: otro proceso nunca ve un archivo a medio escribir
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"         # Único también entre hilos del mismo proceso
+    try:
+        escribir(temporal)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+@contextmanager
+def candado_archivo(ruta):
+    # Candado exclusivo entre procesos (flock); se libera al cerrar el archivo, también si el proceso termina
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "a") as archivo:
+        if fcntl is not None:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+        yield
+
+
+#============================================ MANIFIESTO DE CORTES ============================================================
+def leer_manifiesto(config):
+    ruta = os.path.join(config["ruta"], "manifiesto.json")
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, encoding="utf-8") as archivo:
+        return json.load(archivo)["cortes"]
+
+def escribir_manifiesto(config, cortes):
+    def escribir(temporal):
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"cortes": cortes}, archivo, ensure_ascii=False, indent=1)
+    escribir_atomico(os.path.join(config["ruta"], "manifiesto.json"), escribir)
+
+def buscar_corte(config, id_corte):
+    for corte in leer_manifiesto(config):
+        if corte["id"] == id_corte:
+            return corte
+    raise KeyError(f"No existe el corte {id_corte} en {config['ruta']}")
+
+def etiqueta_corte(corte):
+    return datetime.datetime.fromisoformat(corte["fecha"]).strftime("%d/%m/%Y %I:%M %p")
+
+
+#============================================ FIRMAS Y VERSIONES DE CADA HOJA ============================================================
+def firmas_hoja(texto, hoja):
+    contenido = pd.util.hash_pandas_object(texto, index=False).to_numpy()
+    claves = [c for c in CLAVES_HOJA.get(hoja, []) if c in texto.columns]
+    if claves:
+        llave = texto[claves].copy()
+        llave["ocurrencia"] = llave.groupby(claves, sort=False, dropna=False).cumcount()
+        clave = pd.util.hash_pandas_object(llave, index=False).to_numpy()
+    else:
+        clave = np.arange(len(texto), dtype="uint64")          # Sin columnas clave se compara por posición
+    return pd.DataFrame({"fila": np.arange(len(texto), dtype="int64"), "clave": clave, "contenido": contenido})
+
+def version_hoja(texto, firmas):
+    resumen = hashlib.sha1("\x1f".join(texto.columns).encode("utf-8"))
+    resumen.update(firmas["contenido"].to_numpy().tobytes())
+    return resumen.hexdigest()[:16]
+
+def leer_firmas(config, hoja, version):
+    if version is None:
+        return FIRMAS_VACIAS
+    return pd.read_parquet(ruta_version(config, hoja, version, "firmas"))
+
+def filas_version(config, hoja, version, posiciones):
+    # Lee solo las filas indicadas de la partición (mapeada en memoria), sin convertir la hoja completa a DataFrame
+    tabla = pq.read_table(ruta_version(config, hoja, version), memory_map=True)
+    return tabla.take(pa.array(np.asarray(posiciones, dtype="int64"))).to_pandas()
+
+
+#============================================ REGISTRO Y CARGA DE CORTES ============================================================
+def registrar_corte(datos, config, fuente=""):
+    # Todo bajo el candado: otro proceso no puede depurar una partición recién escrita antes de que su corte llegue al
+    # manifiesto, ni escribir el manifiesto entre nuestra lectura y nuestra escritura (se perdería su corte)
+    with candado_archivo(os.path.join(config["ruta"], "historial.lock")):
+        return registrar_corte_bloqueado(datos, config, fuente)
+
+def registrar_corte_bloqueado(datos, config, fuente):
+    cortes = leer_manifiesto(config)
+    hojas = {}
+    for hoja, df in datos.items():
+        texto = fuentes_datos.texto_para_archivo(df)
+        firmas = firmas_hoja(texto, hoja)
+        version = version_hoja(texto, firmas)
+        if not os.path.exists(ruta_version(config, hoja, version)):          # Hoja sin cambios: se reutiliza la partición existente
+            escribir_atomico(ruta_version(config, hoja, version, "firmas"), lambda t: firmas.to_parquet(t, index=False, compression=COMPRESION))
+            escribir_atomico(ruta_version(config, hoja, version), lambda t: texto.to_parquet(t, index=False, compression=COMPRESION))
+        hojas[hoja] = {"version": version, "filas": len(df)}
+
+    # Recarga sin cambios en ninguna hoja: no se crea un corte nuevo
+    if cortes and cortes[-1]["hojas"] == hojas:
+        return cortes[-1]["id"]
+
+    ahora = datetime.datetime.now()
+    # Microsegundos y un sufijo aleatorio: el id no se repite aunque un corte del mismo segundo ya se haya depurado
+    # (las alertas y la API recuerdan ids de cortes anteriores)
+    id_corte = f"{ahora.strftime('%Y%m%dT%H%M%S')}.{ahora.microsecond:06d}-{uuid.uuid4().hex[:4]}"
+    corte = {"id": id_corte, "fecha": ahora.isoformat(timespec="seconds"), "fuente": fuente, "hojas": hojas}
+    cortes.append(corte)
+    conservar = int(config.get("conservar", CONSERVAR_PREDETERMINADO))
+    depurar = conservar > 0 and len(cortes) > conservar
+    if depurar:
+        cortes = cortes[-conservar:]
+    escribir_manifiesto(config, cortes)
+    if depurar:
+        depurar_versiones(config, cortes)
+    return corte["id"]
+
+def depurar_versiones(config, cortes):
+    # Elimina las particiones que ya no usa ningún corte conservado (solo se llama bajo el candado de registrar_corte)
+    usadas = {(hoja, info["version"]) for corte in cortes for hoja, info in corte["hojas"].items()}
+    carpeta = os.path.join(config["ruta"], "hojas")
+    for hoja in os.listdir(carpeta):
+        for archivo in os.listdir(os.path.join(carpeta, hoja)):
+            if (hoja, archivo.split(".")[0]) not in usadas and not archivo.endswith(".tmp"):
+                os.remove(os.path.join(carpeta, hoja, archivo))
+
+def cargar_corte(config, id_corte):
+    corte = buscar_corte(config, id_corte)
+    return {hoja: fuentes_datos.tipar_hoja(pd.read_parquet(ruta_version(config, hoja, info["version"])))
+            for hoja, info in corte["hojas"].items()}
+
+
+#============================================ DIFERENCIAS ENTRE CORTES ============================================================
+def comparar_cortes(config, id_anterior, id_posterior):
+    # Por hoja: filas agregadas, eliminadas y modificadas con su posición en cada corte (cruce por hash de clave)
+    anterior, posterior = buscar_corte(config, id_anterior), buscar_corte(config, id_posterior)
+    cambios = {}
+    for hoja in fuentes_datos.HOJAS:
+        version_a = anterior["hojas"].get(hoja, {}).get("version")
+        version_b = posterior["hojas"].get(hoja, {}).get("version")
+        if version_a == version_b:
+            cambios[hoja] = pd.DataFrame(columns=["Cambio", "fila_anterior", "fila_posterior"])
+            continue
+        cruce = pd.merge(leer_firmas(config, hoja, version_a), leer_firmas(config, hoja, version_b), on="clave",
+                         how="outer", suffixes=("_anterior", "_posterior"), indicator=True)
+        cruce["Cambio"] = np.select(
+            [cruce["_merge"] == "right_only", cruce["_merge"] == "left_only", cruce["contenido_anterior"] != cruce["contenido_posterior"]],
+            ["Agregada", "Eliminada", "Modificada"], default="")
+        cruce = cruce[cruce["Cambio"] != ""].sort_values(["fila_posterior", "fila_anterior"])
+        cambios[hoja] = cruce[["Cambio", "fila_anterior", "fila_posterior"]].astype({"fila_anterior": "Int64", "fila_posterior": "Int64"})
+    return cambios
+
+def resumen_cambios(cambios):
+    return pd.DataFrame([{
+        "Base": hoja,
+        "Agregadas": int((tabla["Cambio"] == "Agregada").sum()),
+        "Eliminadas": int((tabla["Cambio"] == "Eliminada").sum()),
+        "Modificadas": int((tabla["Cambio"] == "Modificada").sum())
+    } for hoja, tabla in cambios.items()])
+
+def detalle_cambios(config, id_anterior, id_posterior, hoja, cambios, limite=FILAS_DETALLE):
+    # Filas que cambiaron (la versión posterior, o la anterior si se eliminó) y las columnas que se modificaron
+    cambios = cambios.head(limite).reset_index(drop=True)
+    con_anterior = np.flatnonzero(cambios["fila_anterior"].notna())
+    con_posterior = np.flatnonzero(cambios["fila_posterior"].notna())
+    filas_a = pd.DataFrame(index=con_anterior)
+    filas_b = pd.DataFrame(index=con_posterior)
+    if len(con_anterior):
+        version = buscar_corte(config, id_anterior)["hojas"][hoja]["version"]
+        filas_a = filas_version(config, hoja, version, cambios["fila_anterior"].iloc[con_anterior]).set_axis(con_anterior)
+    if len(con_posterior):
+        version = buscar_corte(config, id_posterior)["hojas"][hoja]["version"]
+        filas_b = filas_version(config, hoja, version, cambios["fila_posterior"].iloc[con_posterior]).set_axis(con_posterior)
+
+    detalle = pd.concat([filas_b, filas_a.drop(index=con_posterior, errors="ignore")]).sort_index()
+    modificadas = np.intersect1d(con_anterior, con_posterior)
+    columnas_modificadas = pd.Series("", index=cambios.index)
+    for pos in modificadas:
+        antes, despues = filas_a.loc[pos], filas_b.loc[pos]
+        columnas = antes.index.union(despues.index, sort=False)
+        columnas_modificadas[pos] = ", ".join(c for c in columnas if str(antes.get(c)) != str(despues.get(c)))
+
+    detalle.insert(0, "Columnas Modificadas", columnas_modificadas)
+    detalle.insert(0, "Cambio", cambios["Cambio"])
+    return detalle.astype(str)
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+# python historial_datos.py registrar            -> descarga la fuente configurada y guarda un corte (p. ej. desde cron)
+# python historial_datos.py listar               -> cortes guardados con la versión de cada hoja
+# python historial_datos.py comparar ID_A ID_B   -> filas agregadas, eliminadas y modificadas por hoja entre dos cortes
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Historial versionado de las bases del SICOIN")
+    parser.add_argument("accion", choices=["registrar", "listar", "comparar"])
+    parser.add_argument("cortes", nargs="*", help="Identificadores de los cortes a comparar (anterior y posterior)")
+    args = parser.parse_args(argumentos)
+
+    secretos = fuentes_datos.leer_secretos()
+    config = configuracion_historial(secretos)
+    if args.accion == "registrar":
+        config_fuente, credenciales = fuentes_datos.configuracion_fuente(secretos)
+        id_corte = registrar_corte(fuentes_datos.cargar_datos(config_fuente, credenciales), config, config_fuente["tipo"])
+        print(f"Corte registrado: {id_corte}")
+    elif args.accion == "listar":
+        for corte in leer_manifiesto(config):
+            hojas = "  ".join(f"{hoja}={info['version'][:8]}({info['filas']})" for hoja, info in corte["hojas"].items())
+            print(f"{corte['id']}  {etiqueta_corte(corte)}  {hojas}")
+    else:
+        if len(args.cortes) != 2:
+            parser.error("comparar requiere dos identificadores de corte")
+        print(resumen_cambios(comparar_cortes(config, *args.cortes)).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
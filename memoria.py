@@ -0,0 +1,217 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+import cache_vistas
+
+try:
+    import resource             # Solo en Unix: pico de memoria del proceso cuando no existe /proc
+except ImportError:
+    resource = None
+
+###########################################################
+# CONTABILIDAD DE MEMORIA DEL PROCESO (DATAFRAMES, CACHÉS Y SESIONES)
+###########################################################
+#
+# En instancias pequeñas el proceso se terminaba por falta de memoria sin saber qué la ocupaba. Este módulo mide:
+#   - los DataFrames de cada hoja (crudos y limpios) con memory_usage(deep=True),
+#   - cada entrada de st.cache_resource y st.cache_data y el caché de vistas renderizadas (cache_vistas.py),
+#   - el session_state de cada sesión activa,
+#   - la memoria residente (RSS) del proceso a lo largo del tiempo (un hilo toma una muestra cada MUESTREO_SEGUNDOS).
+#
+# Deduplicación de textos (opcional, [memoria] deduplicar = true o SICOIN_DEDUPLICAR=1): las columnas de texto muy repetidas
+# (Institución, Sector, Siglas y descripciones) se guardan como categóricas, es decir, cada valor distinto una sola vez.
+# El panel de REPORTES muestra los bytes que ahorra aunque no esté activa.
+#
+# Cachés de Streamlit y sesiones: se prefieren las estadísticas públicas del runtime (stats_mgr.get_stats, las mismas que
+# publica /_stcore/metrics) para las sesiones activas y los bytes de st.cache_data. Los MB estimados de cada función de
+# st.cache_resource y el session_state de cada sesión solo se pueden leer de estructuras internas. Si una lectura falla
+# (p. ej. otra versión de Streamlit) se avisa una sola vez en stderr y la función devuelve None, que el panel y las métricas
+# muestran como "no disponible" en lugar de tablas vacías o 0 sesiones. Sin servidor (AppTest, scripts) tampoco hay sesiones
+# ni estadísticas del runtime: también es None, sin aviso.
+
+MUESTREO_SEGUNDOS = 30
+MUESTRAS_GUARDADAS = 720                   # 6 horas de muestras cada 30 s
+COLUMNAS_DEDUPLICABLES = ["Institución", "Sector", "Siglas", "Riesgo", "Descripción_del_Riesgo", "Descripcion", "Procesos",
+                          "NOMBRE_SICOIN", "SECTOR_SICOIN", "SECTOR_PEF", "NOMBRE_PEF"]
+PROPORCION_DISTINTOS = 0.5                 # Solo se convierten columnas con a lo más un valor distinto por cada dos filas
+
+
+#============================================ TAMAÑOS ============================================================
+def bytes_dataframe(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def mb(n_bytes):
+    return round(n_bytes / 1024 / 1024, 2)
+
+def tamaño_objeto(valor):
+    # Igual que los artefactos del caché de vistas; los diccionarios de la app (motor, caché, historial) se recorren
+    # y las conexiones a DuckDB/SQLite cuentan solo su objeto de Python (su memoria nativa está dentro del RSS)
+    try:
+        return cache_vistas.tamaño_artefacto(valor)
+    except Exception:
+        return 0
+
+def memoria_hojas(datos_crudos, datos_limpios):
+    filas = []
+    for hoja in datos_crudos:
+        crudo = bytes_dataframe(datos_crudos[hoja])
+        limpio = bytes_dataframe(datos_limpios[hoja]) if hoja in datos_limpios else 0
+        filas.append({"Hoja": hoja, "Filas": len(datos_crudos[hoja]), "Columnas": len(datos_crudos[hoja].columns),
+                      "MB Crudo": mb(crudo), "MB Limpio": mb(limpio)})
+    return pd.DataFrame(filas)
+
+
+#============================================ MEMORIA RESIDENTE DEL PROCESO ============================================================
+def rss_mb():
+    # Memoria residente actual (Linux); en otros Unix el pico histórico; None si no se puede medir
+    try:
+        with open("/proc/self/statm") as archivo:
+            return mb(int(archivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return mb(pico if os.uname().sysname == "Darwin" else pico * 1024)     # macOS reporta bytes; Linux, KB
+    return None
+
+def crear_monitor(cada=MUESTREO_SEGUNDOS, muestras=MUESTRAS_GUARDADAS):
+    # Un hilo en segundo plano guarda (momento, MB) del RSS; la app lo crea una sola vez con st.cache_resource
+    monitor = {"muestras": deque(maxlen=muestras), "cada": cada, "candado": threading.Lock()}
+
+    def muestrear_siempre():
+        while True:
+            muestrear(monitor)
+            time.sleep(cada)
+
+    threading.Thread(target=muestrear_siempre, name="monitor_memoria", daemon=True).start()
+    return monitor
+
+def muestrear(monitor):
+    rss = rss_mb()
+    if rss is not None:
+        with monitor["candado"]:
+            monitor["muestras"].append((pd.Timestamp.now().floor("s"), rss))
+
+def historial_rss(monitor):
+    with monitor["candado"]:
+        return pd.DataFrame(list(monitor["muestras"]), columns=["Momento", "MB RSS"])
+
+
+#============================================ CACHÉS DE STREAMLIT Y SESIONES ============================================================
+lecturas_fallidas = set()
+candado_avisos = threading.Lock()
+
+def avisar_una_vez(lectura, error):
+    with candado_avisos:
+        if lectura in lecturas_fallidas:
+            return
+        lecturas_fallidas.add(lectura)
+    print(f"Memoria: no se pudo leer {lectura} de Streamlit ({type(error).__name__}: {error}); se muestra como no disponible",
+          file=sys.stderr, flush=True)
+
+def runtime_activo():
+    # Runtime del servidor, o None en scripts y en AppTest (que instala un Runtime simulado, sin sesiones ni estadísticas)
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.stats import StatsManager
+
+    if not Runtime.exists():
+        return None
+    runtime = Runtime.instance()
+    return runtime if isinstance(runtime.stats_mgr, StatsManager) else None
+
+def entradas_cache_resource():
+    # Cada valor guardado con st.cache_resource (función, entradas y MB estimados). El runtime solo publica el número de
+    # entradas (sus bytes reales requieren server.enableExpensiveMemoryStats), así que los valores se leen del caché interno
+    try:
+        from streamlit.runtime.caching.cache_resource_api import _resource_caches
+        with _resource_caches._caches_lock:
+            caches = [cache for por_sesion in _resource_caches._function_caches.values() for cache in por_sesion.values()]
+        filas = []
+        for cache in caches:
+            with cache._mem_cache_lock:
+                valores = [resultado.value for resultado in cache._mem_cache.values()]
+            if valores:
+                filas.append({"Función": cache.display_name.split(".")[-1], "Entradas": len(valores),
+                              "MB": mb(sum(tamaño_objeto(valor) for valor in valores))})
+        return pd.DataFrame(filas, columns=["Función", "Entradas", "MB"])
+    except Exception as e:
+        avisar_una_vez("st.cache_resource", e)
+        return None
+
+def entradas_cache_data():
+    # st.cache_data guarda cada resultado serializado (pickle): el runtime publica sus bytes por función. Sin servidor se
+    # consulta directamente el mismo proveedor de estadísticas que el runtime registra
+    try:
+        from streamlit.runtime.caching import get_data_cache_stats_provider
+        from streamlit.runtime.stats import CACHE_MEMORY_FAMILY
+
+        runtime = runtime_activo()
+        proveedor = runtime.stats_mgr if runtime is not None else get_data_cache_stats_provider()
+        estadisticas = proveedor.get_stats([CACHE_MEMORY_FAMILY]).get(CACHE_MEMORY_FAMILY, [])
+        filas = [{"Función": estadistica.cache_name.split(".")[-1], "MB": mb(estadistica.byte_length)}
+                 for estadistica in estadisticas if estadistica.category_name == "st_cache_data"]
+        return pd.DataFrame(filas, columns=["Función", "MB"])
+    except Exception as e:
+        avisar_una_vez("st.cache_data", e)
+        return None
+
+def sesiones_activas():
+    # Número de sesiones activas (estadística pública active_sessions); None sin servidor o si no se puede leer
+    try:
+        from streamlit.runtime.stats import ACTIVE_SESSIONS_FAMILY
+
+        runtime = runtime_activo()
+        if runtime is None:
+            return None
+        estadisticas = runtime.stats_mgr.get_stats([ACTIVE_SESSIONS_FAMILY]).get(ACTIVE_SESSIONS_FAMILY, [])
+        return int(sum(estadistica.value for estadistica in estadisticas))
+    except Exception as e:
+        avisar_una_vez("las sesiones activas", e)
+        return None
+
+def memoria_sesiones():
+    # Tamaño del session_state de cada sesión activa del proceso (el runtime solo publica el total de todas las sesiones)
+    try:
+        runtime = runtime_activo()
+        if runtime is None:
+            return None
+        filas = []
+        for info in runtime._session_mgr.list_active_sessions():
+            estado = info.session.session_state
+            claves = list(estado.filtered_state.items())
+            filas.append({"Sesión": info.session.id[:8], "Claves": len(claves),
+                          "KB": round(sum(tamaño_objeto(valor) for _, valor in claves) / 1024, 1)})
+        return pd.DataFrame(filas, columns=["Sesión", "Claves", "KB"])
+    except Exception as e:
+        avisar_una_vez("el session_state de las sesiones", e)
+        return None
+
+
+#============================================ DEDUPLICACIÓN DE TEXTOS ============================================================
+def columnas_deduplicables(df):
+    return [col for col in COLUMNAS_DEDUPLICABLES
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype) and len(df)
+            and df[col].nunique(dropna=False) <= len(df) * PROPORCION_DISTINTOS]
+
+def deduplicar_textos(df):
+    # Copia de la hoja con las columnas de texto repetidas como categóricas
+    columnas = columnas_deduplicables(df)
+    if not columnas:
+        return df
+    return df.astype({col: "category" for col in columnas})
+
+def ahorro_deduplicacion(datos):
+    # Bytes de cada columna deduplicable antes y después de convertirla (sin modificar los datos)
+    filas = []
+    for hoja, df in datos.items():
+        for col in columnas_deduplicables(df):
+            antes = int(df[col].memory_usage(index=False, deep=True))
+            despues = int(df[col].astype("category").memory_usage(index=False, deep=True))
+            filas.append({"Hoja": hoja, "Columna": col, "Distintos": df[col].nunique(), "KB Antes": round(antes / 1024, 1),
+                          "KB Después": round(despues / 1024, 1), "KB Ahorrados": round((antes - despues) / 1024, 1)})
+    return pd.DataFrame(filas, columns=["Hoja", "Columna", "Distintos", "KB Antes", "KB Después", "KB Ahorrados"])
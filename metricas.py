@@ -0,0 +1,200 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fuentes_datos
+
+###########################################################
+# MÉTRICAS EN FORMATO DE TEXTO DE PROMETHEUS (PUERTO LATERAL)
+###########################################################
+#
+# La app y el refrescador exponen en http://127.0.0.1:<puerto>/metrics los tiempos de descarga de la fuente, las filas por
+# hoja, la edad de los datos cargados, los aciertos y fallos de los cachés (carga, limpieza, listas de filtros y vistas
+# renderizadas), la latencia de cada ejecución del script y de cada pestaña, y las sesiones activas. El monitoreo existente
+# puede así alertar sobre descargas lentas o falta de capacidad.
+#
+#   [metricas]
+#   puerto = 9464                 # 0 desactiva el servidor (SICOIN_METRICAS_PUERTO tiene prioridad)
+#   host = "127.0.0.1"            # "0.0.0.0" para que lo consulte un Prometheus en otra máquina
+#
+#   [refrescador]
+#   puerto_metricas = 9465        # el refrescador usa su propio puerto (o --puerto-metricas)
+#
+# Sin dependencias adicionales: el registro es un diccionario del módulo (compartido por todas las sesiones del proceso) y
+# el servidor es http.server de la biblioteca estándar en un hilo en segundo plano. Los valores que cambian solos (edad de
+# los datos, sesiones, contadores del caché de vistas) se calculan en cada consulta con las funciones de registrar_medidor;
+# si un medidor falla se avisa en stderr la primera vez (no en cada consulta de Prometheus) y otra vez si se recupera y
+# vuelve a fallar.
+#
+# Procesos que terminan (refrescador.py --una-vez desde cron) no tienen servidor: escribir_archivo deja las mismas líneas en
+# un archivo .prom para el textfile collector de node_exporter. prueba_metricas.py consulta /metrics en un puerto libre y
+# revisa las líneas HELP/TYPE de las series de descarga, cachés y ejecuciones.
+
+PUERTO_PREDETERMINADO = 9464
+HOST_PREDETERMINADO = "127.0.0.1"
+LIMITES_HISTOGRAMA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)     # Segundos
+
+# Nombre -> (tipo, descripción). Solo se exponen las métricas declaradas aquí
+DEFINICIONES = {
+    "sicoin_descarga_segundos": ("histogram", "Duración de cada descarga completa de la fuente de datos"),
+    "sicoin_descarga_hoja_segundos": ("gauge", "Duración de la última descarga de cada hoja de Sheets"),
+    "sicoin_descarga_filas": ("gauge", "Filas de cada hoja en la última descarga"),
+    "sicoin_descargas_total": ("counter", "Descargas completas de la fuente de datos"),
+    "sicoin_descarga_fallos_total": ("counter", "Descargas de la fuente que fallaron después de los reintentos"),
+    "sicoin_datos_edad_segundos": ("gauge", "Segundos desde la última descarga correcta de los datos en uso"),
+    "sicoin_sheets_peticiones_total": ("counter", "Peticiones a la API de Sheets"),
+    "sicoin_sheets_reintentos_total": ("counter", "Reintentos de peticiones a Sheets por cuota o errores del servidor"),
+    "sicoin_sheets_espera_segundos_total": ("counter", "Segundos de espera impuestos por el limitador de peticiones de Sheets"),
+    "sicoin_cache_consultas_total": ("counter", "Consultas a cada caché de la app"),
+    "sicoin_cache_fallos_total": ("counter", "Consultas a cada caché que tuvieron que calcular el resultado"),
+    "sicoin_ejecucion_segundos": ("histogram", "Duración de cada ejecución completa del script de la app"),
+    "sicoin_pestana_segundos": ("histogram", "Duración del bloque de cada pestaña dentro de una ejecución"),
+    "sicoin_sesiones_activas": ("gauge", "Sesiones de Streamlit activas en el proceso"),
+    "sicoin_alertas_total": ("counter", "Discrepancias nuevas y resueltas publicadas por las alertas"),
+    "sicoin_alertas_abiertas": ("gauge", "Discrepancias abiertas después de la última revisión"),
+    "sicoin_html_bytes": ("gauge", "Bytes del último HTML enviado por cada vista (tablas y tarjetas)"),
+    "sicoin_html_excedido_total": ("counter", "Veces que el HTML de una vista excedió el presupuesto de bytes"),
+    "sicoin_refresco_exito": ("gauge", "1 si la última ejecución del refrescador publicó una versión, 0 si falló"),
+    "sicoin_refresco_marca_segundos": ("gauge", "Momento (epoch) de la última ejecución del refrescador"),
+}
+
+registro = {"valores": {nombre: {} for nombre in DEFINICIONES}, "medidores": [], "medidores_con_error": set(),
+            "candado": threading.Lock()}
+
+
+#============================================ REGISTRO DE VALORES ============================================================
+def clave_etiquetas(etiquetas):
+    return tuple(sorted((nombre, str(valor)) for nombre, valor in etiquetas.items()))
+
+def contar(nombre, valor=1, **etiquetas):
+    clave = clave_etiquetas(etiquetas)
+    with registro["candado"]:
+        valores = registro["valores"][nombre]
+        valores[clave] = valores.get(clave, 0) + valor
+
+def fijar(nombre, valor, **etiquetas):
+    with registro["candado"]:
+        registro["valores"][nombre][clave_etiquetas(etiquetas)] = valor
+
+def observar(nombre, segundos, **etiquetas):
+    clave = clave_etiquetas(etiquetas)
+    with registro["candado"]:
+        histograma = registro["valores"][nombre].setdefault(clave, {"cubetas": [0] * len(LIMITES_HISTOGRAMA), "suma": 0.0, "cuenta": 0})
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if segundos <= limite:
+                histograma["cubetas"][i] += 1
+        histograma["suma"] += segundos
+        histograma["cuenta"] += 1
+
+@contextmanager
+def cronometro(nombre, **etiquetas):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+def registrar_medidor(funcion):
+    # funcion() se llama antes de cada consulta y usa fijar() para los valores que se calculan al momento
+    with registro["candado"]:
+        registro["medidores"].append(funcion)
+
+
+#============================================ MEDICIONES COMUNES A LA APP Y AL REFRESCADOR ============================================================
+def registrar_descarga(datos, segundos):
+    # Duración total, filas por hoja y duración por hoja (solo Sheets) de una descarga correcta de la fuente
+    contar("sicoin_descargas_total")
+    observar("sicoin_descarga_segundos", segundos)
+    for hoja, df in datos.items():
+        fijar("sicoin_descarga_filas", len(df), hoja=hoja)
+    for hoja, segundos_hoja in fuentes_datos.segundos_por_hoja.items():
+        fijar("sicoin_descarga_hoja_segundos", segundos_hoja, hoja=hoja)
+
+def medir_limitador_sheets():
+    limitador = fuentes_datos.limitador_sheets
+    fijar("sicoin_sheets_peticiones_total", limitador["peticiones"])
+    fijar("sicoin_sheets_reintentos_total", limitador["reintentos"])
+    fijar("sicoin_sheets_espera_segundos_total", round(limitador["segundos_en_espera"], 3))
+
+
+#============================================ FORMATO DE TEXTO DE PROMETHEUS ============================================================
+def formato_etiquetas(clave, extra=()):
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ""
+    escapar = lambda valor: valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares) + "}"
+
+def texto_prometheus():
+    with registro["candado"]:
+        medidores = list(registro["medidores"])
+    for medidor in medidores:
+        try:
+            medidor()
+        except Exception as e:       # Un medidor con error no impide exponer las demás métricas
+            with registro["candado"]:
+                nuevo = medidor not in registro["medidores_con_error"]
+                registro["medidores_con_error"].add(medidor)
+            if nuevo:
+                print(f"Error en el medidor {getattr(medidor, '__name__', medidor)}: {e} (no se repetirá mientras siga fallando)",
+                      file=sys.stderr, flush=True)
+        else:
+            with registro["candado"]:
+                registro["medidores_con_error"].discard(medidor)
+
+    lineas = []
+    with registro["candado"]:
+        for nombre, (tipo, ayuda) in DEFINICIONES.items():
+            valores = registro["valores"][nombre]
+            if not valores:
+                continue
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for clave, valor in sorted(valores.items()):
+                if tipo != "histogram":
+                    lineas.append(f"{nombre}{formato_etiquetas(clave)} {valor}")
+                    continue
+                for limite, cuenta in zip(LIMITES_HISTOGRAMA, valor["cubetas"]):
+                    lineas.append(f"{nombre}_bucket{formato_etiquetas(clave, [('le', str(limite))])} {cuenta}")
+                lineas.append(f"{nombre}_bucket{formato_etiquetas(clave, [('le', '+Inf')])} {valor['cuenta']}")
+                lineas.append(f"{nombre}_sum{formato_etiquetas(clave)} {round(valor['suma'], 6)}")
+                lineas.append(f"{nombre}_count{formato_etiquetas(clave)} {valor['cuenta']}")
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_archivo(ruta):
+    # Se escribe en un temporal y se renombra: node_exporter nunca lee un archivo a medias
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        archivo.write(texto_prometheus())
+    os.replace(temporal, ruta)
+
+
+#============================================ SERVIDOR HTTP ============================================================
+class ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        cuerpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *argumentos):
+        pass                        # Sin una línea en la consola por cada consulta de Prometheus
+
+def iniciar_servidor(puerto=PUERTO_PREDETERMINADO, host=HOST_PREDETERMINADO):
+    # Devuelve el servidor o None si el puerto está ocupado (p. ej. otro proceso de la app en la misma máquina)
+    try:
+        servidor = ThreadingHTTPServer((host, puerto), ManejadorMetricas)
+    except OSError as e:
+        print(f"No se pudo exponer las métricas en {host}:{puerto}: {e}", file=sys.stderr, flush=True)
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="servidor_metricas", daemon=True).start()
+    return servidor
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb               # Opcional: motor columnar; si no está instalado se usa SQLite (biblioteca estándar)
+except ImportError:
+    duckdb = None
+
+###########################################################
+# MOTOR DE CONSULTAS SQL EMBEBIDO (DUCKDB O SQLITE)
+###########################################################
+#
+# Se carga una sola vez por snapshot con las columnas clave de las cinco hojas (más la posición de cada fila en su DataFrame)
+# e índices sobre Institución, Sector, Año y Trimestre. Los recortes por selección devuelven posiciones de fila, de modo que
+# la app sigue mostrando los DataFrames originales sin cambiar sus tipos; los agregados y cruces de REPORTES se resuelven
+# con consultas preparadas.
+#
+# El motor se elige con la sección [motor_consultas] de los secrets (tipo = "duckdb" o "sqlite") o con SICOIN_MOTOR;
+# por defecto se usa DuckDB si está instalado y SQLite en caso contrario.
+
+# Columnas de cada hoja que se cargan en el motor: texto (claves) y números (medidas)
+COLUMNAS_MOTOR = {
+    "PTAR": {"texto": ["Institución", "Institución_N", "Sector"], "numero": ["Año", "AC_Total"]},
+    "ACTRI": {"texto": ["Institución", "Institución_N", "Sector", "AC"], "numero": ["Año"]},
+    "PTCI": {"texto": ["Institución", "Institución_N", "Sector"], "numero": ["Año", "TotalAcciones_de_Mejora_Programa_Actualizado"]},
+    "AMTRI": {"texto": ["Institución", "Institución_N", "Sector", "AM", "Siglas"], "numero": ["Año", "Trimestre"]},
+    "NOMBRES": {"texto": ["NOMBRE_SICOIN", "SECTOR_SICOIN", "SECTOR_PEF", "NOMBRE_PEF", "COINCIDE"], "numero": []}
+}
+COLUMNAS_INDICE = ["Institución", "Sector", "Año", "Trimestre"]
+COLUMNAS_ENTERAS = ["Año", "Trimestre"]        # En el motor son REAL/DOUBLE; en los resultados vuelven a ser enteros como en las hojas
+
+
+#============================================ CONSULTAS PREPARADAS ============================================================
+CONSULTAS = {
+    # Recortes por selección (posiciones de fila en el DataFrame de la hoja)
+    "filas_sector": 'SELECT fila FROM {hoja} WHERE "Sector" = ? AND "Año" = ? ORDER BY fila',
+    "filas_institucion": 'SELECT fila FROM {hoja} WHERE "Institución" = ? AND "Año" = ? ORDER BY fila',
+
+    # PTAR vs ACTRI: AC_Total del PTAR (primer valor), total de acciones, acciones únicas y duplicadas por Institución y Año
+    "conciliacion_control": """
+        WITH grupo_ptar AS (
+            SELECT "Institución_N", "Año", "Institución", "AC_Total" FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY "Institución_N", "Año" ORDER BY "AC_Total" IS NULL, fila) AS n
+                FROM PTAR WHERE "Año" IS NOT NULL
+            ) WHERE n = 1
+        ),
+        grupo_actri AS (
+            SELECT "Institución_N", "Año", COUNT(*) AS "Acciones_ACTRI", COUNT(DISTINCT "AC") AS "Acciones_ACTRI_Unique"
+            FROM ACTRI WHERE "Año" IS NOT NULL GROUP BY "Institución_N", "Año"
+        ),
+        duplicados AS (
+            SELECT "Institución_N", "Año", SUM(n - 1) AS "Cantidad_Duplicados" FROM (
+                SELECT "Institución_N", "Año", "AC", COUNT(*) AS n FROM ACTRI
+                WHERE "Año" IS NOT NULL AND "AC" IS NOT NULL GROUP BY "Institución_N", "Año", "AC"
+            ) WHERE n > 1 GROUP BY "Institución_N", "Año"
+        ),
+        claves AS (
+            SELECT "Institución_N", "Año" FROM grupo_ptar UNION SELECT "Institución_N", "Año" FROM grupo_actri
+        )
+        SELECT claves."Institución_N", claves."Año", grupo_ptar."Institución", grupo_ptar."AC_Total",
+               grupo_actri."Acciones_ACTRI", grupo_actri."Acciones_ACTRI_Unique", duplicados."Cantidad_Duplicados"
+        FROM claves
+        LEFT JOIN grupo_ptar ON grupo_ptar."Institución_N" = claves."Institución_N" AND grupo_ptar."Año" = claves."Año"
+        LEFT JOIN grupo_actri ON grupo_actri."Institución_N" = claves."Institución_N" AND grupo_actri."Año" = claves."Año"
+        LEFT JOIN duplicados ON duplicados."Institución_N" = claves."Institución_N" AND duplicados."Año" = claves."Año"
+    """,
+
+    # Claves AC repetidas en ACTRI (con el nombre real de la institución)
+    "duplicados_ac": """
+        SELECT "Institución", "Año", "AC", COUNT(*) AS size FROM ACTRI
+        WHERE "AC" IS NOT NULL GROUP BY "Institución", "Año", "AC" HAVING COUNT(*) > 1
+        ORDER BY "Institución", "Año", "AC"
+    """,
+
+    # PTCI vs AMTRI (Trimestre 4): programa actualizado (primer valor) contra acciones registradas en el sistema
+    "conciliacion_mejora": """
+        WITH grupo_ptci AS (
+            SELECT "Institución_N", "Año", "Institución", "TotalAcciones_de_Mejora_Programa_Actualizado" FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY "Institución_N", "Año"
+                                             ORDER BY "TotalAcciones_de_Mejora_Programa_Actualizado" IS NULL, fila) AS n
+                FROM PTCI WHERE "Año" IS NOT NULL
+            ) WHERE n = 1
+        ),
+        grupo_amtri AS (
+            SELECT "Institución_N", "Año", COUNT(*) AS "Acciones_AMTRI" FROM AMTRI
+            WHERE "Trimestre" = 4 AND "Año" IS NOT NULL GROUP BY "Institución_N", "Año"
+        ),
+        claves AS (
+            SELECT "Institución_N", "Año" FROM grupo_ptci UNION SELECT "Institución_N", "Año" FROM grupo_amtri
+        )
+        SELECT claves."Institución_N", claves."Año", grupo_ptci."Institución",
+               grupo_ptci."TotalAcciones_de_Mejora_Programa_Actualizado", grupo_amtri."Acciones_AMTRI"
+        FROM claves
+        LEFT JOIN grupo_ptci ON grupo_ptci."Institución_N" = claves."Institución_N" AND grupo_ptci."Año" = claves."Año"
+        LEFT JOIN grupo_amtri ON grupo_amtri."Institución_N" = claves."Institución_N" AND grupo_amtri."Año" = claves."Año"
+    """
+}
+
+
+#============================================ CARGA DEL MOTOR ============================================================
+def tipo_motor(config=None):
+    tipo = os.environ.get("SICOIN_MOTOR") or (config or {}).get("tipo", "auto")
+    if tipo == "auto":
+        return "duckdb" if duckdb is not None else "sqlite"
+    if tipo == "duckdb" and duckdb is None:
+        raise ImportError("El motor 'duckdb' requiere el paquete duckdb (pip install duckdb)")
+    if tipo not in ("duckdb", "sqlite"):
+        raise ValueError(f"Motor de consultas desconocido: {tipo}")
+    return tipo
+
+def tabla_motor(df, hoja):
+    # Solo las columnas que usan las consultas, con tipos uniformes (texto o número) y la posición de la fila
+    columnas = COLUMNAS_MOTOR[hoja]
+    tabla = pd.DataFrame({"fila": np.arange(len(df), dtype="int64")})
+    for col in columnas["texto"]:
+        if col in df.columns:
+            texto = df[col].astype(str).astype(object).to_numpy()
+            vacio = (df[col].isna() | (texto == "")).to_numpy()
+            tabla[col] = np.where(vacio, None, texto)
+        else:
+            tabla[col] = None
+    for col in columnas["numero"]:
+        tabla[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype="float64") if col in df.columns else np.nan
+    return tabla
+
+def crear_motor(datos, config=None):
+    tipo = tipo_motor(config)
+    tablas = {hoja: tabla_motor(datos[hoja], hoja) for hoja in COLUMNAS_MOTOR if hoja in datos}
+
+    if tipo == "duckdb":
+        conexion = duckdb.connect(":memory:")
+        for hoja, tabla in tablas.items():
+            conexion.register("tabla_temporal", tabla)
+            conexion.execute(f'CREATE TABLE {hoja} AS SELECT * FROM tabla_temporal')
+            conexion.unregister("tabla_temporal")
+    else:
+        conexion = sqlite3.connect(":memory:", check_same_thread=False)
+        for hoja, tabla in tablas.items():
+            tabla.to_sql(hoja, conexion, index=False)
+
+    # Índices sobre las columnas de filtrado (uno compuesto con Año para los recortes por selección)
+    for hoja, tabla in tablas.items():
+        for col in COLUMNAS_INDICE:
+            if col in tabla.columns:
+                compuesto = f', "Año"' if col in ("Institución", "Sector") else ""
+                conexion.execute(f'CREATE INDEX "idx_{hoja}_{col}" ON {hoja} ("{col}"{compuesto})')
+
+    # Las sesiones de Streamlit corren en hilos distintos y comparten el motor, por eso cada consulta usa un candado.
+    # "version" identifica el snapshot cargado (un motor por snapshot) para las claves de los cachés de vistas
+    return {"tipo": tipo, "conexion": conexion, "candado": threading.Lock(), "version": uuid.uuid4().hex[:12]}
+
+
+#============================================ EJECUCIÓN DE CONSULTAS ============================================================
+def parametro(valor):
+    # sqlite3 no acepta tipos de numpy (por ejemplo el Año que viene de un selectbox)
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+def consultar(motor, nombre, parametros=(), **formato):
+    sql = CONSULTAS[nombre].format(**formato)
+    parametros = [parametro(p) for p in parametros]
+    with motor["candado"]:
+        if motor["tipo"] == "duckdb":
+            resultado = motor["conexion"].execute(sql, parametros).df()
+        else:
+            resultado = pd.read_sql_query(sql, motor["conexion"], params=parametros)
+    for col in COLUMNAS_ENTERAS:
+        if col in resultado.columns:
+            resultado[col] = resultado[col].astype("Int64")
+    return resultado
+
+def filas(motor, hoja, sector, institucion, año):
+    # Posiciones de las filas de la hoja para la selección de la cabecera (Sector y Año, o Institución y Año)
+    if sector != "Todas":
+        resultado = consultar(motor, "filas_sector", (sector, año), hoja=hoja)
+    else:
+        resultado = consultar(motor, "filas_institucion", (institucion, año), hoja=hoja)
+    return resultado["fila"].to_numpy(dtype="int64")
@@ -0,0 +1,214 @@
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import fuentes_datos
+
+###########################################################
+# PRUEBA DE CARGA: SESIONES CONCURRENTES CONTRA LA APP
+###########################################################
+#
+# Simula N sesiones simultáneas de la app con streamlit.testing (AppTest), cada una en su propio hilo y dentro del mismo
+# proceso, igual que un servidor de Streamlit: las sesiones comparten st.cache_data / st.cache_resource y compiten por el GIL.
+# Cada sesión repite un guion de interacciones reales (cambiar institución, elegir un sector, cambiar el año, buscar texto y
+# volver a la vista por institución) y se mide la duración de cada rerun. Los cuerpos de los expanders (REPORTES) se ejecutan
+# en cada rerun aunque estén cerrados, por lo que todas sus tablas quedan incluidas en la medición.
+#
+# Los datos salen de una carpeta local (--ruta, p. ej. una exportación con fuentes_datos.py exportar) o se generan datos
+# sintéticos con --instituciones, de modo que no se necesitan credenciales de Google ni se consume la cuota de Sheets.
+#
+#   python prueba_carga.py --sesiones 1 2 4 8 --repeticiones 3
+#   python prueba_carga.py --ruta datos/ --sesiones 1 4 16 --csv carga.csv
+#
+# Por cada nivel de concurrencia se reportan los percentiles p50/p95/p99 de la duración de los reruns, los reruns por
+# segundo, el uso de CPU del proceso (100% = un núcleo) y la memoria residente (actual y máxima).
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+TIEMPO_MAXIMO_RERUN = 300       # Segundos antes de considerar que un rerun se quedó colgado
+CONSULTAS_BUSQUEDA = ["licitacion", "capacitacion personal", "manual de procedimientos", "contrato", "riesgo"]
+
+
+#============================================ DATOS SINTÉTICOS (FUENTE SIN CREDENCIALES) ============================================================
+SECTORES = ["Salud", "Educación", "Finanzas", "Seguridad", "Bienestar", "Desarrollo Económico"]
+COLUMNAS_RIESGO = ["Sustantivo", "Administrativo", "Financiero", "Presupuestal", "Servicios", "Seguridad", "Obra_Pública",
+                   "Recursos_Humanos", "Imagen", "TICs", "Salud", "Otro", "Corrupción", "Legal"]
+COLUMNAS_CUADRANTE = ["I", "II", "III", "IV"]
+COLUMNAS_ESTRATEGIA = ["Evitar", "Reducir", "Asumir", "Transferir", "Compartir"]
+ESTADOS = ["Sin_Avances", "En_Proceso", "Concluidas", "Cumplimiento"]
+
+def columnas_trimestrales(azar):
+    return {f"{t}{e}": azar.randint(0, 100) if e == "Cumplimiento" else azar.randint(0, 10) for t in "1234" for e in ESTADOS}
+
+def datos_sinteticos(instituciones=30, años=(2024, 2025), acciones=20, semilla=0):
+    # Mismas hojas y columnas que SICOIN_BASE, con volumen configurable
+    azar = random.Random(semilla)
+    ptar, actri, ptci, amtri, nombres = [], [], [], [], []
+    for i in range(instituciones):
+        sector = SECTORES[i % len(SECTORES)]
+        institucion = f"Instituto {i + 1} de {sector} de Tamaulipas"
+        siglas = f"I{i + 1}{sector[:3].upper()}"
+        nombres.append({"NOMBRE_SICOIN": institucion, "SECTOR_SICOIN": sector, "SECTOR_PEF": sector,
+                        "NOMBRE_PEF": institucion, "COINCIDE": "✅"})
+        for año in años:
+            base = {"Año": año, "Institución": institucion, "Sector": sector, "Siglas": siglas}
+            fila = {**base, **{c: azar.randint(0, 5) for c in COLUMNAS_RIESGO + COLUMNAS_CUADRANTE + COLUMNAS_ESTRATEGIA}}
+            fila.update({"AC_Total": acciones, "Riesgos_Totales": sum(fila[c] for c in COLUMNAS_CUADRANTE)}, **columnas_trimestrales(azar))
+            ptar.append(fila)
+            for a in range(acciones):
+                actri.append({**base, "Riesgo": f"R{a % 5}", "Descripción_del_Riesgo": f"Riesgo en el proceso de licitación {a % 5}",
+                              "AC": f"{a % 5 + 1}.{a}", "Descripcion": azar.choice(["Realizar la licitación pública del contrato",
+                                                                                    "Capacitar al personal en control interno",
+                                                                                    "Actualizar el manual de procedimientos"]) + f" {a}",
+                              "Avance_Institución": azar.choice([0, 25, 50, 75, 100]), "Avance_OIC": azar.choice([0, 25, 50, 75, 100])})
+            ptci.append({**base, "Cumplimiento_General_de_las_NGCI": azar.randint(40, 100), "Informe_Anual_Finalizado": "Sí",
+                         "SUBIO_ARCHIVO": "Sí", "Se_Actualizó_el_Programa": "Sí", "No_Se_Actualizó_el_Programa": "",
+                         "Acciones_de_Mejora_Programa_Original": acciones // 2,
+                         "TotalAcciones_de_Mejora_Programa_Actualizado": acciones // 2, **columnas_trimestrales(azar)})
+            for trimestre in (1, 2, 3, 4):
+                for a in range(acciones // 2):
+                    amtri.append({"Año": año, "Trimestre": trimestre, "Institución": institucion, "Sector": sector, "Siglas": siglas,
+                                  "Procesos": f"Proceso de adquisiciones {a}", "AM": f"AM{a}",
+                                  "Descripcion": f"Actualizar el manual de procedimientos {a}", "Fecha_Inicio": f"01/02/{año}",
+                                  "Fecha_Termino": f"30/11/{año}", "Avance_Institución": min(100, 25 * trimestre),
+                                  "Avance_OIC": min(100, 25 * trimestre), "¿Evaluado?": "Sí", "¿Favorable?": "Sí",
+                                  "¿AM_Congruete?": "Sí", "¿Contribuye?": "Sí", "Registradas": 1, "Localizadas": 1,
+                                  "No_localizadas": 0, "Suficientes": 1, "Parcielmente_Suficientes": 0, "Insuficientes": 0})
+    return {hoja: pd.DataFrame(filas) for hoja, filas in zip(fuentes_datos.HOJAS, [ptar, actri, ptci, amtri, nombres])}
+
+
+#============================================ GUION DE INTERACCIONES DE UNA SESIÓN ============================================================
+def selector(at, etiqueta):
+    return next(s for s in at.selectbox if s.label == etiqueta)
+
+def elegir(at, etiqueta, azar, excluir=()):
+    caja = selector(at, etiqueta)
+    opciones = [i for i, opcion in enumerate(caja.options) if opcion not in excluir]
+    if opciones:
+        caja.select_index(azar.choice(opciones))
+
+GUION = [
+    ("Cambiar institución", lambda at, azar: elegir(at, "Seleccione la Institución", azar)),
+    ("Elegir sector", lambda at, azar: elegir(at, "Seleccione el Sector", azar, excluir=("Todas",))),
+    ("Cambiar año", lambda at, azar: elegir(at, "Seleccione el Año", azar)),
+    ("Buscar texto", lambda at, azar: at.text_input(key="consulta_busqueda").input(azar.choice(CONSULTAS_BUSQUEDA))),
+    ("Volver a institución", lambda at, azar: selector(at, "Seleccione el Sector").select("Todas"))
+]
+
+def ejecutar_sesion(numero, repeticiones, resultados, candado):
+    from streamlit.testing.v1 import AppTest
+
+    azar = random.Random(numero)
+    at = AppTest.from_file(APP, default_timeout=TIEMPO_MAXIMO_RERUN)
+    pasos = [("Carga inicial", None)] + GUION * repeticiones
+    for paso, accion in pasos:
+        try:
+            if accion is not None:
+                accion(at, azar)
+            inicio = time.perf_counter()
+            at.run()
+            duracion = time.perf_counter() - inicio
+            error = at.exception[0].message if len(at.exception) else ""
+        except Exception as e:           # Widget ausente (p. ej. sin años para la selección) o rerun colgado
+            duracion, error = np.nan, f"{type(e).__name__}: {e}"
+        with candado:
+            resultados.append({"Sesión": numero, "Paso": paso, "Duración": duracion, "Error": error})
+
+
+#============================================ MEDICIÓN POR NIVEL DE CONCURRENCIA ============================================================
+def memoria_residente_mb():
+    # RSS actual desde /proc (Linux); en otros sistemas se usa el máximo que reporta getrusage
+    try:
+        with open("/proc/self/statm") as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return memoria_maxima_mb()
+
+def memoria_maxima_mb():
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / 1e6 if sys.platform == "darwin" else maximo / 1e3        # bytes en macOS, KB en Linux
+
+def medir_nivel(sesiones, repeticiones):
+    resultados, candado = [], threading.Lock()
+    hilos = [threading.Thread(target=ejecutar_sesion, args=(n, repeticiones, resultados, candado)) for n in range(sesiones)]
+    inicio, cpu_inicio = time.perf_counter(), time.process_time()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion, cpu = time.perf_counter() - inicio, time.process_time() - cpu_inicio
+
+    detalle = pd.DataFrame(resultados)
+    reruns = detalle["Duración"].dropna() * 1000
+    resumen = {
+        "Sesiones": sesiones,
+        "Reruns": len(reruns),
+        "Errores": int((detalle["Error"] != "").sum()),
+        "p50 (ms)": round(np.percentile(reruns, 50), 1) if len(reruns) else np.nan,
+        "p95 (ms)": round(np.percentile(reruns, 95), 1) if len(reruns) else np.nan,
+        "p99 (ms)": round(np.percentile(reruns, 99), 1) if len(reruns) else np.nan,
+        "Máximo (ms)": round(reruns.max(), 1) if len(reruns) else np.nan,
+        "Reruns/s": round(len(reruns) / duracion, 2),
+        "CPU (%)": round(cpu / duracion * 100, 1),
+        "RSS (MB)": round(memoria_residente_mb(), 1),
+        "RSS Máximo (MB)": round(memoria_maxima_mb(), 1)
+    }
+    return resumen, detalle.assign(Nivel=sesiones)
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la app con sesiones concurrentes simuladas (AppTest)")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 2, 4, 8], help="Niveles de concurrencia a medir")
+    parser.add_argument("--repeticiones", type=int, default=2, help="Veces que cada sesión repite el guion de interacciones")
+    parser.add_argument("--ruta", help="Carpeta local con las hojas (si se omite se generan datos sintéticos)")
+    parser.add_argument("--instituciones", type=int, default=30, help="Instituciones de los datos sintéticos")
+    parser.add_argument("--acciones", type=int, default=20, help="Acciones de control por institución y año (datos sintéticos)")
+    parser.add_argument("--sin-calentar", action="store_true", help="No ejecuta una sesión previa para llenar los cachés")
+    parser.add_argument("--csv", help="Archivo donde guardar la duración de cada rerun")
+    args = parser.parse_args(argumentos)
+
+    temporal = tempfile.TemporaryDirectory(prefix="sicoin_carga_")
+    ruta = args.ruta
+    if ruta is None:
+        ruta = os.path.join(temporal.name, "datos")
+        fuentes_datos.exportar_datos(datos_sinteticos(args.instituciones, acciones=args.acciones), ruta)
+        print(f"Datos sintéticos: {args.instituciones} instituciones en {ruta}")
+
+    # La app lee la fuente local (sin credenciales) y guarda su historial en la carpeta temporal
+    os.environ["SICOIN_FUENTE"] = "local"
+    os.environ["SICOIN_RUTA"] = ruta
+    os.environ["SICOIN_HISTORIAL"] = os.path.join(temporal.name, "historial")
+
+    if not args.sin_calentar:
+        resumen, _ = medir_nivel(1, 0)
+        print(f"Calentamiento (cachés vacíos): {resumen['Máximo (ms)']} ms")
+
+    resumenes, detalles = [], []
+    for sesiones in args.sesiones:
+        resumen, detalle = medir_nivel(sesiones, args.repeticiones)
+        resumenes.append(resumen)
+        detalles.append(detalle)
+        print(f"{sesiones} sesiones: p50 {resumen['p50 (ms)']} ms, p95 {resumen['p95 (ms)']} ms, errores {resumen['Errores']}", flush=True)
+
+    print()
+    print(pd.DataFrame(resumenes).to_string(index=False))
+    errores = pd.concat(detalles).query("Error != ''")
+    if not errores.empty:
+        print("\nErrores por paso:")
+        print(errores.groupby(["Paso", "Error"]).size().to_string())
+    if args.csv:
+        pd.concat(detalles).to_csv(args.csv, index=False)
+    temporal.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+
+import fuentes_datos
+import metricas
+import prueba_carga
+import refrescador
+
+###########################################################
+# PRUEBA DEL ENDPOINT /metrics (FORMATO DE TEXTO DE PROMETHEUS)
+###########################################################
+#
+# Genera métricas reales en este mismo proceso y las consulta por HTTP, como lo haría Prometheus:
+#
+#   1. refrescador.py --una-vez con una fuente local de datos sintéticos, una vez con éxito y otra con la fuente inexistente
+#      (series de descarga y de resultado del refresco; el archivo de --archivo-metricas y el código de salida)
+#   2. una ejecución de la app con AppTest y un cambio de institución (series de cachés, ejecuciones y pestañas)
+#   3. el servidor de metricas.py en un puerto libre: se lee /metrics y se revisa que cada serie esperada tenga sus líneas
+#      HELP y TYPE (con el tipo de DEFINICIONES), muestras con valores numéricos y, en los histogramas, las cubetas, _sum y _count
+#   4. un medidor que falla solo se avisa una vez en stderr aunque se consulte /metrics varias veces
+#
+#   python prueba_metricas.py
+#
+# Termina con código 1 si alguna comprobación falla.
+
+SERIES_REFRESCO = ["sicoin_descargas_total", "sicoin_descarga_segundos", "sicoin_descarga_filas", "sicoin_descarga_fallos_total",
+                   "sicoin_refresco_exito", "sicoin_refresco_marca_segundos"]
+SERIES_CACHE = ["sicoin_cache_consultas_total", "sicoin_cache_fallos_total"]
+SERIES_EJECUCION = ["sicoin_ejecucion_segundos", "sicoin_pestana_segundos"]
+MUESTRA = re.compile(r'^([a-z_]+)(\{[^}]*\})? (-?[0-9.e+-]+|NaN|[+-]Inf)$')
+
+
+#============================================ COMPROBACIONES ============================================================
+resultados = []
+
+def comprobar(nombre, correcto, detalle):
+    resultados.append(bool(correcto))
+    print(f"{'OK' if correcto else 'FALLA':6}{nombre}: {detalle}", flush=True)
+
+def escribir_secretos(carpeta, ruta_origen):
+    # refrescador.py lee .streamlit/secrets.toml del directorio actual
+    os.makedirs(os.path.join(carpeta, ".streamlit"), exist_ok=True)
+    with open(os.path.join(carpeta, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as archivo:
+        archivo.write(f'[fuente_datos]\ntipo = "compartido"\nruta = "{os.path.join(carpeta, "snapshot")}"\n\n'
+                      f'[refrescador]\ntipo = "local"\nruta = "{ruta_origen}"\n\n'
+                      f'[historial]\nruta = "{os.path.join(carpeta, "historial")}"\n\n'
+                      f'[alertas]\nruta = "{os.path.join(carpeta, "alertas")}"\n')
+
+def comprobar_refrescador(carpeta, ruta):
+    archivo = os.path.join(carpeta, "sicoin_refrescador.prom")
+    escribir_secretos(carpeta, ruta)
+    codigo = refrescador.main(["--una-vez", "--archivo-metricas", archivo])
+    with open(archivo, encoding="utf-8") as prom:
+        texto = prom.read()
+    comprobar("--una-vez correcto", codigo == 0 and "sicoin_refresco_exito 1" in texto and "sicoin_descargas_total 1" in texto,
+              f"código {codigo}; {archivo} con {len(texto.splitlines())} líneas")
+
+    escribir_secretos(carpeta, os.path.join(carpeta, "no_existe"))
+    try:
+        refrescador.main(["--una-vez", "--archivo-metricas", archivo])
+        error = None
+    except Exception as e:          # El error se propaga: python refrescador.py termina con código distinto de 0
+        error = e
+    with open(archivo, encoding="utf-8") as prom:
+        texto = prom.read()
+    comprobar("--una-vez con la fuente caída", error is not None and "sicoin_refresco_exito 0" in texto
+              and "sicoin_descarga_fallos_total 1" in texto,
+              f"error propagado: {type(error).__name__ if error else 'ninguno'}; el archivo registra el fallo")
+
+def comprobar_app(carpeta, ruta):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ.update(SICOIN_FUENTE="local", SICOIN_RUTA=ruta, SICOIN_HISTORIAL=os.path.join(carpeta, "historial_app"),
+                      SICOIN_ALERTAS=os.path.join(carpeta, "alertas_app"), SICOIN_PRECALENTAR="0", SICOIN_METRICAS_PUERTO="0",
+                      SICOIN_API_PUERTO="0")
+    at = AppTest.from_file(prueba_carga.APP, default_timeout=prueba_carga.TIEMPO_MAXIMO_RERUN)
+    at.run()
+    at.selectbox(key="institucion").select_index(1)
+    at.run()
+    comprobar("App (dos ejecuciones)", not at.exception, f"{len(at.exception)} excepciones")
+
+def consultar(url):
+    with urllib.request.urlopen(url, timeout=30) as respuesta:
+        return respuesta.status, respuesta.headers.get("Content-Type"), respuesta.read().decode("utf-8")
+
+def revisar_series(texto, series):
+    # Errores de las series esperadas: HELP y TYPE presentes y correctos, al menos una muestra y las partes de los histogramas
+    errores = []
+    lineas = texto.splitlines()
+    for nombre in series:
+        tipo, ayuda = metricas.DEFINICIONES[nombre]
+        if f"# HELP {nombre} {ayuda}" not in lineas:
+            errores.append(f"{nombre}: sin HELP")
+        if f"# TYPE {nombre} {tipo}" not in lineas:
+            errores.append(f"{nombre}: sin TYPE {tipo}")
+        muestras = [MUESTRA.match(linea) for linea in lineas if not linea.startswith("#")]
+        propias = [m.group(1) for m in muestras if m and (m.group(1) == nombre or m.group(1).startswith(nombre + "_"))]
+        if tipo == "histogram":
+            for sufijo in ("_bucket", "_sum", "_count"):
+                if nombre + sufijo not in propias:
+                    errores.append(f"{nombre}: sin {sufijo}")
+            if not any(linea.startswith(nombre + "_bucket") and 'le="+Inf"' in linea for linea in lineas):
+                errores.append(f"{nombre}: sin la cubeta +Inf")
+        elif nombre not in propias:
+            errores.append(f"{nombre}: sin muestras")
+    return errores
+
+def comprobar_endpoint():
+    servidor = metricas.iniciar_servidor(0)
+    url = f"http://127.0.0.1:{servidor.server_port}"
+    try:
+        estado, tipo, texto = consultar(f"{url}/metrics")
+        comprobar("GET /metrics", estado == 200 and tipo.startswith("text/plain; version=0.0.4"), f"{estado} {tipo}, {len(texto)} bytes")
+        invalidas = [linea for linea in texto.splitlines() if linea and not linea.startswith("# ") and not MUESTRA.match(linea)]
+        comprobar("Formato de las muestras", not invalidas, f"{len(texto.splitlines())} líneas; inválidas: {invalidas[:3]}")
+        for grupo, series in [("refresco", SERIES_REFRESCO), ("cachés", SERIES_CACHE), ("ejecuciones", SERIES_EJECUCION)]:
+            errores = revisar_series(texto, series)
+            comprobar(f"Series de {grupo}", not errores, "; ".join(errores) or f"HELP, TYPE y muestras de {', '.join(series)}")
+        try:
+            consultar(f"{url}/otra")
+            comprobar("Ruta desconocida", False, "respondió 200")
+        except urllib.error.HTTPError as e:
+            comprobar("Ruta desconocida", e.code == 404, f"{e.code}")
+
+        # Un medidor con error: las métricas se siguen exponiendo y el error se avisa una sola vez
+        def medidor_roto():
+            raise RuntimeError("medición no disponible")
+        metricas.registrar_medidor(medidor_roto)
+        errores = io.StringIO()
+        with contextlib.redirect_stderr(errores):
+            respuestas = [consultar(f"{url}/metrics")[0] for _ in range(3)]
+        avisos = errores.getvalue().count("Error en el medidor medidor_roto")
+        comprobar("Medidor con error", respuestas == [200] * 3 and avisos == 1, f"3 consultas, {avisos} aviso(s) en stderr")
+    finally:
+        servidor.shutdown()
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Revisa el endpoint /metrics (HELP/TYPE de las series de refresco, cachés y ejecuciones)")
+    parser.add_argument("--instituciones", type=int, default=6, help="Instituciones de los datos sintéticos")
+    args = parser.parse_args(argumentos)
+
+    temporal = tempfile.TemporaryDirectory(prefix="sicoin_metricas_")
+    ruta = os.path.join(temporal.name, "datos")
+    fuentes_datos.exportar_datos(prueba_carga.datos_sinteticos(args.instituciones, acciones=5), ruta)
+    directorio = os.getcwd()
+    os.chdir(temporal.name)
+    try:
+        comprobar_refrescador(temporal.name, ruta)
+        comprobar_app(temporal.name, ruta)
+        comprobar_endpoint()
+    finally:
+        os.chdir(directorio)
+        temporal.cleanup()
+
+    print(f"\n{sum(resultados)} de {len(resultados)} comprobaciones correctas")
+    return 0 if all(resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
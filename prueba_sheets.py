@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fuentes_datos
+import prueba_carga
+
+###########################################################
+# PRUEBA DEL CLIENTE DE SHEETS CONTRA UN SERVIDOR FALSO (429 / 5xx)
+###########################################################
+#
+# Levanta un servidor HTTP local (solo biblioteca estándar) que imita las APIs de Sheets y Drive que usa gspread para leer el
+# libro SICOIN_BASE (búsqueda del libro en Drive, metadatos, values y values:batchGet) más el endpoint de tokens de OAuth, y
+# que responde al azar con 429 / 500 / 503 en lugar de los datos. El cliente se dirige al servidor con url_api de
+# [fuente_datos] y una cuenta de servicio con llave generada en el momento, de modo que no se necesitan credenciales reales
+# ni se consume la cuota de Google. Se comprueba:
+#
+#   1. Carga completa con fallos inyectados: los reintentos la completan y los datos son idénticos a los de la fuente local
+#   2. Espera entre reintentos con jitter y acotada por ESPERA_BASE_SHEETS * 2^intento y ESPERA_MAXIMA_SHEETS
+#   3. Retry-After (en segundos y como fecha HTTP) se respeta, con el mismo tope ESPERA_MAXIMA_SHEETS
+#   4. Con fallos permanentes se agotan los reintentos y el error se propaga; un 404 no se reintenta
+#   5. La cubeta de fichas limita el ritmo de peticiones que recibe el servidor
+#   6. La app (AppTest) muestra los datos y, si después la descarga falla, sigue mostrando el último corte bueno con un aviso
+#
+#   python prueba_sheets.py
+#   python prueba_sheets.py --instituciones 30 --fallos 0.5 --sin-app
+#
+# Termina con código 1 si alguna comprobación falla.
+
+LIBRO_ID = "libro-prueba"
+ESPERA_BASE_PRUEBA = 0.05          # Esperas cortas para que la prueba dure segundos (se restauran al terminar)
+ESPERA_MAXIMA_PRUEBA = 0.4
+TOLERANCIA = 0.1                   # Segundos de holgura al medir esperas (planificador del sistema, hilos del servidor)
+
+
+#============================================ SERVIDOR FALSO DE SHEETS / DRIVE ============================================================
+def celdas_hojas(datos):
+    # Cada hoja como la devuelve la API de Sheets: lista de filas de textos, con los encabezados en la primera
+    return {hoja: [list(map(str, df.columns))] + [["" if v == "" else str(v) for v in fila] for fila in df.astype(object).values.tolist()]
+            for hoja, df in datos.items()}
+
+def recorte(celdas, a1):
+    # Rango A1 de la hoja (p. ej. "A1:D500", "H:H", "1:1") sin las celdas vacías del final, igual que la API
+    from gspread.utils import a1_range_to_grid_range
+
+    rango = a1_range_to_grid_range(a1)
+    filas = celdas[rango.get("startRowIndex", 0):rango.get("endRowIndex", len(celdas))]
+    filas = [fila[rango.get("startColumnIndex", 0):rango.get("endColumnIndex", len(fila))] for fila in filas]
+    filas = [fila[:max([i + 1 for i, c in enumerate(fila) if c != ""] or [0])] for fila in filas]
+    while filas and not filas[-1]:
+        filas.pop()
+    return filas
+
+def crear_estado(datos):
+    # fallos: probabilidad de responder con un error de codigos; retry_after: valor del encabezado en esas respuestas
+    return {"celdas": celdas_hojas(datos), "fallos": 0.0, "codigos": [429, 500, 503], "retry_after": None,
+            "peticiones": 0, "inyectados": 0, "marcas": [], "candado": threading.Lock()}
+
+def crear_manejador(estado):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def responder(self, codigo, cuerpo, encabezados=None):
+            contenido = json.dumps(cuerpo).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(contenido)))
+            for nombre, valor in (encabezados or {}).items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            self.wfile.write(contenido)
+
+        def do_POST(self):
+            # Endpoint de tokens de la cuenta de servicio (no inyecta fallos: solo se pide una vez por cliente)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/token":
+                return self.responder(404, {"error": {"code": 404, "message": self.path}})
+            self.responder(200, {"access_token": "token-prueba", "expires_in": 3600, "token_type": "Bearer"})
+
+        def do_GET(self):
+            with estado["candado"]:
+                estado["peticiones"] += 1
+                estado["marcas"].append(time.monotonic())
+                fallar = random.random() < estado["fallos"]
+                estado["inyectados"] += fallar
+            if fallar:
+                codigo = random.choice(estado["codigos"])
+                encabezados = {"Retry-After": str(estado["retry_after"])} if estado["retry_after"] is not None else None
+                return self.responder(codigo, {"error": {"code": codigo, "status": "RESOURCE_EXHAUSTED" if codigo == 429 else "UNAVAILABLE",
+                                                         "message": "Quota exceeded" if codigo == 429 else "Backend Error"}}, encabezados)
+
+            url = urllib.parse.urlparse(self.path)
+            consulta = urllib.parse.parse_qs(url.query)
+            celdas = estado["celdas"]
+            if url.path == "/drive/v3/files":
+                return self.responder(200, {"files": [{"id": LIBRO_ID, "name": fuentes_datos.LIBRO_PREDETERMINADO,
+                                                       "createdTime": "2026-01-01T00:00:00Z", "modifiedTime": "2026-01-01T00:00:00Z"}]})
+            if url.path == f"/v4/spreadsheets/{LIBRO_ID}":
+                return self.responder(200, {"spreadsheetId": LIBRO_ID, "properties": {"title": fuentes_datos.LIBRO_PREDETERMINADO}, "sheets": [
+                    {"properties": {"title": hoja, "sheetId": i, "index": i,
+                                    "gridProperties": {"rowCount": len(filas) + 20, "columnCount": len(filas[0])}}}
+                    for i, (hoja, filas) in enumerate(celdas.items())]})
+            if url.path == f"/v4/spreadsheets/{LIBRO_ID}/values:batchGet":
+                rangos = []
+                for rango in consulta["ranges"]:
+                    hoja, a1 = rango.rsplit("!", 1)
+                    rangos.append({"range": rango, "majorDimension": "ROWS", "values": recorte(celdas[hoja.strip("'")], a1)})
+                return self.responder(200, {"spreadsheetId": LIBRO_ID, "valueRanges": rangos})
+            coincidencia = re.fullmatch(f"/v4/spreadsheets/{LIBRO_ID}/values/(.+)", url.path)
+            if coincidencia:
+                rango = urllib.parse.unquote(coincidencia.group(1))
+                hoja, a1 = rango.rsplit("!", 1) if "!" in rango else (rango, "A:ZZ")
+                return self.responder(200, {"range": rango, "majorDimension": "ROWS", "values": recorte(celdas[hoja.strip("'")], a1)})
+            self.responder(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": self.path}})
+
+    return Manejador
+
+def iniciar_servidor(estado):
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), crear_manejador(estado))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+def credenciales_prueba(url):
+    # Cuenta de servicio con una llave RSA nueva; el token se pide al servidor falso
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    llave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = llave.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return {"type": "service_account", "project_id": "prueba", "private_key_id": "prueba", "private_key": pem,
+            "client_email": "prueba@prueba.iam.gserviceaccount.com", "client_id": "0", "token_uri": f"{url}/token"}
+
+
+#============================================ COMPROBACIONES ============================================================
+resultados = []
+
+def comprobar(nombre, correcto, detalle):
+    resultados.append(bool(correcto))
+    print(f"{'OK' if correcto else 'FALLA':6}{nombre}: {detalle}", flush=True)
+
+def reiniciar(estado, fallos=0.0, codigos=(429, 500, 503), retry_after=None):
+    with estado["candado"]:
+        estado.update(fallos=fallos, codigos=list(codigos), retry_after=retry_after, peticiones=0, inyectados=0, marcas=[])
+
+def cliente(url, credenciales, limitador, reintentos):
+    import gspread
+
+    clase = fuentes_datos.clase_cliente_http(limitador, reintentos, url)
+    return gspread.service_account_from_dict(credenciales, http_client=clase)
+
+def intervalos(estado):
+    marcas = sorted(estado["marcas"])
+    return [b - a for a, b in zip(marcas, marcas[1:])]
+
+def comprobar_carga(estado, url, credenciales, esperados, fallos):
+    reiniciar(estado, fallos)
+    fuentes_datos.clientes_sheets.clear()
+    config = {"tipo": "sheets", "url_api": url, "reintentos": 10, "peticiones_por_minuto": 6000, "filas_por_bloque": 200}
+    inicio = time.perf_counter()
+    datos = fuentes_datos.cargar_datos(config, credenciales)
+    segundos = time.perf_counter() - inicio
+    iguales = all(datos[hoja].equals(esperados[hoja]) for hoja in fuentes_datos.HOJAS)
+    comprobar("Carga con fallos inyectados", iguales and estado["inyectados"] > 0,
+              f"{estado['inyectados']} de {estado['peticiones']} respuestas fueron 429/5xx; datos idénticos a la fuente local: {iguales} "
+              f"({segundos:.1f} s)")
+
+def comprobar_espera():
+    # Distribución de espera_reintento: dentro de [0, tope] y repartida (jitter completo, media cercana a tope / 2)
+    muestras = 2000
+    for intento in range(8):
+        tope = min(fuentes_datos.ESPERA_MAXIMA_SHEETS, fuentes_datos.ESPERA_BASE_SHEETS * 2 ** intento)
+        esperas = [fuentes_datos.espera_reintento(intento) for _ in range(muestras)]
+        media = sum(esperas) / muestras
+        if not (max(esperas) <= tope and min(esperas) >= 0 and 0.4 * tope < media < 0.6 * tope and len(set(esperas)) > muestras * 0.9):
+            return comprobar("Espera con jitter acotada", False, f"intento {intento}: tope {tope}, media {media:.3f}, máximo {max(esperas):.3f}")
+    comprobar("Espera con jitter acotada", True, f"8 intentos x {muestras} muestras dentro de [0, min({ESPERA_MAXIMA_PRUEBA}, "
+              f"{ESPERA_BASE_PRUEBA} * 2^intento)] con media cercana a la mitad del tope")
+
+def comprobar_reintentos(estado, url, credenciales):
+    import gspread
+
+    # Fallos permanentes sin Retry-After: reintentos + 1 peticiones y cada espera dentro de su tope
+    reintentos = 5
+    gc = cliente(url, credenciales, fuentes_datos.crear_limitador(6000), reintentos)
+    reiniciar(estado, 1.0, [503])
+    try:
+        gc.open(fuentes_datos.LIBRO_PREDETERMINADO)
+        comprobar("Reintentos agotados", False, "la apertura no falló")
+    except gspread.exceptions.APIError as error:
+        esperas = intervalos(estado)
+        topes = [min(ESPERA_MAXIMA_PRUEBA, ESPERA_BASE_PRUEBA * 2 ** i) for i in range(reintentos)]
+        acotadas = all(espera <= tope + TOLERANCIA for espera, tope in zip(esperas, topes))
+        comprobar("Reintentos agotados", error.code == 503 and estado["peticiones"] == reintentos + 1 and acotadas,
+                  f"APIError {error.code} tras {estado['peticiones']} peticiones; esperas {[round(e, 2) for e in esperas]} "
+                  f"(topes {topes})")
+
+    # Un 404 no se reintenta
+    reiniciar(estado)
+    try:
+        gc.http_client.request("get", f"{url}/no/existe")
+        comprobar("404 sin reintentos", False, "la petición no falló")
+    except gspread.exceptions.APIError as error:
+        comprobar("404 sin reintentos", error.code == 404 and estado["peticiones"] == 1, f"{estado['peticiones']} petición(es)")
+
+def comprobar_retry_after(estado, url, credenciales):
+    import gspread
+
+    gc = cliente(url, credenciales, fuentes_datos.crear_limitador(6000), 1)
+    pruebas = [("Retry-After en segundos", "0.3", 0.3),
+               ("Retry-After como fecha HTTP", time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 2)), 0.4),
+               ("Retry-After mayor al tope", "3600", ESPERA_MAXIMA_PRUEBA)]
+    for nombre, valor, esperado in pruebas:
+        # Con el encabezado de fecha la espera queda en el tope (la fecha está a ~2 s y el tope es ESPERA_MAXIMA_PRUEBA)
+        reiniciar(estado, 1.0, [429], valor)
+        try:
+            gc.http_client.request("get", "https://www.googleapis.com/drive/v3/files")
+        except gspread.exceptions.APIError:
+            pass
+        espera = intervalos(estado)[0]
+        comprobar(nombre, esperado - 0.02 <= espera <= esperado + TOLERANCIA,
+                  f"Retry-After: {valor} -> espera de {espera:.2f} s (esperada {esperado} s; sin el encabezado sería "
+                  f"<= {ESPERA_BASE_PRUEBA} s)")
+
+def comprobar_limitador(estado, url, credenciales):
+    # 120 peticiones por minuto: ráfaga de hasta 120 y después una cada 0.5 s, aunque 8 hilos pidan a la vez
+    por_minuto, peticiones = 120, 130
+    limitador = fuentes_datos.crear_limitador(por_minuto)
+    gc = cliente(url, credenciales, limitador, 0)
+    reiniciar(estado)
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(8) as hilos:
+        list(hilos.map(lambda _: gc.http_client.request("get", "https://www.googleapis.com/drive/v3/files"), range(peticiones)))
+    segundos = time.monotonic() - inicio
+    esperado = (peticiones - por_minuto) * 60 / por_minuto
+    # Ritmo sostenido con el que llegan al servidor las peticiones posteriores a la ráfaga
+    tras_rafaga = sorted(estado["marcas"])[por_minuto:]
+    ritmo = (len(tras_rafaga) - 1) / (tras_rafaga[-1] - tras_rafaga[0])
+    comprobar("Cubeta de fichas", segundos >= esperado * 0.9 and ritmo <= por_minuto / 60 * 1.15,
+              f"{peticiones} peticiones en {segundos:.1f} s (mínimo esperado {esperado:.1f} s); después de la ráfaga llegan "
+              f"{ritmo:.2f} por segundo (límite {por_minuto / 60:.0f}); esperas del limitador {limitador['esperas']}")
+
+def comprobar_app(estado, url, credenciales, carpeta):
+    # Primera ejecución con el servidor sano (queda un corte en el historial); después se simula un proceso nuevo (cachés
+    # vacíos) con la cuota agotada: la página no se detiene y muestra el corte del historial con un aviso
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    for variable in ("SICOIN_FUENTE", "SICOIN_RUTA", "SICOIN_LIBRO"):
+        os.environ.pop(variable, None)
+    os.environ.update(SICOIN_HISTORIAL=os.path.join(carpeta, "historial"), SICOIN_ALERTAS=os.path.join(carpeta, "alertas"),
+                      SICOIN_PRECALENTAR="0", SICOIN_METRICAS_PUERTO="0", SICOIN_API_PUERTO="0")
+
+    def ejecutar():
+        at = AppTest.from_file(prueba_carga.APP, default_timeout=prueba_carga.TIEMPO_MAXIMO_RERUN)
+        at.secrets["fuente_datos"] = {"tipo": "sheets", "url_api": url, "reintentos": 2, "peticiones_por_minuto": 6000}
+        at.secrets["gcp_service_account"] = credenciales
+        at.run()
+        return at
+
+    reiniciar(estado)
+    fuentes_datos.clientes_sheets.clear()
+    sana = ejecutar()
+    instituciones = sana.selectbox[0].options if sana.selectbox else []
+    comprobar("App con la fuente disponible", not sana.exception and not sana.warning and instituciones,
+              f"{len(instituciones)} instituciones, {len(sana.exception)} excepciones")
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    fuentes_datos.clientes_sheets.clear()
+    reiniciar(estado, 1.0, [429])
+    caida = ejecutar()
+    avisos = [aviso.value for aviso in caida.warning if "No se pudo descargar" in aviso.value]
+    comprobar("App con la cuota agotada", not caida.exception and avisos and caida.selectbox and caida.selectbox[0].options == instituciones,
+              f"{estado['peticiones']} peticiones rechazadas; aviso: {avisos[0] if avisos else 'ninguno'}")
+
+
+#============================================ LÍNEA DE COMANDOS ============================================================
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Prueba del cliente de Sheets (reintentos, Retry-After, limitador y respaldo) contra un servidor falso")
+    parser.add_argument("--instituciones", type=int, default=10, help="Instituciones de los datos sintéticos que sirve el servidor")
+    parser.add_argument("--fallos", type=float, default=0.3, help="Proporción de respuestas 429/5xx durante la carga completa")
+    parser.add_argument("--sin-app", action="store_true", help="No ejecuta la comprobación con la app (AppTest)")
+    args = parser.parse_args(argumentos)
+
+    temporal = tempfile.TemporaryDirectory(prefix="sicoin_sheets_")
+    ruta = os.path.join(temporal.name, "datos")
+    fuentes_datos.exportar_datos(prueba_carga.datos_sinteticos(args.instituciones, acciones=5), ruta)
+    esperados = fuentes_datos.cargar_datos({"tipo": "local", "ruta": ruta})
+
+    estado = crear_estado(esperados)
+    servidor, url = iniciar_servidor(estado)
+    credenciales = credenciales_prueba(url)
+    print(f"Servidor falso en {url} ({args.instituciones} instituciones)")
+
+    originales = fuentes_datos.ESPERA_BASE_SHEETS, fuentes_datos.ESPERA_MAXIMA_SHEETS
+    fuentes_datos.ESPERA_BASE_SHEETS, fuentes_datos.ESPERA_MAXIMA_SHEETS = ESPERA_BASE_PRUEBA, ESPERA_MAXIMA_PRUEBA
+    try:
+        comprobar_carga(estado, url, credenciales, esperados, args.fallos)
+        comprobar_espera()
+        comprobar_reintentos(estado, url, credenciales)
+        comprobar_retry_after(estado, url, credenciales)
+        comprobar_limitador(estado, url, credenciales)
+        if not args.sin_app:
+            comprobar_app(estado, url, credenciales, temporal.name)
+    finally:
+        fuentes_datos.ESPERA_BASE_SHEETS, fuentes_datos.ESPERA_MAXIMA_SHEETS = originales
+        servidor.shutdown()
+        temporal.cleanup()
+
+    print(f"\n{sum(resultados)} de {len(resultados)} comprobaciones correctas")
+    return 0 if all(resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import argparse
+import sys
+import time
+
+import agregados
+import alertas
+import fuentes_datos
+import historial_datos
+import metricas
+
+###########################################################
+# REFRESCADOR DEL SNAPSHOT COMPARTIDO ENTRE PROCESOS DE STREAMLIT
+###########################################################
+#
+# Con varios procesos de Streamlit detrás de un balanceador, cada uno descargaba y guardaba su propia copia de las cinco hojas.
+# Este proceso es el único que descarga la fuente de origen: publica cada versión como archivos Arrow en la carpeta compartida
+# y cambia el puntero ACTUAL de forma atómica; los procesos de la app (tipo = "compartido") mapean esa versión en memoria.
+# Las hojas se publican ya limpias, de modo que los procesos no hacen copias privadas al limpiarlas.
+#
+#   [fuente_datos]            # lo que leen los procesos de Streamlit
+#   tipo = "compartido"
+#   ruta = "/srv/sicoin/snapshot"
+#
+#   [refrescador]             # fuente de origen que descarga el refrescador (mismas claves que [fuente_datos])
+#   tipo = "sheets"
+#   libro = "SICOIN_BASE"     # o libros = [...]: varios libros unidos en un solo snapshot (ver fuentes_datos.py)
+#   cada = 3600               # segundos entre descargas
+#
+#   python refrescador.py             -> descarga y publica cada "cada" segundos (proceso permanente)
+#   python refrescador.py --una-vez   -> una sola descarga (p. ej. desde cron)
+#
+# Con [refrescador] puerto_metricas (o --puerto-metricas) expone en ese puerto las métricas de sus descargas en formato de
+# Prometheus (duración, filas por hoja, fallos, resultado de la última ejecución y edad de la última versión publicada; ver
+# metricas.py).
+#
+# Con --una-vez no hay servidor de métricas (el proceso termina). Si la descarga falla el error se propaga y el proceso termina
+# con código distinto de 0, que es lo que debe vigilar cron o el temporizador de systemd. Con --archivo-metricas (o
+# [refrescador] archivo_metricas) se escriben además las métricas de esa ejecución, incluido sicoin_descarga_fallos_total,
+# sicoin_refresco_exito y sicoin_refresco_marca_segundos, en un archivo .prom para el textfile collector de node_exporter:
+#
+#   python refrescador.py --una-vez --archivo-metricas /var/lib/node_exporter/textfile/sicoin_refrescador.prom
+#
+# Como el refrescador ve todas las recargas, también es quien guarda los cortes del historial (historial_datos.py) y quien
+# publica las discrepancias nuevas y resueltas de cada recarga (alertas.py).
+
+INTERVALO_PREDETERMINADO = 3600
+ultima_publicacion = {"momento": None, "alertas": []}       # Para la métrica de edad de los datos publicados y el registro
+
+
+def refrescar(config_origen, credenciales, destino, historial=None, config_alertas=None):
+    inicio = time.perf_counter()
+    datos = fuentes_datos.cargar_datos(config_origen, credenciales)
+    metricas.registrar_descarga(datos, time.perf_counter() - inicio)
+    for hoja, columnas in fuentes_datos.columnas_faltantes(datos).items():
+        print(f"Aviso: faltan en {hoja} las columnas {', '.join(columnas)}", file=sys.stderr, flush=True)
+    # Las hojas se publican ya limpias (agregados.limpiar_hoja): los procesos de la app las usan sin copiarlas fuera del archivo
+    # mapeado. Las filas de encabezado repetidas que se eliminan ya no llegan a las reglas de calidad de la app, por eso se avisan aquí
+    limpios = {hoja: agregados.limpiar_hoja(df) for hoja, df in datos.items()}
+    for hoja, df in datos.items():
+        if len(limpios[hoja]) < len(df):
+            print(f"Aviso: se eliminaron {len(df) - len(limpios[hoja])} filas de encabezado repetidas en {hoja}", file=sys.stderr, flush=True)
+    version = fuentes_datos.escribir_compartido(limpios, destino)
+    id_corte = None
+    if historial and historial["activo"]:
+        id_corte = historial_datos.registrar_corte(datos, historial, config_origen["tipo"])
+    if config_alertas and config_alertas["activo"]:
+        # Solo se recalculan las instituciones y años que cambiaron desde el corte anterior (ver alertas.py)
+        ultima_publicacion["alertas"] = alertas.revisar(datos, config_alertas, historial if id_corte else None, id_corte)
+    ultima_publicacion["momento"] = time.time()
+    return version, time.perf_counter() - inicio
+
+
+def medir_refrescador():
+    if ultima_publicacion["momento"] is not None:
+        metricas.fijar("sicoin_datos_edad_segundos", round(time.time() - ultima_publicacion["momento"], 1))
+    metricas.medir_limitador_sheets()
+
+
+def registrar_resultado(exito):
+    if not exito:
+        metricas.contar("sicoin_descarga_fallos_total")
+    metricas.fijar("sicoin_refresco_exito", int(exito))
+    metricas.fijar("sicoin_refresco_marca_segundos", round(time.time()))
+
+def escribir_metricas_ejecucion(ruta):
+    # Solo con --una-vez: las métricas de esta ejecución para el textfile collector (ver el encabezado)
+    if ruta:
+        medir_refrescador()
+        metricas.escribir_archivo(ruta)
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Descarga la fuente del SICOIN y publica el snapshot compartido por los procesos de la app")
+    parser.add_argument("--destino", help="Carpeta del snapshot compartido (por defecto la ruta de [fuente_datos])")
+    parser.add_argument("--cada", type=int, help="Segundos entre descargas (por defecto [refrescador].cada o 3600)")
+    parser.add_argument("--una-vez", action="store_true", help="Publica una sola versión y termina")
+    parser.add_argument("--puerto-metricas", type=int, help="Puerto de las métricas de Prometheus (por defecto [refrescador].puerto_metricas; 0 las desactiva)")
+    parser.add_argument("--archivo-metricas", help="Con --una-vez: archivo .prom donde escribir las métricas de la ejecución (textfile collector)")
+    args = parser.parse_args(argumentos)
+
+    secretos = fuentes_datos.leer_secretos()
+    config_origen, credenciales = fuentes_datos.configuracion_fuente(secretos, "refrescador")
+    if config_origen["tipo"] == "compartido":
+        parser.error("La fuente de origen del refrescador no puede ser el propio snapshot compartido")
+    destino = args.destino or secretos.get("fuente_datos", {}).get("ruta")
+    if not destino:
+        parser.error("Indique --destino o la ruta de [fuente_datos] en los secrets")
+    cada = args.cada or int(config_origen.get("cada", INTERVALO_PREDETERMINADO))
+    historial = historial_datos.configuracion_historial(secretos)
+    config_alertas = alertas.configuracion_alertas(secretos)
+    puerto_metricas = args.puerto_metricas if args.puerto_metricas is not None else int(config_origen.get("puerto_metricas", 0))
+    if puerto_metricas and not args.una_vez:
+        metricas.registrar_medidor(medir_refrescador)
+        metricas.iniciar_servidor(puerto_metricas, secretos.get("metricas", {}).get("host", metricas.HOST_PREDETERMINADO))
+    archivo_metricas = args.archivo_metricas or config_origen.get("archivo_metricas")
+
+    while True:
+        try:
+            version, duracion = refrescar(config_origen, credenciales, destino, historial, config_alertas)
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - versión {version} publicada en {destino} ({duracion:.1f} s)", flush=True)
+            for hoja, estadisticas in fuentes_datos.estadisticas_carga.items():
+                print(f"    {hoja}: {estadisticas['Filas']} filas en {estadisticas['Bloques']} bloques ({estadisticas['Filas/s']} filas/s)", flush=True)
+            for libro, estadisticas in fuentes_datos.estadisticas_libros.items():
+                print(f"    libro {libro}: {'sin cambios, reutilizado' if estadisticas['Reutilizado'] else 'descargado'} ({estadisticas['Segundos']} s)", flush=True)
+            for evento in ultima_publicacion["alertas"]:
+                print(f"    alerta {evento['Evento'].lower()}: {evento['Revisión']} en {evento['Institución']} ({evento['Año']}): "
+                      f"{evento['Programadas']} programadas, {evento['Registradas']} registradas", flush=True)
+            registrar_resultado(True)
+        except Exception as e:
+            registrar_resultado(False)
+            if args.una_vez:
+                escribir_metricas_ejecucion(archivo_metricas)
+                raise
+            # Los procesos de la app siguen usando la última versión publicada
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - error al refrescar: {e}", file=sys.stderr, flush=True)
+        if args.una_vez:
+            escribir_metricas_ejecucion(archivo_metricas)
+            return 0
+        time.sleep(cada)
+
+
+if __name__ == "__main__":
+    sys.exit(main())